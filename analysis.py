@@ -0,0 +1,579 @@
+# -*- coding: utf-8 -*-
+"""
+Clustering and anomaly detection for Company Risk Analysis System
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import StandardScaler
+
+from anomaly_index import AnomalyIndex
+from instrumentation import stage
+from paging import page_of_rows
+from profiling import identify_binary_features
+
+# Bump when clustering output changes so stale cached results are not reused
+CLUSTER_RESULT_VERSION = 3
+
+CLUSTER_ENGINES = ('kmeans', 'minibatch', 'sample')
+# Groups up to this many rows get full-batch KMeans when the engine is 'auto',
+# larger ones are fitted on a sample
+FULL_KMEANS_MAX_ROWS = 50000
+# Rows used to fit the model with the 'sample' engine
+CLUSTER_SAMPLE_ROWS = 50000
+MINIBATCH_SIZE = 4096
+# ClusterModel.drift above which refitting a group is recommended
+CLUSTER_REFIT_DRIFT = 1.5
+# Rows sampled to compute the silhouette score in a k sweep
+SILHOUETTE_SAMPLE_ROWS = 5000
+# Columns converted to one float64 block at a time by the bulk anomaly scan
+ANOMALY_SCAN_BLOCK_COLUMNS = 64
+
+
+def _report(progress, fraction, message):
+    if progress is not None:
+        progress(fraction, message)
+
+
+def clustering_features(df):
+    """Return the non-binary numeric features used to cluster df"""
+    binary_features = identify_binary_features(df)
+    numeric_features = df.select_dtypes(include=[np.number]).columns.tolist()
+    return [col for col in numeric_features if col not in binary_features]
+
+
+def cluster_cache_key(dataset_key, group_name, n_clusters, engine='kmeans'):
+    """Return the result cache key for clustering a group
+
+    A group's rows, and so its clustering features, follow from the dataset
+    contents that dataset_key identifies, so the key can be built without
+    materializing the group.
+    """
+    parts = [CLUSTER_RESULT_VERSION, dataset_key, group_name, n_clusters, engine]
+    return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+
+def choose_engine(n_rows, engine='auto'):
+    """Resolve the clustering engine for a group of n_rows companies
+
+    'auto' uses full-batch KMeans up to FULL_KMEANS_MAX_ROWS rows and fits
+    on a sample above that, which keeps inertia within a fraction of a percent
+    of the full fit (benchmarks/bench_clustering.py).
+    """
+    if engine == 'auto':
+        return 'kmeans' if n_rows <= FULL_KMEANS_MAX_ROWS else 'sample'
+    if engine not in CLUSTER_ENGINES:
+        raise ValueError(f"Unknown clustering engine '{engine}', expected one of: auto, {', '.join(CLUSTER_ENGINES)}")
+    return engine
+
+
+def fit_clusters(scaled_data, n_clusters, engine='kmeans'):
+    """Fit a clustering model with the given engine
+
+    'kmeans' is full-batch KMeans, 'minibatch' fits MiniBatchKMeans on
+    MINIBATCH_SIZE-row batches and 'sample' fits KMeans on a random sample
+    of CLUSTER_SAMPLE_ROWS rows and then assigns every row to its nearest
+    center. Returns (model, labels).
+    """
+    with stage('kmeans_fit'):
+        if engine == 'minibatch':
+            model = MiniBatchKMeans(n_clusters=n_clusters, random_state=42,
+                                    batch_size=MINIBATCH_SIZE, n_init=3)
+            return model, model.fit_predict(scaled_data)
+        model = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        if engine == 'sample' and len(scaled_data) > CLUSTER_SAMPLE_ROWS:
+            rng = np.random.default_rng(42)
+            sample = rng.choice(len(scaled_data), CLUSTER_SAMPLE_ROWS, replace=False)
+            model.fit(scaled_data[np.sort(sample)])
+            return model, model.predict(scaled_data)
+        return model, model.fit_predict(scaled_data)
+
+
+def scale_features(df, features):
+    """Impute missing values with column means and standardize the features
+
+    Returns (scaler, scaled_data).
+    """
+    with stage('scaling'):
+        clustering_data = df[features].fillna(df[features].mean())
+        scaler = StandardScaler()
+        return scaler, scaler.fit_transform(clustering_data)
+
+
+@dataclass
+class ClusterModel:
+    """A fitted group clustering and the cluster of every row it has labelled
+
+    labels follows the group's rows in dataset order. The first fitted_rows
+    rows were used to fit the scaler and model; rows appended to the dataset
+    later are assigned to the nearest existing center by assign(), without
+    refitting.
+    """
+    group_name: str
+    n_clusters: int
+    engine: str
+    features: list
+    scaler: StandardScaler
+    model: object
+    labels: np.ndarray
+    fitted_rows: int
+    # Mean squared distance of the fitted rows to their centers (scaled units)
+    fitted_distance: float
+    # Sum of squared distances of the assigned rows to their centers
+    assigned_distance: float = 0.0
+
+    @property
+    def assigned_rows(self):
+        return len(self.labels) - self.fitted_rows
+
+    @property
+    def cluster_centers(self):
+        """Cluster centers in the original feature units"""
+        return self.scaler.inverse_transform(self.model.cluster_centers_)
+
+    @property
+    def drift(self):
+        """Mean squared distance of assigned rows relative to fitted rows, or None if none were assigned
+
+        Values well above 1 mean the appended companies fit the clusters
+        worse than the ones they were fitted on, and the group should be refit.
+        """
+        if not self.assigned_rows or not self.fitted_distance:
+            return None
+        return (self.assigned_distance / self.assigned_rows) / self.fitted_distance
+
+    def describe(self):
+        """JSON-ready summary of the model, stored as its metadata"""
+        return {
+            'group_name': self.group_name,
+            'n_clusters': self.n_clusters,
+            'engine': self.engine,
+            'features': self.features,
+            'fitted_rows': self.fitted_rows,
+            'assigned_rows': self.assigned_rows,
+            'drift': self.drift
+        }
+
+    def assign(self, df):
+        """Return this model extended with the rows of df, appended to the group"""
+        if len(df) == 0:
+            return self
+        # Missing values get the fitted (imputed) means, as in scale_features()
+        data = df[self.features].fillna(pd.Series(self.scaler.mean_, index=self.features))
+        scaled_data = self.scaler.transform(data)
+        labels = self.model.predict(scaled_data)
+        distance = float(((scaled_data - self.model.cluster_centers_[labels]) ** 2).sum())
+        return replace(self, labels=np.concatenate([self.labels, labels]),
+                       assigned_distance=self.assigned_distance + distance)
+
+
+def cluster_model_key(group_name, n_clusters, engine):
+    """Key of a group's stored ClusterModel within its dataset"""
+    return f'{group_name}.k{n_clusters}.{engine}'
+
+
+def resolve_engine(group_name, n_rows, n_clusters, engine='auto', models=None):
+    """Resolve the clustering engine for a group, keeping the engine of its stored model
+
+    'auto' resolves as in choose_engine(), unless models only hold a model
+    of this group and number of clusters for another engine; that engine is
+    then kept, so a group that grew past FULL_KMEANS_MAX_ROWS through
+    appends keeps its stored clusters until it is refit.
+    """
+    chosen = choose_engine(n_rows, engine)
+    if engine != 'auto' or models is None:
+        return chosen
+    stored = set(models.keys())
+    if cluster_model_key(group_name, n_clusters, chosen) in stored:
+        return chosen
+    for candidate in CLUSTER_ENGINES:
+        if cluster_model_key(group_name, n_clusters, candidate) in stored:
+            return candidate
+    return chosen
+
+
+def fit_cluster_model(df, group_name, n_clusters=3, features=None, engine='auto', progress=None):
+    """Fit a ClusterModel for a group, or return None if it has too few features
+
+    progress(fraction, message), if given, is called between stages.
+    features, if given, is the already selected non-binary feature list.
+    engine is 'auto' or one of CLUSTER_ENGINES, see choose_engine().
+    """
+    engine = choose_engine(len(df), engine)
+    # Select only non-binary features for clustering
+    _report(progress, 0.1, 'Selecting features')
+    non_binary_features = features if features is not None else clustering_features(df)
+
+    if len(non_binary_features) < 2:
+        return None
+
+    # Prepare data for clustering
+    _report(progress, 0.2, 'Scaling features')
+    scaler, scaled_data = scale_features(df, non_binary_features)
+
+    # Perform clustering
+    _report(progress, 0.3, f'Fitting clusters ({engine})')
+    model, labels = fit_clusters(scaled_data, min(n_clusters, len(scaled_data)), engine)
+    distance = ((scaled_data - model.cluster_centers_[labels]) ** 2).sum(axis=1).mean()
+
+    return ClusterModel(group_name, n_clusters, engine, non_binary_features, scaler, model,
+                        labels, len(labels), float(distance))
+
+
+def group_cluster_model(group_data, group_name, n_clusters=3, engine='auto', models=None, refit=False,
+                        features=None, progress=None):
+    """Return the ClusterModel of a group, or None if it cannot be clustered
+
+    With models (a dataset's ClusterModels), a model stored for the same
+    group, number of clusters and engine is reused unless refit is set;
+    a newly fitted model is stored.
+    """
+    engine = choose_engine(len(group_data), engine)
+    key = cluster_model_key(group_name, n_clusters, engine)
+    if models is not None and not refit:
+        model = models.get(key)
+        if model is not None:
+            return model
+    model = fit_cluster_model(group_data, group_name, n_clusters, features, engine, progress)
+    if model is not None and models is not None:
+        models.put(key, model)
+    return model
+
+
+def cluster_companies(df, group_name, n_clusters=3, progress=None, features=None, engine='auto'):
+    """Cluster companies within a group based on non-binary features"""
+    model = fit_cluster_model(df, group_name, n_clusters, features, engine, progress)
+    if model is None:
+        return None, None, "Not enough non-binary numeric features for clustering"
+
+    # Add cluster labels to dataframe
+    _report(progress, 0.9, 'Summarizing clusters')
+    df_with_clusters = df.copy()
+    df_with_clusters['cluster'] = model.labels
+
+    return df_with_clusters, model.cluster_centers, model.features
+
+
+def assign_appended_rows(models, groups, first_new_row):
+    """Assign rows appended to a dataset to the stored clusters of their group
+
+    models maps keys to the ClusterModels of the dataset before the append;
+    groups are the completeness groups after it, where rows from position
+    first_new_row on are new. Returns the extended models by key.
+    """
+    extended = {}
+    for key, model in models.items():
+        if model.group_name not in groups:
+            continue
+        positions = groups[model.group_name].positions
+        new_positions = positions[positions >= first_new_row]
+        extended[key] = model.assign(groups.materialize(model.group_name, new_positions))
+    return extended
+
+
+def cached_cluster_group_result(cache, dataset_key, group_name, group_rows, n_clusters=3, engine='auto',
+                                models=None):
+    """Return a memoized cluster_group_result() for a group of group_rows companies, or None
+
+    models, the dataset's ClusterModels, resolve 'auto' as resolve_engine() does.
+    """
+    engine = resolve_engine(group_name, group_rows, n_clusters, engine, models)
+    result = cache.get(cluster_cache_key(dataset_key, group_name, n_clusters, engine))
+    if result is not None:
+        result = dict(result, cached=True)
+    return result
+
+
+def cluster_model_result(group_data, model):
+    """Build the /cluster_group response from a group's ClusterModel
+
+    assigned_companies counts companies appended since the fit and drift
+    compares how well they fit their clusters (see ClusterModel.drift).
+    """
+    index = group_data.index
+    cluster_summary = []
+    for cluster_id in range(len(model.model.cluster_centers_)):
+        members = np.flatnonzero(model.labels == cluster_id)
+        cluster_summary.append({
+            'cluster_id': cluster_id,
+            'company_count': len(members),
+            'companies': index[members].tolist()
+        })
+
+    drift = model.drift
+    return {
+        'success': True,
+        'group_name': model.group_name,
+        'total_companies': len(group_data),
+        'engine': model.engine,
+        'features_used': model.features,
+        'cluster_summary': cluster_summary,
+        'cluster_centers': model.cluster_centers.tolist(),
+        'assigned_companies': model.assigned_rows,
+        'drift': drift,
+        'refit_recommended': drift is not None and drift > CLUSTER_REFIT_DRIFT
+    }
+
+
+def cluster_group_result(group_data, group_name, n_clusters=3, progress=None, cache=None,
+                         dataset_key=None, engine='auto', models=None, refit=False):
+    """Cluster one completeness group and build the /cluster_group response
+
+    With a cache and dataset_key, results are memoized by dataset, group,
+    number of clusters and engine, so repeating a request
+    skips the scaler and KMeans fits. With models, the group's stored
+    ClusterModel is used if there is one, and 'auto' keeps its engine (see
+    resolve_engine()). refit ignores both and fits again with the engine
+    'auto' picks for the group's current size.
+    """
+    engine = resolve_engine(group_name, len(group_data), n_clusters, engine, None if refit else models)
+    use_cache = cache is not None and dataset_key is not None
+    if use_cache and not refit:
+        cached = cached_cluster_group_result(cache, dataset_key, group_name, len(group_data), n_clusters, engine)
+        if cached is not None:
+            return cached
+
+    model = group_cluster_model(group_data, group_name, n_clusters, engine, models=models, refit=refit,
+                                features=clustering_features(group_data), progress=progress)
+    if model is None:
+        return {'error': 'Not enough non-binary numeric features for clustering'}
+
+    # Prepare data for visualization
+    _report(progress, 0.9, 'Summarizing clusters')
+    result = cluster_model_result(group_data, model)
+    if use_cache:
+        cache.put(cluster_cache_key(dataset_key, group_name, n_clusters, engine), result)
+    return result
+
+
+def _sweep_fit(scaled_data, n_clusters, engine, silhouette_sample):
+    model, labels = fit_clusters(scaled_data, n_clusters, engine)
+    # Inertia over all rows, so sampled and mini-batch fits compare with full ones
+    inertia = float(((scaled_data - model.cluster_centers_[labels]) ** 2).sum())
+    silhouette = None
+    sample_labels = labels[silhouette_sample]
+    if 1 < len(np.unique(sample_labels)) < len(sample_labels):
+        silhouette = float(silhouette_score(scaled_data[silhouette_sample], sample_labels))
+    return {
+        'n_clusters': n_clusters,
+        'inertia': inertia,
+        'silhouette': silhouette,
+        'labels': labels.tolist()
+    }
+
+
+def cluster_sweep_result(group_data, group_name, k_values, engine='auto', n_jobs=None, progress=None):
+    """Cluster one group for several cluster counts and build the /cluster_sweep response
+
+    Features are selected, imputed and scaled once; the fits for the
+    different k values then run in parallel across n_jobs processes (all
+    cores when None). Each entry reports inertia over all rows, the
+    silhouette score on a shared sample of SILHOUETTE_SAMPLE_ROWS rows and the
+    cluster label of every company, in the order of 'companies'.
+    """
+    engine = choose_engine(len(group_data), engine)
+    _report(progress, 0.05, 'Selecting features')
+    features = clustering_features(group_data)
+    if len(features) < 2:
+        return {'error': 'Not enough non-binary numeric features for clustering'}
+
+    k_values = sorted({k for k in k_values if 1 <= k <= len(group_data)})
+    if not k_values:
+        return {'error': 'No valid number of clusters requested'}
+
+    _report(progress, 0.1, 'Scaling features')
+    _, scaled_data = scale_features(group_data, features)
+
+    # Every k is scored on the same rows so silhouettes are comparable
+    silhouette_sample = np.arange(len(scaled_data))
+    if len(scaled_data) > SILHOUETTE_SAMPLE_ROWS:
+        rng = np.random.default_rng(42)
+        silhouette_sample = np.sort(rng.choice(len(scaled_data), SILHOUETTE_SAMPLE_ROWS, replace=False))
+
+    _report(progress, 0.2, f'Fitting {len(k_values)} cluster counts ({engine})')
+    fits = Parallel(n_jobs=n_jobs or -1, return_as='generator')(
+        delayed(_sweep_fit)(scaled_data, k, engine, silhouette_sample) for k in k_values)
+    sweep = []
+    for fit in fits:
+        sweep.append(fit)
+        _report(progress, 0.2 + 0.8 * len(sweep) / len(k_values), f'Fitted k={fit["n_clusters"]}')
+
+    return {
+        'success': True,
+        'group_name': group_name,
+        'total_companies': len(group_data),
+        'engine': engine,
+        'features_used': features,
+        'companies': group_data.index.tolist(),
+        'results': sweep
+    }
+
+
+def detect_anomalies(df, feature_name):
+    """Detect anomalies for a specific feature using IQR method"""
+    if feature_name not in df.columns:
+        return None
+
+    feature_data = df[feature_name].dropna()
+    if len(feature_data) == 0:
+        return None
+
+    Q1 = feature_data.quantile(0.25)
+    Q3 = feature_data.quantile(0.75)
+    IQR = Q3 - Q1
+
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+
+    anomalies = df[
+        (df[feature_name] < lower_bound) |
+        (df[feature_name] > upper_bound)
+    ]
+
+    return {
+        'anomalies': anomalies,
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound,
+        'Q1': Q1,
+        'Q3': Q3,
+        'IQR': IQR
+    }
+
+
+def anomaly_result(df, feature_name, progress=None, multiplier=1.5, index=None, page=None):
+    """Detect anomalies for one feature and build the /detect_anomalies response
+
+    Bounds and counts come from the feature's sorted values in an
+    AnomalyIndex (a temporary one for df unless index is given), so
+    repeating the request or changing the multiplier only costs a binary
+    search plus collecting the anomalous rows. With a PageRequest only that
+    page of anomalous rows, projected to its columns, is returned; 'page'
+    then describes it (company index labels, offset and next_offset).
+    """
+    _report(progress, 0.1, 'Looking up feature bounds')
+    if index is None:
+        index = AnomalyIndex(df)
+    with stage('quantiles'):
+        feature = index.feature(feature_name)
+        if feature is None or feature.non_null_count == 0:
+            return {'error': f'Feature {feature_name} not found or has no data'}
+        statistics = feature.bounds(multiplier)
+
+    positions = feature.outlier_positions(statistics['lower_bound'], statistics['upper_bound'])
+
+    # Prepare anomaly data for response
+    _report(progress, 0.8, 'Collecting anomalies')
+    try:
+        rows = page_of_rows(df, page, positions)
+    except ValueError as e:
+        return {'error': str(e)}
+    return {
+        'feature_name': feature_name,
+        'multiplier': multiplier,
+        'anomaly_count': len(positions),
+        'total_records': feature.non_null_count,
+        'anomaly_percentage': (len(positions) / feature.non_null_count) * 100,
+        'statistics': statistics,
+        'anomalies': rows.pop('rows'),
+        'page': rows
+    }
+
+
+def scan_anomalies(df, features, multiplier=1.5):
+    """Flag IQR outliers in every feature at once
+
+    Quartiles are computed with one quantile call per block of
+    ANOMALY_SCAN_BLOCK_COLUMNS columns and the bounds are applied to the
+    whole block as a matrix. Returns (bounds, rows, cols): bounds is a
+    DataFrame indexed by feature with Q1, Q3, IQR, lower_bound, upper_bound,
+    non_null_count and anomaly_count; rows and cols are the row and feature
+    positions of every outlier, i.e. a sparse companies x features matrix.
+    """
+    bounds = []
+    rows = []
+    cols = []
+    for start in range(0, len(features), ANOMALY_SCAN_BLOCK_COLUMNS):
+        block_features = features[start:start + ANOMALY_SCAN_BLOCK_COLUMNS]
+        block = df[block_features]
+        with stage('quantiles'):
+            quartiles = block.quantile([0.25, 0.75]).to_numpy(dtype=np.float64)
+        q1, q3 = quartiles
+        iqr = q3 - q1
+        lower = q1 - multiplier * iqr
+        upper = q3 + multiplier * iqr
+
+        values = block.to_numpy(dtype=np.float64)
+        # NaN compares False on both sides, so missing values are never outliers
+        outliers = (values < lower) | (values > upper)
+        block_rows, block_cols = np.nonzero(outliers)
+        rows.append(block_rows)
+        cols.append(block_cols + start)
+        bounds.append(pd.DataFrame({
+            'Q1': q1,
+            'Q3': q3,
+            'IQR': iqr,
+            'lower_bound': lower,
+            'upper_bound': upper,
+            'non_null_count': (~np.isnan(values)).sum(axis=0),
+            'anomaly_count': outliers.sum(axis=0)
+        }, index=block_features))
+
+    if not bounds:
+        empty = np.array([], dtype=np.intp)
+        return pd.DataFrame(columns=['Q1', 'Q3', 'IQR', 'lower_bound', 'upper_bound',
+                                     'non_null_count', 'anomaly_count']), empty, empty
+    return pd.concat(bounds), np.concatenate(rows), np.concatenate(cols)
+
+
+def anomaly_scan_result(df, features, multiplier=1.5, progress=None):
+    """Scan all features for anomalies and build the /anomaly_scan response
+
+    The outlier matrix is returned in coordinate form: entry i says that
+    company outliers['companies'][i] is an outlier in feature
+    features[outliers['features'][i]]. company_counts lists every flagged
+    company with its number of outlying features, most flagged first.
+    """
+    _report(progress, 0.1, f'Scanning {len(features)} features')
+    bounds, rows, cols = scan_anomalies(df, features, multiplier)
+
+    _report(progress, 0.8, 'Counting outliers per company')
+    counts = np.bincount(rows, minlength=len(df))
+    flagged = np.flatnonzero(counts)
+    # Stable sort keeps companies with equal counts in dataset order
+    flagged = flagged[np.argsort(-counts[flagged], kind='stable')]
+    index = df.index
+
+    return {
+        'multiplier': multiplier,
+        'total_companies': len(df),
+        'flagged_companies': len(flagged),
+        'total_outliers': len(rows),
+        'features': list(features),
+        'statistics': {
+            feature: {
+                'Q1': float(stats['Q1']),
+                'Q3': float(stats['Q3']),
+                'IQR': float(stats['IQR']),
+                'lower_bound': float(stats['lower_bound']),
+                'upper_bound': float(stats['upper_bound']),
+                'non_null_count': int(stats['non_null_count']),
+                'anomaly_count': int(stats['anomaly_count'])
+            }
+            for feature, stats in bounds.iterrows()
+        },
+        'outliers': {
+            'companies': index[rows].tolist(),
+            'features': cols.tolist()
+        },
+        'company_counts': [
+            {'company': company, 'outlier_count': int(count)}
+            for company, count in zip(index[flagged].tolist(), counts[flagged])
+        ]
+    }
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Per-feature anomaly bound index for Company Risk Analysis System
+"""
+
+import os
+import threading
+
+import numpy as np
+
+
+def _lerp(a, b, t):
+    # Same formula as NumPy's linear quantile interpolation, so results match
+    # Series.quantile() exactly rather than to within rounding
+    diff = b - a
+    return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
+class FeatureIndex:
+    """Sorted non-null values of one feature and the rows they come from
+
+    values is ascending and positions[i] is the row position holding
+    values[i], so the rows outside any pair of bounds are two slices of
+    positions found by binary search.
+    """
+
+    def __init__(self, values, positions):
+        self.values = values
+        self.positions = positions
+
+    @property
+    def non_null_count(self):
+        return len(self.values)
+
+    def descending_positions(self):
+        """Row positions by descending value, equal values still in row order
+
+        That is the order a stable descending sort gives; plainly reversing
+        positions would also reverse the rows within each run of ties.
+        """
+        n = len(self.values)
+        if n == 0:
+            return np.asarray(self.positions)
+        values = np.asarray(self.values)
+        starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+        lengths = np.diff(np.append(starts, n))
+        # The runs of equal values in reverse order, each run kept as it is
+        starts, lengths = starts[::-1], lengths[::-1]
+        offsets = np.cumsum(lengths) - lengths
+        return np.asarray(self.positions)[np.arange(n) + np.repeat(starts - offsets, lengths)]
+
+    def quantile(self, q):
+        """Linearly interpolated quantile, as Series.quantile() computes it"""
+        n = len(self.values)
+        if n == 0:
+            return np.nan
+        virtual = q * (n - 1)
+        previous = int(np.floor(virtual))
+        following = min(previous + 1, n - 1)
+        return float(_lerp(self.values[previous], self.values[following], virtual - previous))
+
+    def bounds(self, multiplier=1.5):
+        """Return the IQR statistics and outlier bounds for this multiplier"""
+        q1 = self.quantile(0.25)
+        q3 = self.quantile(0.75)
+        iqr = q3 - q1
+        return {
+            'Q1': q1,
+            'Q3': q3,
+            'IQR': iqr,
+            'lower_bound': q1 - multiplier * iqr,
+            'upper_bound': q3 + multiplier * iqr
+        }
+
+    def outlier_slices(self, lower_bound, upper_bound):
+        """Return (below, above): counts of values < lower and > upper bound"""
+        below = int(np.searchsorted(self.values, lower_bound, side='left'))
+        above = len(self.values) - int(np.searchsorted(self.values, upper_bound, side='right'))
+        return below, above
+
+    def outlier_positions(self, lower_bound, upper_bound):
+        """Row positions of values outside the bounds, in dataset order"""
+        below, above = self.outlier_slices(lower_bound, upper_bound)
+        positions = np.concatenate([self.positions[:below], self.positions[len(self.positions) - above:]])
+        positions.sort()
+        return positions
+
+
+class AnomalyIndex:
+    """Lazily built FeatureIndex for every numeric column of a dataset
+
+    A feature is sorted the first time it is looked up; after that its IQR
+    statistics, non-null count and outlier counts for any multiplier are
+    answered from the sorted array without touching the column again. With
+    index_dir, built features are saved as .npy files and memory-mapped, so
+    every process opening the same dataset shares them.
+    """
+
+    def __init__(self, df, index_dir=None):
+        self.df = df
+        self.index_dir = index_dir
+        self._features = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, feature_name):
+        return feature_name in self.df.columns and self.df[feature_name].dtype.kind in 'iuf'
+
+    def _paths(self, feature_name):
+        # Files are named by column position since labels need not be valid file names
+        position = self.df.columns.get_loc(feature_name)
+        return (os.path.join(self.index_dir, f'{position}.values.npy'),
+                os.path.join(self.index_dir, f'{position}.positions.npy'))
+
+    def _build(self, feature_name):
+        values = self.df[feature_name].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = np.flatnonzero(~np.isnan(values))
+        order = np.argsort(values[valid], kind='stable')
+        positions = valid[order]
+        if len(values) < 2 ** 31:
+            positions = positions.astype(np.int32)
+        return FeatureIndex(values[positions], positions)
+
+    def _load_or_build(self, feature_name):
+        if self.index_dir is None:
+            return self._build(feature_name)
+        values_path, positions_path = self._paths(feature_name)
+        try:
+            return FeatureIndex(np.load(values_path, mmap_mode='r'), np.load(positions_path, mmap_mode='r'))
+        except (FileNotFoundError, ValueError, OSError):
+            pass
+        feature = self._build(feature_name)
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            for path, array in ((values_path, feature.values), (positions_path, feature.positions)):
+                tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+                np.save(tmp_path, array)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not save anomaly index for {feature_name}: {e}")
+        return feature
+
+    def feature(self, feature_name):
+        """Return the FeatureIndex for a numeric column, or None"""
+        if feature_name not in self:
+            return None
+        with self._lock:
+            feature = self._features.get(feature_name)
+        if feature is None:
+            feature = self._load_or_build(feature_name)
+            with self._lock:
+                self._features[feature_name] = feature
+        return feature
@@ -1,64 +1,213 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g, has_request_context
 import pandas as pd
-import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+import pyarrow as pa
 from sklearn.decomposition import PCA
 import plotly.graph_objs as go
 import plotly.utils
 import json
 import os
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import get_input_stream
 import tempfile
 import shutil
+import cProfile
+import time
+import tracemalloc
 from translations import get_text, get_language_name
+from data_cache import ParsedFileCache, ResultCache, file_digest, sheet_digest
+from profiling import PROFILE_MODES, FrameSketch, build_dataset_profile
+from completeness import analyze_data_completeness, append_completeness_groups
+from ingestion import (EXCEL_ENGINES, UploadStream, append_rows, load_csv_chunked, optimize_dtypes,
+                       read_excel_sheets, sniff_file_format)
+from dataset_store import DatasetStore
+from analysis import (CLUSTER_ENGINES, anomaly_result, anomaly_scan_result, assign_appended_rows,
+                      cached_cluster_group_result, cluster_group_result, cluster_sweep_result)
+from export import EXPORT_FORMATS, DatasetLabels, stream_export
+from instrumentation import begin_request, dump_profile, end_request, metrics, server_timing_header, stage
+from jobs import JobRunner, ProgressStore
+from model_store import ModelStore
+from paging import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, PageRequest, page_of_rows
+from responses import ARROW_STREAM_MIMETYPE, DataJSONProvider, arrow_response, compress_response
+from tasks import anomaly_scan_task, cluster_group_task, cluster_sweep_task, detect_anomalies_task
 
 app = Flask(__name__)
+app.json = DataJSONProvider(app)
 app.secret_key = 'your-secret-key-here'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['STREAM_UPLOAD_MAX_BYTES'] = 1024 * 1024 * 1024  # 1GB max CSV parsed from the request stream
+app.config['PARSE_CACHE_MAX_BYTES'] = 1024 * 1024 * 1024  # 1GB of cached parsed uploads
+app.config['CSV_CHUNK_ROWS'] = 100000  # rows per block when reading large CSV files
+app.config['CSV_CHUNKED_MIN_BYTES'] = 8 * 1024 * 1024  # CSV files from this size are read in chunks
+app.config['OUT_OF_CORE_MIN_BYTES'] = 256 * 1024 * 1024  # CSV files from this size are streamed into the store; None disables
+app.config['COLUMNAR_BLOCK_BYTES'] = 16 * 1024 * 1024  # CSV bytes per Arrow batch when streaming
+app.config['EXCEL_SHEET_WORKERS'] = None  # processes parsing workbook sheets in parallel; None uses all cores
+app.config['OPTIMIZE_DTYPES'] = True  # downcast numerics and encode text columns at load time
+app.config['PROFILE_MODE'] = 'auto'  # 'exact', 'approximate' (sketches) or 'auto' (approximate for large datasets)
+app.config['APPROXIMATE_PROFILE_MIN_ROWS'] = 1000000  # 'auto' profiles datasets from this many rows approximately
+app.config['APPROXIMATE_PROFILE_MIN_BYTES'] = 64 * 1024 * 1024  # 'auto' sketches chunked CSV files from this size as they are read
+app.config['EXACT_PROFILE_QUARTILES'] = False  # exact quartiles in 'exact' profiles (about a quarter slower)
+app.config['DATASET_STORE_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.datasets')
+app.config['DATASET_STORE_MAX_BYTES'] = 4 * 1024 * 1024 * 1024  # 4GB of stored datasets
+app.config['CLUSTER_ENGINE'] = 'auto'  # 'auto' fits KMeans on all rows or on a sample by group size
+app.config['CLUSTER_SWEEP_MAX_K'] = 20  # largest number of clusters a k sweep may request
+app.config['CLUSTER_SWEEP_JOBS'] = None  # processes fitting k values in parallel; None uses all cores
+app.config['CLUSTER_CACHE_MAX_BYTES'] = 256 * 1024 * 1024  # 256MB of memoized clustering results
+app.config['EXPORT_CHUNK_ROWS'] = 64 * 1024  # rows written per Arrow batch / Parquet row group
+app.config['RESPONSE_COMPRESS_MIN_BYTES'] = 64 * 1024  # gzip/brotli responses from this size
+app.config['MODEL_STORE_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.models')
+app.config['MODEL_STORE_MAX_BYTES'] = 512 * 1024 * 1024  # 512MB of fitted models and dataset profiles
+app.config['JOB_STATE_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.jobs')
+app.config['LOAD_PROGRESS_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.load_progress')
+app.config['JOB_WORKERS'] = None  # background analysis processes; None uses one per CPU
+app.config['TRACE_STAGE_MEMORY'] = False  # record peak memory per stage with tracemalloc (slows allocations)
+app.config['PROFILE_SLOW_REQUESTS_SECONDS'] = None  # cProfile requests and keep dumps of those at least this slow
+app.config['PROFILE_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.profiles')
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Global variable to store the current dataset
-current_data = None
-data_groups = None
+if app.config['TRACE_STAGE_MEMORY'] and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+# Columnar cache of parsed uploads, keyed by file content hash
+parse_cache = ParsedFileCache(os.path.join(app.config['UPLOAD_FOLDER'], '.parse_cache'),
+                              app.config['PARSE_CACHE_MAX_BYTES'])
+
+# Datasets are stored on disk and shared by all worker processes; each
+# session only keeps the ID of the dataset it uploaded
+# Fitted models and dataset profiles, versioned and keyed by file contents, so
+# they survive restarts and re-uploads and are only loaded when first needed
+model_store = ModelStore(app.config['MODEL_STORE_FOLDER'], app.config['MODEL_STORE_MAX_BYTES'])
+
+dataset_store = DatasetStore(app.config['DATASET_STORE_FOLDER'],
+                             app.config['DATASET_STORE_MAX_BYTES'], model_store=model_store)
+
+# Clustering results memoized by dataset, group, number of clusters and features
+cluster_cache = ResultCache(os.path.join(app.config['UPLOAD_FOLDER'], '.cluster_cache'),
+                            app.config['CLUSTER_CACHE_MAX_BYTES'])
+
+# Clustering and anomaly detection can run as background jobs in a process
+# pool; job state lives on disk so every web worker can report on it
+job_runner = JobRunner(app.config['JOB_STATE_FOLDER'], app.config['JOB_WORKERS'])
+
+# Progress of file loads by the upload_id the upload page sends, kept on disk
+# like job state so it can be polled through any web worker
+load_progress = ProgressStore(app.config['LOAD_PROGRESS_FOLDER'])
+
+def get_current_dataset():
+    """Return the dataset loaded in this session, or None"""
+    return dataset_store.get(session.get('dataset_id'))
+
+def requested_cluster_engine():
+    """Clustering engine from the 'engine' query parameter, or None if invalid"""
+    engine = request.args.get('engine', app.config['CLUSTER_ENGINE'])
+    return engine if engine == 'auto' or engine in CLUSTER_ENGINES else None
+
+def requested_refit():
+    """Whether the request asks to refit clusters instead of reusing the stored model"""
+    return request.args.get('refit', '').lower() in ('1', 'true', 'yes')
+
+def requested_k_values():
+    """Cluster counts for a k sweep from the query string, or None if invalid
+    
+    Either an explicit list (?k=2,3,5) or a range (?k_min=2&k_max=10, the default).
+    """
+    try:
+        if 'k' in request.args:
+            k_values = [int(k) for k in request.args['k'].split(',') if k.strip()]
+        else:
+            k_min = request.args.get('k_min', 2, type=int)
+            k_max = request.args.get('k_max', 10, type=int)
+            k_values = list(range(k_min, k_max + 1))
+    except ValueError:
+        return None
+    if not k_values or min(k_values) < 1 or max(k_values) > app.config['CLUSTER_SWEEP_MAX_K']:
+        return None
+    return k_values
+
+def wants_arrow():
+    """Whether the client asked for an Arrow IPC stream instead of JSON"""
+    return (request.args.get('format') == 'arrow'
+            or request.accept_mimetypes.best_match(['application/json', ARROW_STREAM_MIMETYPE]) == ARROW_STREAM_MIMETYPE)
+
+def requested_page(allow_arrow=True):
+    """Rows and columns to return, from the offset, limit, columns, sort, order and layout query parameters
+    
+    layout=columns returns rows column-oriented; Arrow clients get the page as a frame.
+    """
+    columns = request.args.get('columns')
+    layout = 'columns' if request.args.get('layout') == 'columns' else 'records'
+    if allow_arrow and wants_arrow():
+        layout = 'frame'
+    return PageRequest(
+        offset=max(request.args.get('offset', 0, type=int), 0),
+        limit=min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE),
+        columns=[col for col in columns.split(',') if col] if columns else None,
+        sort_by=request.args.get('sort') or None,
+        descending=request.args.get('order', 'asc') == 'desc',
+        layout=layout
+    )
+
+def requested_sheets():
+    """Workbook sheets to load from the upload form: a list of names, '*' for all, or None for the first"""
+    sheets = request.form.get('sheets', '').strip()
+    if sheets == '*':
+        return sheets
+    return [name.strip() for name in sheets.split(',') if name.strip()] or None
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'xlsx', 'xls', 'csv'}
 
-def load_data(file_path):
-    """Load data from Excel or CSV file"""
+def validate_data(df):
+    """Basic validation of a loaded dataset"""
+    if df.empty:
+        print("Error: File contains no data")
+        return False
+        
+    if len(df.columns) < 2:
+        print("Error: File must contain at least 2 columns (companies and features)")
+        return False
+    
+    return True
+
+def load_data(file_path, use_cache=True, digest=None, sheet_names=None, file_format=None, on_sheets=None):
+    """Load data from Excel or CSV file, reusing a cached parse when available
+    
+    The format is taken from the file's leading bytes, unless the caller
+    already sniffed it as file_format. For workbooks, sheet_names selects
+    the sheets to read (default the first, '*' for all); several sheets are
+    parsed in parallel and concatenated. on_sheets, if given, is called with
+    every sheet name of a workbook that is parsed.
+    """
     try:
-        if file_path.endswith('.xlsx'):
-            # Try different Excel engines for better compatibility
-            try:
-                df = pd.read_excel(file_path, engine='openpyxl')
-            except Exception as e1:
-                try:
-                    df = pd.read_excel(file_path, engine='xlrd')
-                except Exception as e2:
-                    # Last resort: try without specifying engine
-                    df = pd.read_excel(file_path)
-        elif file_path.endswith('.xls'):
-            # Handle older Excel format
-            df = pd.read_excel(file_path, engine='xlrd')
-        else:
-            # Handle CSV files
-            df = pd.read_csv(file_path)
+        cache_key = None
+        if use_cache and parse_cache.enabled:
+            cache_key = sheet_digest(digest or file_digest(file_path), sheet_names)
+            df = parse_cache.get(cache_key)
+            if df is not None:
+                print(f"Loaded cached data: {len(df)} rows, {len(df.columns)} columns")
+                return df
+
+        file_format = file_format or sniff_file_format(file_path)
+        with stage('parse'):
+            if file_format in EXCEL_ENGINES:
+                df, available = read_excel_sheets(file_path, sheet_names, app.config['EXCEL_SHEET_WORKERS'],
+                                                  file_format)
+                if on_sheets is not None:
+                    on_sheets(available)
+            else:
+                # Handle CSV files
+                df = pd.read_csv(file_path)
         
-        # Basic data validation
-        if df.empty:
-            print("Error: File contains no data")
-            return None
-            
-        if len(df.columns) < 2:
-            print("Error: File must contain at least 2 columns (companies and features)")
+        if not validate_data(df):
             return None
             
         print(f"Successfully loaded data: {len(df)} rows, {len(df.columns)} columns")
+        if cache_key is not None:
+            parse_cache.put(cache_key, df)
         return df
         
     except Exception as e:
@@ -67,124 +216,331 @@ def load_data(file_path):
         print(f"File extension: {file_path.split('.')[-1] if '.' in file_path else 'unknown'}")
         return None
 
-def analyze_data_completeness(df):
-    """Analyze data completeness and group companies by available features"""
-    # Calculate completeness for each company (row)
-    completeness = df.notna().sum(axis=1)
-    total_features = len(df.columns)
-    completeness_percentage = (completeness / total_features) * 100
-    
-    # Create a copy of dataframe with completeness info
-    df_with_completeness = df.copy()
-    df_with_completeness['completeness_percentage'] = completeness_percentage
-    df_with_completeness['missing_features'] = total_features - completeness
-    
-    # Group companies by completeness
-    groups = {}
-    
-    # Group 1: Companies with all features (100% complete)
-    complete_companies = df_with_completeness[df_with_completeness['completeness_percentage'] == 100]
-    if not complete_companies.empty:
-        groups['complete'] = complete_companies
-    
-    # Group 2: Companies with high completeness (80-99%)
-    high_completeness = df_with_completeness[
-        (df_with_completeness['completeness_percentage'] >= 80) & 
-        (df_with_completeness['completeness_percentage'] < 100)
-    ]
-    if not high_completeness.empty:
-        groups['high_completeness'] = high_completeness
-    
-    # Group 3: Companies with medium completeness (50-79%)
-    medium_completeness = df_with_completeness[
-        (df_with_completeness['completeness_percentage'] >= 50) & 
-        (df_with_completeness['completeness_percentage'] < 80)
-    ]
-    if not medium_completeness.empty:
-        groups['medium_completeness'] = medium_completeness
-    
-    # Group 4: Companies with low completeness (<50%)
-    low_completeness = df_with_completeness[df_with_completeness['completeness_percentage'] < 50]
-    if not low_completeness.empty:
-        groups['low_completeness'] = low_completeness
-    
-    return groups, df_with_completeness
-
-def identify_binary_features(df):
-    """Identify binary features in the dataset"""
-    binary_features = []
-    for col in df.columns:
-        if df[col].dtype in ['object', 'string']:
-            unique_values = df[col].dropna().unique()
-            if len(unique_values) <= 2:
-                binary_features.append(col)
-        elif df[col].dtype in ['int64', 'float64']:
-            unique_values = df[col].dropna().unique()
-            if len(unique_values) <= 2:
-                binary_features.append(col)
-    return binary_features
-
-def cluster_companies(df, group_name, n_clusters=3):
-    """Cluster companies within a group based on non-binary features"""
-    # Identify binary features
-    binary_features = identify_binary_features(df)
-    
-    # Select only non-binary features for clustering
-    numeric_features = df.select_dtypes(include=[np.number]).columns.tolist()
-    non_binary_features = [col for col in numeric_features if col not in binary_features]
-    
-    if len(non_binary_features) < 2:
-        return None, "Not enough non-binary numeric features for clustering"
-    
-    # Prepare data for clustering
-    clustering_data = df[non_binary_features].fillna(df[non_binary_features].mean())
-    
-    # Standardize the data
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(clustering_data)
-    
-    # Perform clustering
-    kmeans = KMeans(n_clusters=min(n_clusters, len(clustering_data)), random_state=42)
-    cluster_labels = kmeans.fit_predict(scaled_data)
-    
-    # Add cluster labels to dataframe
-    df_with_clusters = df.copy()
-    df_with_clusters['cluster'] = cluster_labels
-    
-    # Calculate cluster centers
-    cluster_centers = scaler.inverse_transform(kmeans.cluster_centers_)
-    
-    return df_with_clusters, cluster_centers, non_binary_features
-
-def detect_anomalies(df, feature_name):
-    """Detect anomalies for a specific feature using IQR method"""
-    if feature_name not in df.columns:
+def format_bytes(size):
+    """Size in KB, MB or GB with one decimal"""
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1024
+        if size < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}'
+
+def upload_id():
+    """ID the upload page gave the file loaded in this request (?upload_id=), or None"""
+    return request.args.get('upload_id') if has_request_context() else None
+
+def start_load_progress():
+    """Reset the progress reported for the upload being loaded in this request"""
+    load_progress.start(upload_id())
+
+def set_load_status(status):
+    """Record the status ('loading', 'done' or 'error') of the upload being loaded"""
+    load_progress.update(upload_id(), status=status)
+
+def update_load_progress(rows_read, bytes_read, total_bytes):
+    """Record chunked loading progress for the upload page"""
+    load_progress.update(upload_id(), status='loading', rows_read=rows_read, bytes_read=bytes_read,
+                         total_bytes=total_bytes,
+                         percent=(bytes_read / total_bytes) * 100 if total_bytes else None)
+    print(f"Loaded {rows_read} rows ({bytes_read}/{total_bytes or '?'} bytes)")
+
+def compact_frame(df):
+    """Apply the OPTIMIZE_DTYPES setting; returns (df, memory_report or None)"""
+    if not app.config['OPTIMIZE_DTYPES']:
+        return df, None
+    with stage('dtype_optimization'):
+        return optimize_dtypes(df)
+
+def profile_mode(rows):
+    """Profile mode ('exact' or 'approximate') for a dataset of this many rows"""
+    mode = app.config['PROFILE_MODE']
+    if mode == 'auto':
+        return 'approximate' if rows >= app.config['APPROXIMATE_PROFILE_MIN_ROWS'] else 'exact'
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"PROFILE_MODE must be 'auto' or one of: {', '.join(PROFILE_MODES)}")
+    return mode
+
+def chunk_sketch(total_bytes):
+    """FrameSketch to fill while a CSV file of total_bytes is read in chunks, or None
+    
+    'auto' cannot know the row count before reading, so it sketches files of
+    APPROXIMATE_PROFILE_MIN_BYTES or more; if such a file turns out to have
+    fewer than APPROXIMATE_PROFILE_MIN_ROWS rows the sketch goes unused, and
+    a smaller file with more rows is sketched in a second pass over the frame.
+    """
+    mode = app.config['PROFILE_MODE']
+    if mode == 'approximate' or (mode == 'auto' and total_bytes is not None
+                                 and total_bytes >= app.config['APPROXIMATE_PROFILE_MIN_BYTES']):
+        return FrameSketch()
+    return None
+
+def load_and_group_data(file_path, digest=None, sheet_names=None, file_format=None, on_sheets=None):
+    """Load a data file and group its companies by completeness
+    
+    Large CSV files are read in chunks and grouped while they are parsed;
+    everything else goes through load_data() and analyze_data_completeness().
+    With OPTIMIZE_DTYPES enabled, columns are compacted before grouping.
+    digest, if already computed, is the file's content hash; sheet_names,
+    file_format and on_sheets are as for load_data().
+    Returns (df, groups, completeness_percentage, memory_report, sketch), or
+    None if loading failed; memory_report is None when no optimization ran
+    and sketch is the FrameSketch filled while reading chunks, if any.
+    """
+    memory_report = None
+    
+    def prepare(df):
+        nonlocal memory_report
+        df, memory_report = compact_frame(df)
+        return df
+    
+    chunk_rows = app.config['CSV_CHUNK_ROWS']
+    file_format = file_format or sniff_file_format(file_path)
+    if (chunk_rows and file_format == 'csv'
+            and os.path.getsize(file_path) >= app.config['CSV_CHUNKED_MIN_BYTES']):
+        start_load_progress()
+        sketch = chunk_sketch(os.path.getsize(file_path))
+        try:
+            # Rows are grouped by completeness as they are parsed, so this is one stage
+            with stage('parse'):
+                df, groups, completeness_percentage = load_csv_chunked(
+                    file_path, chunk_rows, on_progress=update_load_progress, prepare=prepare, sketch=sketch)
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            print(f"File path: {file_path}")
+            set_load_status('error')
+            return None
+        if not validate_data(df):
+            set_load_status('error')
+            return None
+        set_load_status('done')
+        print(f"Successfully loaded data: {len(df)} rows, {len(df.columns)} columns")
+        return df, groups, completeness_percentage, memory_report, sketch
+    
+    df = load_data(file_path, digest=digest, sheet_names=sheet_names, file_format=file_format, on_sheets=on_sheets)
+    if df is None:
         return None
+    df = prepare(df)
+    groups, completeness_percentage = analyze_data_completeness(df)
+    return df, groups, completeness_percentage, memory_report, None
+
+def stored_dataset_profile(df, completeness_percentage, memory_report, digest, loader='pandas', sketch=None):
+    """Profile of an uploaded file, reused from the model store when the same file was profiled before
     
-    feature_data = df[feature_name].dropna()
-    if len(feature_data) == 0:
+    sketch, a FrameSketch of df's rows filled while they were read, saves a
+    pass over the data when the profile is approximate.
+    """
+    mode = profile_mode(len(df))
+    # The profile also depends on how the file was loaded and profiled, so that is part of the match
+    settings = {'optimize_dtypes': app.config['OPTIMIZE_DTYPES'], 'loader': loader,
+                'rows': len(df), 'columns': len(df.columns), 'profile_mode': mode,
+                'exact_quartiles': app.config['EXACT_PROFILE_QUARTILES']}
+    for metadata in reversed(model_store.versions(digest, 'profile')):
+        if metadata.get('settings') == settings:
+            dataset_profile = model_store.load(digest, 'profile', metadata['version'])
+            if dataset_profile is not None:
+                print(f"Reusing stored profile version {metadata['version']}")
+                return dataset_profile
+    if mode == 'exact':
+        sketch = None
+    dataset_profile = build_dataset_profile(df, completeness_percentage, memory_report, mode, sketch,
+                                            quantiles=app.config['EXACT_PROFILE_QUARTILES'])
+    model_store.save(digest, 'profile', dataset_profile, {'settings': settings})
+    return dataset_profile
+
+def is_out_of_core_file(file_path, file_format=None):
+    """Whether a file is loaded by streaming it into the dataset store"""
+    min_bytes = app.config['OUT_OF_CORE_MIN_BYTES']
+    return (min_bytes is not None and os.path.getsize(file_path) >= min_bytes
+            and (file_format or sniff_file_format(file_path)) == 'csv')
+
+def load_out_of_core(file_path, digest):
+    """Stream a CSV file into the dataset store, grouping and profiling it without a DataFrame copy
+    
+    Returns the stored dataset, or None when a numeric column turns to text
+    part way through and the file has to be loaded with pandas instead.
+    """
+    start_load_progress()
+    
+    def build_profile(df, completeness_percentage):
+        return stored_dataset_profile(df, completeness_percentage, None, digest, loader='columnar')
+    
+    try:
+        # Parsing, grouping and storing are interleaved batch by batch
+        dataset = dataset_store.create_from_csv(file_path, build_profile, digest,
+                                                app.config['COLUMNAR_BLOCK_BYTES'], update_load_progress)
+    except pa.ArrowInvalid as e:
+        print(f"Streaming load failed, loading with pandas instead: {e}")
         return None
+    except ValueError:
+        set_load_status('error')
+        raise
+    set_load_status('done')
+    print(f"Successfully loaded data: {len(dataset.df)} rows, {len(dataset.df.columns)} columns")
+    return dataset
+
+def load_upload_stream(stream):
+    """Parse a CSV upload while it is received and store it as a dataset
     
-    Q1 = feature_data.quantile(0.25)
-    Q3 = feature_data.quantile(0.75)
-    IQR = Q3 - Q1
-    
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    
-    anomalies = df[
-        (df[feature_name] < lower_bound) | 
-        (df[feature_name] > upper_bound)
-    ]
-    
-    return {
-        'anomalies': anomalies,
-        'lower_bound': lower_bound,
-        'upper_bound': upper_bound,
-        'Q1': Q1,
-        'Q3': Q3,
-        'IQR': IQR
-    }
+    stream is an UploadStream over the request body. Bodies of
+    OUT_OF_CORE_MIN_BYTES or more are streamed into the dataset store
+    through Arrow (see load_stream_out_of_core()), smaller ones are read in
+    CSV_CHUNK_ROWS blocks without being written to uploads/; either way the
+    body is hashed as it is read.
+    Raises ValueError (which includes pandas and Arrow parse errors) for
+    files that cannot be loaded.
+    """
+    start_load_progress()
+    min_bytes = app.config['OUT_OF_CORE_MIN_BYTES']
+    try:
+        if min_bytes is not None and stream.total_bytes is not None and stream.total_bytes >= min_bytes:
+            dataset = load_stream_out_of_core(stream)
+        else:
+            memory_report = None
+            
+            def prepare(df):
+                nonlocal memory_report
+                df, memory_report = compact_frame(df)
+                return df
+            
+            sketch = chunk_sketch(stream.total_bytes)
+            with stage('parse'):
+                df, groups, completeness_percentage = load_csv_chunked(
+                    stream, app.config['CSV_CHUNK_ROWS'] or 100000, on_progress=update_load_progress, prepare=prepare,
+                    sketch=sketch)
+            if not validate_data(df):
+                raise ValueError('File must contain data rows and at least 2 columns')
+            digest = stream.hexdigest()
+            dataset_profile = stored_dataset_profile(df, completeness_percentage, memory_report, digest, sketch=sketch)
+            dataset = dataset_store.create(df, groups, dataset_profile, digest)
+    except Exception:
+        set_load_status('error')
+        raise
+    set_load_status('done')
+    print(f"Successfully loaded data: {len(dataset.df)} rows, {len(dataset.df.columns)} columns")
+    return dataset
+
+def load_stream_out_of_core(stream):
+    """Stream a CSV upload into the dataset store through Arrow, falling back to pandas
+    
+    The body is copied to a spool file in uploads/ as it is read. If a
+    numeric column turns to text part way through, the rest of the body is spooled
+    and the file is loaded with pandas, as for a form upload of the same
+    file. The spool file is removed either way.
+    """
+    spool = tempfile.NamedTemporaryFile(dir=app.config['UPLOAD_FOLDER'], suffix='.csv', delete=False)
+    stream.spool = spool
+    try:
+        def build_profile(df, completeness_percentage):
+            return stored_dataset_profile(df, completeness_percentage, None, stream.hexdigest(), loader='columnar')
+        
+        try:
+            return dataset_store.create_from_csv(stream, build_profile, stream.hexdigest,
+                                                 app.config['COLUMNAR_BLOCK_BYTES'], update_load_progress)
+        except pa.ArrowInvalid as e:
+            print(f"Streaming load failed, loading with pandas instead: {e}")
+        digest = stream.hexdigest()
+        spool.close()
+        loaded = load_and_group_data(spool.name, digest, file_format='csv')
+        if loaded is None:
+            raise ValueError('File could not be parsed as CSV')
+        df, groups, completeness_percentage, memory_report, sketch = loaded
+        dataset_profile = stored_dataset_profile(df, completeness_percentage, memory_report, digest, sketch=sketch)
+        return dataset_store.create(df, groups, dataset_profile, digest)
+    finally:
+        stream.spool = None
+        spool.close()
+        os.remove(spool.name)
+
+def append_to_dataset(dataset, rows):
+    """Append rows to a stored dataset and return the resulting new dataset
+    
+    Only the new rows are counted for completeness, and every stored cluster
+    model assigns the new rows of its group to its existing clusters, so the
+    groups are not refit until asked to.
+    """
+    df, memory_report = compact_frame(append_rows(dataset.df, rows))
+    groups, completeness_percentage = append_completeness_groups(dataset.groups, df)
+    models = assign_appended_rows(dict(dataset.cluster_models.items()), groups, len(dataset.df))
+    dataset_profile = build_dataset_profile(df, completeness_percentage, memory_report, profile_mode(len(df)),
+                                            quantiles=app.config['EXACT_PROFILE_QUARTILES'])
+    appended = dataset_store.create(df, groups, dataset_profile)
+    for key, model in models.items():
+        appended.cluster_models.put(key, model)
+    return appended
+
+def append_upload(file_path, filename, digest, sheet_names=None, file_format=None):
+    """Append an uploaded file's companies to the current dataset"""
+    dataset = get_current_dataset()
+    if dataset is None:
+        flash('No data loaded to append to. Please upload a full file first.')
+        os.remove(file_path)
+        return redirect(request.url)
+    
+    rows = load_data(file_path, digest=digest, sheet_names=sheet_names, file_format=file_format)
+    if rows is None:
+        flash('Error loading data from file. Please check the file format and try again.')
+        os.remove(file_path)
+        return redirect(request.url)
+    try:
+        appended = append_to_dataset(dataset, rows)
+    except ValueError as e:
+        flash(f'Could not append {filename}: {e}')
+        os.remove(file_path)
+        return redirect(request.url)
+    
+    session['dataset_id'] = appended.dataset_id
+    flash(f'Appended {len(rows)} companies from {filename}; the dataset now has {len(appended.df)} companies.')
+    return redirect(url_for('analysis'))
+
+@app.before_request
+def start_request_metrics():
+    """Start timing the request, and profiling it when slow requests are profiled"""
+    g.request_started = time.perf_counter()
+    g.request_stages_token = begin_request()
+    g.profiler = None
+    if app.config['PROFILE_SLOW_REQUESTS_SECONDS'] is not None:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record the request's duration and stages, and keep its profile if it was slow
+    
+    Registered before the compression hook so that it runs after it and the
+    duration includes compression. Stage durations are also returned in a
+    Server-Timing header.
+    """
+    token = g.pop('request_stages_token', None)
+    if token is None:
+        return response
+    seconds = time.perf_counter() - g.request_started
+    stages = end_request(token)
+    metrics.request_seconds.observe(seconds, endpoint=request.endpoint or 'unknown',
+                                    method=request.method, status=response.status_code)
+    if stages:
+        response.headers['Server-Timing'] = server_timing_header(stages)
+    
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        if seconds >= app.config['PROFILE_SLOW_REQUESTS_SECONDS']:
+            path = dump_profile(profiler, app.config['PROFILE_FOLDER'], request.endpoint, seconds)
+            print(f"Slow request {request.method} {request.path} took {seconds:.2f}s, profile saved to {path}")
+    return response
+
+@app.teardown_request
+def stop_request_metrics(exc):
+    """Stop collecting stages and profiling when a request failed before its response was built"""
+    token = g.pop('request_stages_token', None)
+    if token is not None:
+        end_request(token)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+@app.after_request
+def compress_large_responses(response):
+    """Compress large JSON and Arrow responses for clients that accept it"""
+    return compress_response(response, request.headers.get('Accept-Encoding'),
+                             app.config['RESPONSE_COMPRESS_MIN_BYTES'])
 
 @app.before_request
 def before_request():
@@ -208,7 +564,6 @@ def change_language(lang):
 @app.route('/upload', methods=['GET', 'POST'])
 def upload():
     """Data upload page"""
-    global current_data, data_groups
     lang = session.get('lang', 'en')
     
     if request.method == 'POST':
@@ -225,15 +580,38 @@ def upload():
             try:
                 filename = secure_filename(file.filename)
                 file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
+                with stage('file_save'):
+                    file.save(file_path)
                 
-                # Load and analyze data
-                df = load_data(file_path)
-                if df is not None:
-                    current_data = df
-                    data_groups, _ = analyze_data_completeness(df)
+                # Load and analyze data; the content digest keys the parse and result caches
+                sheet_names = requested_sheets()
+                digest = file_digest(file_path)
+                file_format = sniff_file_format(file_path)
+                if request.form.get('mode') == 'append':
+                    return append_upload(file_path, filename, digest, sheet_names, file_format)
+                # Very large CSV files skip the DataFrame and are streamed into the store
+                dataset = None
+                workbook_sheets = []
+                if is_out_of_core_file(file_path, file_format):
+                    dataset = load_out_of_core(file_path, digest)
+                if dataset is None:
+                    loaded = load_and_group_data(file_path, digest, sheet_names, file_format,
+                                                 on_sheets=workbook_sheets.extend)
+                    if loaded is not None:
+                        # Each sheet selection of a workbook is its own dataset
+                        digest = sheet_digest(digest, sheet_names)
+                        df, data_groups, completeness_percentage, memory_report, sketch = loaded
+                        dataset_profile = stored_dataset_profile(df, completeness_percentage, memory_report, digest,
+                                                                 sketch=sketch)
+                        dataset = dataset_store.create(df, data_groups, dataset_profile, digest)
+                if dataset is not None:
+                    df = dataset.df
+                    session['dataset_id'] = dataset.dataset_id
                     session['data_loaded'] = True
                     flash(f'File {filename} uploaded successfully! Data loaded with {len(df)} companies and {len(df.columns)} features.')
+                    # The sheet names come from the parse itself; a cached parse does not open the workbook
+                    if sheet_names is None and len(workbook_sheets) > 1:
+                        flash(f'Only the first sheet was loaded. The workbook also has: {", ".join(workbook_sheets[1:])}')
                     return redirect(url_for('analysis'))
                 else:
                     flash('Error loading data from file. Please check the file format and try again.')
@@ -251,180 +629,434 @@ def upload():
             flash('Invalid file type. Please upload Excel (.xlsx, .xls) or CSV (.csv) files.')
             return redirect(request.url)
     
-    return render_template('upload.html', lang=lang, get_text=get_text, get_language_name=get_language_name)
+    return render_template('upload.html', lang=lang, get_text=get_text, get_language_name=get_language_name,
+                           dataset_loaded=get_current_dataset() is not None)
+
+@app.route('/upload_stream', methods=['POST'])
+def upload_stream():
+    """Load a CSV file sent as the raw request body, parsing it while it is received
+    
+    The file name is given as ?filename=; progress is reported at /load_progress
+    under the ?upload_id= given here.
+    The body may be up to STREAM_UPLOAD_MAX_BYTES, independently of MAX_CONTENT_LENGTH.
+    """
+    filename = secure_filename(request.args.get('filename', ''))
+    if not filename.lower().endswith('.csv'):
+        return jsonify({'error': 'Only CSV files can be streamed; upload Excel files with the form'}), 400
+    
+    max_bytes = app.config['STREAM_UPLOAD_MAX_BYTES']
+    try:
+        body = get_input_stream(request.environ, max_content_length=max_bytes)
+        dataset = load_upload_stream(UploadStream(body, request.content_length))
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'File is larger than the {format_bytes(max_bytes)} upload limit'}), 413
+    except ValueError as e:
+        print(f"Error loading streamed upload {filename}: {e}")
+        return jsonify({'error': f'Error loading data from file: {e}'}), 400
+    
+    df = dataset.df
+    session['dataset_id'] = dataset.dataset_id
+    session['data_loaded'] = True
+    flash(f'File {filename} uploaded successfully! Data loaded with {len(df)} companies and {len(df.columns)} features.')
+    return jsonify({
+        'success': True,
+        'dataset_id': dataset.dataset_id,
+        'rows': len(df),
+        'columns': len(df.columns),
+        'redirect': url_for('analysis')
+    })
 
 @app.route('/analysis')
 def analysis():
     """Data analysis and grouping page"""
-    global current_data, data_groups
     lang = session.get('lang', 'en')
+    dataset = get_current_dataset()
     
-    if current_data is None:
+    if dataset is None:
         flash('No data loaded. Please upload a file first.')
         return redirect(url_for('upload'))
     
-    # Get basic statistics
-    total_companies = len(current_data)
-    total_features = len(current_data.columns)
-    
-    # Calculate overall completeness
-    overall_completeness = (current_data.notna().sum().sum() / (total_companies * total_features)) * 100
-    
-    # Get feature types
-    numeric_features = current_data.select_dtypes(include=[np.number]).columns.tolist()
-    categorical_features = current_data.select_dtypes(include=['object']).columns.tolist()
-    
-    # Identify binary features
-    binary_features = identify_binary_features(current_data)
-    non_binary_features = [col for col in numeric_features if col not in binary_features]
+    # Statistics and feature types come from the profile computed at upload
+    profile = dataset.profile
     
     return render_template('analysis.html',
                          lang=lang,
                          get_text=get_text,
                          get_language_name=get_language_name,
-                         total_companies=total_companies,
-                         total_features=total_features,
-                         overall_completeness=overall_completeness,
-                         data_groups=data_groups,
-                         numeric_features=numeric_features,
-                         categorical_features=categorical_features,
-                         binary_features=binary_features,
-                         non_binary_features=non_binary_features)
+                         total_companies=profile.total_companies,
+                         total_features=profile.total_features,
+                         overall_completeness=profile.overall_completeness,
+                         data_groups=dataset.groups,
+                         numeric_features=profile.numeric_features,
+                         categorical_features=profile.categorical_features,
+                         binary_features=profile.binary_features,
+                         non_binary_features=profile.non_binary_features,
+                         memory_report=profile.memory_report,
+                         profile_mode=profile.mode,
+                         profile_error_bounds=profile.error_bounds)
 
 @app.route('/clustering')
 def clustering():
     """Company clustering page"""
-    global current_data, data_groups
     lang = session.get('lang', 'en')
+    dataset = get_current_dataset()
     
-    if current_data is None:
+    if dataset is None:
         flash('No data loaded. Please upload a file first.')
         return redirect(url_for('upload'))
     
-    return render_template('clustering.html', lang=lang, get_text=get_text, get_language_name=get_language_name, data_groups=data_groups)
+    return render_template('clustering.html', lang=lang, get_text=get_text, get_language_name=get_language_name, data_groups=dataset.groups)
 
 @app.route('/cluster_group/<group_name>')
 def cluster_group(group_name):
     """Cluster companies within a specific group"""
-    global current_data, data_groups
+    dataset = get_current_dataset()
     
-    if current_data is None or data_groups is None:
+    if dataset is None:
         return jsonify({'error': 'No data available'})
     
-    if group_name not in data_groups:
+    if group_name not in dataset.groups:
         return jsonify({'error': 'Group not found'})
     
-    group_data = data_groups[group_name]
+    # Groups are stored as row positions; build this group's frame on demand
+    group_data = dataset.groups.materialize(group_name)
     
-    # Get n_clusters from query parameters
+    # Get n_clusters and the clustering engine from query parameters
     n_clusters = request.args.get('n_clusters', 3, type=int)
+    engine = requested_cluster_engine()
+    if engine is None:
+        return jsonify({'error': f"Unknown clustering engine, expected one of: auto, {', '.join(CLUSTER_ENGINES)}"})
     
-    clustered_data, cluster_centers, features_used = cluster_companies(group_data, group_name, n_clusters)
+    # Stored models also label companies appended since the fit; refit=1 fits the group again
+    return jsonify(cluster_group_result(group_data, group_name, n_clusters,
+                                        cache=cluster_cache, dataset_key=dataset.cache_key, engine=engine,
+                                        models=dataset.cluster_models, refit=requested_refit()))
+
+@app.route('/cluster_all_groups')
+def cluster_all_groups():
+    """Cluster every completeness group at once, each group in its own worker process
     
-    if clustered_data is None:
-        return jsonify({'error': features_used})
+    n_clusters applies to every group unless n_clusters_<group name> is
+    given. Cached results are answered here; the other groups are fanned out
+    to the job worker pool, which opens the dataset from the memory-mapped
+    store instead of receiving pickled group frames, so the response takes
+    about as long as the slowest group.
+    """
+    dataset = get_current_dataset()
     
-    # Prepare data for visualization
-    cluster_summary = []
-    for cluster_id in range(len(cluster_centers)):
-        companies_in_cluster = clustered_data[clustered_data['cluster'] == cluster_id]
-        cluster_summary.append({
-            'cluster_id': cluster_id,
-            'company_count': len(companies_in_cluster),
-            'companies': companies_in_cluster.index.tolist()
-        })
+    if dataset is None:
+        return jsonify({'error': 'No data available'})
     
-    return jsonify({
-        'success': True,
-        'group_name': group_name,
-        'total_companies': len(group_data),
-        'features_used': features_used,
-        'cluster_summary': cluster_summary,
-        'cluster_centers': cluster_centers.tolist()
-    })
+    n_clusters = request.args.get('n_clusters', 3, type=int)
+    engine = requested_cluster_engine()
+    if engine is None:
+        return jsonify({'error': f"Unknown clustering engine, expected one of: auto, {', '.join(CLUSTER_ENGINES)}"})
+    refit = requested_refit()
+    
+    results = {}
+    pending = []
+    for group_name in dataset.groups:
+        group_clusters = request.args.get(f'n_clusters_{group_name}', n_clusters, type=int)
+        cached = None
+        if not refit:
+            cached = cached_cluster_group_result(cluster_cache, dataset.cache_key, group_name,
+                                                 len(dataset.groups[group_name]), group_clusters, engine,
+                                                 models=dataset.cluster_models)
+        if cached is not None:
+            results[group_name] = cached
+        else:
+            pending.append((group_name, group_clusters))
+    
+    if len(pending) == 1:
+        # A single group gains nothing from a worker, so it is clustered here as by /cluster_group
+        group_name, group_clusters = pending[0]
+        results[group_name] = cluster_group_result(dataset.groups.materialize(group_name), group_name, group_clusters,
+                                                   cache=cluster_cache, dataset_key=dataset.cache_key, engine=engine,
+                                                   models=dataset.cluster_models, refit=refit)
+    elif pending:
+        calls = [((app.config['DATASET_STORE_FOLDER'], dataset.dataset_id, group_name, group_clusters),
+                  {'engine': engine, 'cache_dir': cluster_cache.cache_dir, 'cache_max_bytes': cluster_cache.max_bytes,
+                   'refit': refit, 'model_dir': model_store.root_dir})
+                 for group_name, group_clusters in pending]
+        try:
+            with stage('cluster_fan_out'):
+                fitted = job_runner.run_all(cluster_group_task, calls)
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+        except Exception as e:
+            # A failed group, or a worker that died and broke the pool, fails the whole request
+            print(f"Error clustering all groups: {e}")
+            return jsonify({'error': f'Clustering failed: {e}'}), 500
+        results.update(zip((group_name for group_name, _ in pending), fitted))
+    
+    # Groups are listed in the dataset's order whichever finished first
+    return jsonify({'groups': {group_name: results[group_name] for group_name in dataset.groups}})
+
+@app.route('/cluster_sweep/<group_name>')
+def cluster_sweep(group_name):
+    """Cluster a group for several numbers of clusters to help choose k"""
+    dataset = get_current_dataset()
+    
+    if dataset is None:
+        return jsonify({'error': 'No data available'})
+    
+    if group_name not in dataset.groups:
+        return jsonify({'error': 'Group not found'})
+    
+    k_values = requested_k_values()
+    if k_values is None:
+        return jsonify({'error': f"Invalid cluster counts, use values from 1 to {app.config['CLUSTER_SWEEP_MAX_K']}"})
+    engine = requested_cluster_engine()
+    if engine is None:
+        return jsonify({'error': f"Unknown clustering engine, expected one of: auto, {', '.join(CLUSTER_ENGINES)}"})
+    
+    group_data = dataset.groups.materialize(group_name)
+    return jsonify(cluster_sweep_result(group_data, group_name, k_values, engine,
+                                        n_jobs=app.config['CLUSTER_SWEEP_JOBS']))
 
 @app.route('/anomaly_detection')
 def anomaly_detection():
     """Anomaly detection page"""
-    global current_data
     lang = session.get('lang', 'en')
+    dataset = get_current_dataset()
     
-    if current_data is None:
+    if dataset is None:
         flash('No data loaded. Please upload a file first.')
         return redirect(url_for('upload'))
     
-    # Get non-binary numeric features for anomaly detection
-    binary_features = identify_binary_features(current_data)
-    numeric_features = current_data.select_dtypes(include=[np.number]).columns.tolist()
-    non_binary_features = [col for col in numeric_features if col not in binary_features]
+    # Non-binary numeric features for anomaly detection come from the dataset profile
+    # A 'name' column, when present, labels companies in the anomaly table
+    name_column = 'name' if 'name' in dataset.df.columns else None
     
-    return render_template('anomaly_detection.html', lang=lang, get_text=get_text, get_language_name=get_language_name, features=non_binary_features)
+    return render_template('anomaly_detection.html', lang=lang, get_text=get_text, get_language_name=get_language_name,
+                           features=dataset.profile.non_binary_features, name_column=name_column)
 
 @app.route('/detect_anomalies/<feature_name>')
 def detect_anomalies_route(feature_name):
     """Detect anomalies for a specific feature"""
-    global current_data
+    dataset = get_current_dataset()
     
-    if current_data is None:
+    if dataset is None:
         return jsonify({'error': 'No data available'})
     
-    anomalies_result = detect_anomalies(current_data, feature_name)
-    
-    if anomalies_result is None:
-        return jsonify({'error': f'Feature {feature_name} not found or has no data'})
-    
-    # Prepare anomaly data for response
-    anomaly_data = {
-        'feature_name': feature_name,
-        'anomaly_count': len(anomalies_result['anomalies']),
-        'total_records': len(current_data[feature_name].dropna()),
-        'anomaly_percentage': (len(anomalies_result['anomalies']) / len(current_data[feature_name].dropna())) * 100,
-        'statistics': {
-            'Q1': float(anomalies_result['Q1']),
-            'Q3': float(anomalies_result['Q3']),
-            'IQR': float(anomalies_result['IQR']),
-            'lower_bound': float(anomalies_result['lower_bound']),
-            'upper_bound': float(anomalies_result['upper_bound'])
-        },
-        'anomalies': anomalies_result['anomalies'].to_dict('records')
-    }
+    # IQR multiplier for the outlier bounds, 1.5 by default
+    multiplier = request.args.get('multiplier', 1.5, type=float)
+    
+    page = requested_page()
+    result = anomaly_result(dataset.df, feature_name, multiplier=multiplier, index=dataset.anomaly_index, page=page)
+    
+    # Arrow clients get the anomalous rows as the stream and the rest as metadata
+    if page.layout == 'frame' and 'error' not in result:
+        rows = result.pop('anomalies')
+        return arrow_response(app.response_class, rows, result)
+    return jsonify(result)
+
+@app.route('/anomaly_scan')
+def anomaly_scan():
+    """Flag outliers in every non-binary feature and count them per company"""
+    dataset = get_current_dataset()
+    
+    if dataset is None:
+        return jsonify({'error': 'No data available'})
+    
+    # IQR multiplier for the outlier bounds, 1.5 by default
+    multiplier = request.args.get('multiplier', 1.5, type=float)
+    
+    return jsonify(anomaly_scan_result(dataset.df, dataset.profile.non_binary_features, multiplier))
+
+@app.route('/export')
+def export_dataset():
+    """Stream every company with its completeness, cluster and outlier labels as Arrow or Parquet"""
+    dataset = get_current_dataset()
+    
+    if dataset is None:
+        return jsonify({'error': 'No data available'})
+    
+    export_format = request.args.get('format', 'arrow')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown export format, expected one of: {', '.join(EXPORT_FORMATS)}"})
+    engine = requested_cluster_engine()
+    if engine is None:
+        return jsonify({'error': f"Unknown clustering engine, expected one of: auto, {', '.join(CLUSTER_ENGINES)}"})
+    n_clusters = request.args.get('n_clusters', 3, type=int)
+    multiplier = request.args.get('multiplier', 1.5, type=float)
     
-    return jsonify(anomaly_data)
+    # Labels are computed up front; the rows are then converted and sent a chunk at a time
+    labels = DatasetLabels(dataset, n_clusters, engine, multiplier)
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    response = app.response_class(
+        stream_export(dataset.df, labels, export_format, app.config['EXPORT_CHUNK_ROWS']), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=companies_{dataset.dataset_id}.{extension}'
+    return response
+
+@app.route('/jobs/cluster_group/<group_name>', methods=['POST'])
+def submit_cluster_group_job(group_name):
+    """Start clustering a group in the background"""
+    dataset = get_current_dataset()
+    
+    if dataset is None:
+        return jsonify({'error': 'No data available'}), 400
+    
+    if group_name not in dataset.groups:
+        return jsonify({'error': 'Group not found'}), 404
+    
+    n_clusters = request.args.get('n_clusters', 3, type=int)
+    engine = requested_cluster_engine()
+    if engine is None:
+        return jsonify({'error': f"Unknown clustering engine, expected one of: auto, {', '.join(CLUSTER_ENGINES)}"}), 400
+    
+    refit = requested_refit()
+    
+    # Repeated requests are answered from the result cache without a worker;
+    # the key needs only the group's size, so the group is materialized by the task
+    cached = None
+    if not refit:
+        cached = cached_cluster_group_result(cluster_cache, dataset.cache_key, group_name,
+                                             len(dataset.groups[group_name]), n_clusters, engine,
+                                             models=dataset.cluster_models)
+    if cached is not None:
+        job_id = job_runner.complete('cluster_group', cached)
+    else:
+        job_id = job_runner.submit('cluster_group', cluster_group_task, app.config['DATASET_STORE_FOLDER'],
+                                   dataset.dataset_id, group_name, n_clusters, engine=engine,
+                                   cache_dir=cluster_cache.cache_dir,
+                                   cache_max_bytes=cluster_cache.max_bytes, refit=refit,
+                                   model_dir=model_store.root_dir)
+    
+    return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/cluster_sweep/<group_name>', methods=['POST'])
+def submit_cluster_sweep_job(group_name):
+    """Start a k sweep for a group in the background"""
+    dataset = get_current_dataset()
+    
+    if dataset is None:
+        return jsonify({'error': 'No data available'}), 400
+    
+    if group_name not in dataset.groups:
+        return jsonify({'error': 'Group not found'}), 404
+    
+    k_values = requested_k_values()
+    if k_values is None:
+        return jsonify({'error': f"Invalid cluster counts, use values from 1 to {app.config['CLUSTER_SWEEP_MAX_K']}"}), 400
+    engine = requested_cluster_engine()
+    if engine is None:
+        return jsonify({'error': f"Unknown clustering engine, expected one of: auto, {', '.join(CLUSTER_ENGINES)}"}), 400
+    
+    job_id = job_runner.submit('cluster_sweep', cluster_sweep_task, app.config['DATASET_STORE_FOLDER'],
+                               dataset.dataset_id, group_name, k_values, engine=engine,
+                               n_jobs=app.config['CLUSTER_SWEEP_JOBS'])
+    
+    return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/detect_anomalies/<feature_name>', methods=['POST'])
+def submit_detect_anomalies_job(feature_name):
+    """Start anomaly detection for a feature in the background"""
+    dataset = get_current_dataset()
+    
+    if dataset is None:
+        return jsonify({'error': 'No data available'}), 400
+    
+    multiplier = request.args.get('multiplier', 1.5, type=float)
+    job_id = job_runner.submit('detect_anomalies', detect_anomalies_task, app.config['DATASET_STORE_FOLDER'],
+                               dataset.dataset_id, feature_name, multiplier, page=requested_page(allow_arrow=False))
+    
+    return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/anomaly_scan', methods=['POST'])
+def submit_anomaly_scan_job():
+    """Start a scan of all features for anomalies in the background"""
+    dataset = get_current_dataset()
+    
+    if dataset is None:
+        return jsonify({'error': 'No data available'}), 400
+    
+    multiplier = request.args.get('multiplier', 1.5, type=float)
+    job_id = job_runner.submit('anomaly_scan', anomaly_scan_task, app.config['DATASET_STORE_FOLDER'],
+                               dataset.dataset_id, multiplier)
+    
+    return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status, progress and (once done) result of a background job"""
+    state = job_runner.status(job_id)
+    
+    if state is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(state)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running background job"""
+    state = job_runner.cancel(job_id)
+    
+    if state is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(state)
+
+@app.route('/models')
+def stored_models():
+    """Versions of the fitted models and profile stored for the current dataset"""
+    dataset = get_current_dataset()
+    
+    if dataset is None:
+        return jsonify({'error': 'No data available'})
+    
+    return jsonify({
+        'dataset_key': dataset.cache_key,
+        'models': {name: model_store.versions(dataset.cache_key, name)
+                   for name in model_store.names(dataset.cache_key)}
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request and stage histograms of this process in the Prometheus text format"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/load_progress')
+def load_progress_status():
+    """Progress of the file loaded under ?upload_id="""
+    return jsonify(load_progress.get(request.args.get('upload_id')) or {'status': 'idle'})
+
+@app.route('/cache_stats')
+def cache_stats():
+    """Parse and clustering cache hit/miss counters"""
+    return jsonify({
+        'parse': parse_cache.stats(),
+        'clustering': cluster_cache.stats()
+    })
 
 @app.route('/data_preview')
 def data_preview():
     """Data preview page"""
-    global current_data
+    dataset = get_current_dataset()
     
-    if current_data is None:
+    if dataset is None:
         return jsonify({'error': 'No data available'})
     
-    # Return first 100 rows and basic info
-    preview_data = current_data.head(100).to_dict('records')
-    columns_info = []
-    
-    for col in current_data.columns:
-        col_info = {
-            'name': col,
-            'dtype': str(current_data[col].dtype),
-            'non_null_count': int(current_data[col].notna().sum()),
-            'null_count': int(current_data[col].isna().sum()),
-            'unique_values': int(current_data[col].nunique())
-        }
-        
-        if current_data[col].dtype in ['int64', 'float64']:
-            col_info['min'] = float(current_data[col].min()) if not current_data[col].empty else None
-            col_info['max'] = float(current_data[col].max()) if not current_data[col].empty else None
-            col_info['mean'] = float(current_data[col].mean()) if not current_data[col].empty else None
-        
-        columns_info.append(col_info)
-    
-    return jsonify({
-        'preview_data': preview_data,
+    # Return one page of rows (the first 100 by default), optionally sorted and
+    # limited to some columns, with their info from the dataset profile
+    current_data = dataset.df
+    try:
+        page = page_of_rows(current_data, requested_page(), index=dataset.anomaly_index)
+    except ValueError as e:
+        return jsonify({'error': str(e)})
+    columns_info = [info for info in dataset.profile.columns_info if info['name'] in page['columns']]
+    rows = page.pop('rows')
+    result = {
         'columns_info': columns_info,
         'total_rows': len(current_data),
-        'total_columns': len(current_data.columns)
-    })
+        'total_columns': len(current_data.columns),
+        'page': page
+    }
+    
+    if isinstance(rows, pd.DataFrame):
+        return arrow_response(app.response_class, rows, result)
+    result['preview_data'] = rows
+    return jsonify(result)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
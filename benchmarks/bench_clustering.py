@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark: clustering engines vs. the original full-batch KMeans path
+
+For each group size, the scaled feature matrix is prepared once and every
+engine is timed on it. Inertia is always measured on all rows against the
+engine's final centers, so sampled and mini-batch fits are compared fairly.
+
+Usage: python benchmarks/bench_clustering.py [--rows 10000 100000 1000000] [--clusters 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import CLUSTER_ENGINES, choose_engine, fit_clusters
+from synthetic import synthetic_features
+
+
+def legacy_fit(scaled_data, n_clusters):
+    """Original cluster_companies() call: KMeans with the library default n_init"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        model = KMeans(n_clusters=n_clusters, random_state=42)
+        return model, model.fit_predict(scaled_data)
+
+
+def full_inertia(scaled_data, labels, centers):
+    return float(((scaled_data - centers[labels]) ** 2).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--clusters', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'engine':<16} {'seconds':>9} {'inertia':>16} {'vs legacy':>10}")
+    for rows in args.rows:
+        scaled_data = StandardScaler().fit_transform(synthetic_features(rows))
+
+        runs = [('legacy', lambda: legacy_fit(scaled_data, args.clusters))]
+        runs += [(engine, lambda engine=engine: fit_clusters(scaled_data, args.clusters, engine))
+                 for engine in CLUSTER_ENGINES]
+        legacy_inertia = None
+        for name, run in runs:
+            start = time.perf_counter()
+            model, labels = run()
+            elapsed = time.perf_counter() - start
+            inertia = full_inertia(scaled_data, labels, model.cluster_centers_)
+            if legacy_inertia is None:
+                legacy_inertia = inertia
+            marker = ' (auto)' if name == choose_engine(rows) else ''
+            print(f"{rows:>10,} {name + marker:<16} {elapsed:>9.2f} {inertia:>16,.1f} "
+                  f"{inertia / legacy_inertia:>9.4f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Memory report: completeness groups as row positions vs. full sub-frame copies
+
+Usage: python benchmarks/bench_completeness_memory.py [data_file.csv|.xlsx] [--rows N]
+Without a file, a synthetic 1,000,000-row company dataset is generated.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from completeness import analyze_data_completeness
+from synthetic import synthetic_companies
+
+
+def legacy_analyze_data_completeness(df):
+    """Original implementation: full copy plus one masked sub-frame per group"""
+    completeness = df.notna().sum(axis=1)
+    total_features = len(df.columns)
+    completeness_percentage = (completeness / total_features) * 100
+    df_with_completeness = df.copy()
+    df_with_completeness['completeness_percentage'] = completeness_percentage
+    df_with_completeness['missing_features'] = total_features - completeness
+    pct = df_with_completeness['completeness_percentage']
+    groups = {
+        'complete': df_with_completeness[pct == 100],
+        'high_completeness': df_with_completeness[(pct >= 80) & (pct < 100)],
+        'medium_completeness': df_with_completeness[(pct >= 50) & (pct < 80)],
+        'low_completeness': df_with_completeness[pct < 50],
+    }
+    return {name: group for name, group in groups.items() if not group.empty}, df_with_completeness
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('data_file', nargs='?')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    if args.data_file:
+        from app import load_data
+        df = load_data(args.data_file, use_cache=False)
+        if df is None:
+            sys.exit(1)
+    else:
+        df = synthetic_companies(args.rows)
+
+    base_bytes = frame_bytes(df)
+    print(f"Dataset: {len(df):,} rows x {len(df.columns)} columns, {base_bytes / 1e6:,.1f} MB")
+
+    legacy_groups, df_with_completeness = legacy_analyze_data_completeness(df)
+    legacy_bytes = frame_bytes(df_with_completeness) + sum(frame_bytes(g) for g in legacy_groups.values())
+    del legacy_groups, df_with_completeness
+
+    groups, completeness_percentage = analyze_data_completeness(df)
+    new_bytes = groups.nbytes + completeness_percentage.memory_usage(deep=True, index=True)
+
+    print(f"{'group':<22} {'companies':>10}")
+    for name, group in groups.items():
+        print(f"{name:<22} {len(group):>10,}")
+    print(f"Legacy grouping (copy + sub-frames): {legacy_bytes / 1e6:>10,.1f} MB")
+    print(f"Position-based grouping:             {new_bytes / 1e6:>10,.1f} MB")
+    print(f"Bytes saved:                         {(legacy_bytes - new_bytes) / 1e6:>10,.1f} MB "
+          f"({(legacy_bytes - new_bytes) / legacy_bytes:.1%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark: vectorized column profiling vs. the original per-column loops
+
+Usage: python benchmarks/bench_profiling.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profiling import identify_binary_features, profile_columns
+
+
+def legacy_identify_binary_features(df):
+    """Original implementation from app.py"""
+    binary_features = []
+    for col in df.columns:
+        if df[col].dtype in ['object', 'string']:
+            unique_values = df[col].dropna().unique()
+            if len(unique_values) <= 2:
+                binary_features.append(col)
+        elif df[col].dtype in ['int64', 'float64']:
+            unique_values = df[col].dropna().unique()
+            if len(unique_values) <= 2:
+                binary_features.append(col)
+    return binary_features
+
+
+def legacy_profile_columns(df):
+    """Original /data_preview column loop"""
+    columns_info = []
+    for col in df.columns:
+        col_info = {
+            'name': col,
+            'dtype': str(df[col].dtype),
+            'non_null_count': int(df[col].notna().sum()),
+            'null_count': int(df[col].isna().sum()),
+            'unique_values': int(df[col].nunique())
+        }
+        if df[col].dtype in ['int64', 'float64']:
+            col_info['min'] = float(df[col].min()) if not df[col].empty else None
+            col_info['max'] = float(df[col].max()) if not df[col].empty else None
+            col_info['mean'] = float(df[col].mean()) if not df[col].empty else None
+        columns_info.append(col_info)
+    return columns_info
+
+
+def synthetic_frame(rows, cols, seed=42):
+    """Company-like frame: continuous, binary, integer and categorical columns with gaps"""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(cols):
+        kind = i % 4
+        if kind == 0:
+            values = rng.lognormal(10, 1, rows)
+        elif kind == 1:
+            values = rng.integers(0, 2, rows).astype(float)
+        elif kind == 2:
+            values = rng.integers(0, 1000, rows)
+        else:
+            values = rng.choice(['UAB', 'AB', 'MB', 'IĮ'], rows).astype(object)
+        if kind != 2:
+            values = pd.Series(values)
+            values[rng.random(rows) < 0.2] = None if kind == 3 else np.nan
+        data[f'feature_{i}'] = values
+    return pd.DataFrame(data)
+
+
+def best_of(func, df, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    scenarios = [
+        ('wide', 2_000, 800),
+        ('tall', 200_000, 20),
+    ]
+    print(f"{'frame':<6} {'shape':>14} {'function':<26} {'legacy (s)':>11} {'vectorized (s)':>15} {'speedup':>8}")
+    for name, rows, cols in scenarios:
+        df = synthetic_frame(rows, cols)
+        pairs = [
+            ('identify_binary_features', legacy_identify_binary_features, identify_binary_features),
+            ('profile_columns', legacy_profile_columns, profile_columns),
+        ]
+        for label, legacy, vectorized in pairs:
+            legacy_time, expected = best_of(legacy, df)
+            new_time, actual = best_of(vectorized, df)
+            assert actual == expected, f'{label} results differ on {name} frame'
+            print(f"{name:<6} {str(df.shape):>14} {label:<26} {legacy_time:>11.3f} {new_time:>15.3f} "
+                  f"{legacy_time / new_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: time and memory of the analysis pipeline on synthetic company data
+
+Generates a seeded synthetic dataset, writes it as a CSV file and times the
+code paths the app runs for it: the chunked CSV load with dtype compaction
+(uploads from CSV_CHUNKED_MIN_BYTES), streaming the file into the Arrow
+dataset store (uploads from OUT_OF_CORE_MIN_BYTES), then, on the stored
+memory-mapped frame, build_dataset_profile, analyze_data_completeness,
+cluster_group_result (on the largest completeness group), anomaly_result for
+every non-binary feature through a fresh AnomalyIndex, and
+anomaly_scan_result. Each step is timed without tracing, best of --repeat runs, and run once more
+under tracemalloc for its peak memory. Results are written as JSON with the
+commit, library versions and dataset parameters, so runs can be compared:
+
+Usage: python benchmarks/run_benchmarks.py [--rows 100000] [--cols 28] [--missing 0.2]
+                                           [--binary-share 0.25] [--repeat 3]
+                                           [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import sklearn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import anomaly_result, anomaly_scan_result, cluster_group_result
+from anomaly_index import AnomalyIndex
+from completeness import analyze_data_completeness
+from dataset_store import DatasetStore
+from ingestion import load_csv_chunked, optimize_dtypes
+from paging import PageRequest
+from profiling import build_dataset_profile
+from synthetic import synthetic_companies
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(RESULTS_DIR)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(func, repeat):
+    """Best-of-repeat seconds, then one traced run for the peak memory in bytes"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(timings), 'all_seconds': timings, 'peak_bytes': peak_bytes}
+
+
+def pipeline_steps(csv_path, store_dir, n_clusters):
+    """(name, callable) for every benchmarked step, each on its own input"""
+    from app import app, profile_mode
+
+    def build_profile(df, completeness_percentage):
+        return build_dataset_profile(df, completeness_percentage, None, profile_mode(len(df)))
+
+    def load_chunked():
+        return load_csv_chunked(csv_path, app.config['CSV_CHUNK_ROWS'], prepare=lambda df: optimize_dtypes(df)[0])
+
+    store = DatasetStore(store_dir, None)
+
+    def store_columnar():
+        return store.create_from_csv(csv_path, build_profile, block_size=app.config['COLUMNAR_BLOCK_BYTES'])
+
+    # The analysis steps run on the memory-mapped frame the app's workers open
+    dataset = store_columnar()
+    df = dataset.df
+    largest = max(dataset.groups, key=lambda name: len(dataset.groups[name]))
+    features = dataset.profile.non_binary_features
+
+    def cluster_largest():
+        return cluster_group_result(dataset.groups.materialize(largest), largest, n_clusters)
+
+    def detect_all():
+        # A fresh index each run, so every feature is sorted once as on a first request
+        index = AnomalyIndex(df)
+        for feature in features:
+            anomaly_result(df, feature, index=index, page=PageRequest())
+
+    return [
+        ('load_csv_chunked', load_chunked),
+        ('store_csv_columnar', store_columnar),
+        ('build_dataset_profile', lambda: build_profile(df, dataset.groups.completeness_percentage)),
+        ('analyze_data_completeness', lambda: analyze_data_completeness(df)),
+        ('cluster_group_result', cluster_largest),
+        ('anomaly_result', detect_all),
+        ('anomaly_scan_result', lambda: anomaly_scan_result(df, features)),
+    ]
+
+
+def compare(results, baseline):
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline['timestamp']}):")
+    print(f"{'step':<28} {'seconds':>9} {'baseline':>9} {'ratio':>7} {'peak MB':>9} {'baseline':>9}")
+    for name, result in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        print(f"{name:<28} {result['seconds']:>9.3f} {before['seconds']:>9.3f} "
+              f"{result['seconds'] / before['seconds']:>6.2f}x {result['peak_bytes'] / 1e6:>9.1f} "
+              f"{before['peak_bytes'] / 1e6:>9.1f}")
+    if results['dataset'] != baseline['dataset']:
+        print("Warning: the datasets differ, so the timings are not directly comparable")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--cols', type=int, default=28, help='numeric feature columns')
+    parser.add_argument('--missing', type=float, default=0.2, help='average share of missing numeric cells')
+    parser.add_argument('--binary-share', type=float, default=0.25, help='share of 0/1 feature columns')
+    parser.add_argument('--clusters', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='results file (default benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    dataset = {'rows': args.rows, 'cols': args.cols, 'missing': args.missing,
+               'binary_share': args.binary_share, 'clusters': args.clusters, 'seed': args.seed}
+    df = synthetic_companies(args.rows, args.cols, args.missing, args.binary_share, seed=args.seed)
+    print(f"Dataset: {len(df):,} rows x {len(df.columns)} columns")
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'versions': {'pandas': pd.__version__, 'numpy': np.__version__, 'pyarrow': pa.__version__,
+                     'sklearn': sklearn.__version__},
+        'dataset': dataset,
+        'repeat': args.repeat,
+        'results': {}
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'companies.csv')
+        df.to_csv(csv_path, index=False)
+        print(f"{'step':<28} {'seconds':>9} {'peak MB':>9}")
+        for name, func in pipeline_steps(csv_path, os.path.join(tmp_dir, 'datasets'), args.clusters):
+            result = measure(func, args.repeat)
+            results['results'][name] = result
+            print(f"{name:<28} {result['seconds']:>9.3f} {result['peak_bytes'] / 1e6:>9.1f}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit'] or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
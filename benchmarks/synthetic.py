@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic company datasets shared by the benchmarks
+
+Every generator is seeded, so the same arguments always produce the same data
+and timings can be compared across commits.
+"""
+
+import numpy as np
+import pandas as pd
+
+SECTORS = ['Retail', 'Manufacturing', 'Services', 'Energy']
+# Per-row missing rates, as multiples of the requested average; the spread puts
+# companies in every completeness group
+ROW_MISSING_LEVELS = np.array([0.0, 0.5, 1.5, 2.0])
+
+
+def synthetic_features(rows, cols=12, centers=4, seed=7):
+    """Non-binary company features drawn around a few latent segments"""
+    rng = np.random.default_rng(seed)
+    segment_means = rng.normal(0, 3, (centers, cols))
+    segments = rng.integers(0, centers, rows)
+    return segment_means[segments] + rng.normal(0, 1, (rows, cols))
+
+
+def synthetic_companies(rows, numeric_cols=28, missing=0.2, binary_share=0.0, centers=4, seed=7):
+    """Company registry shaped like the production extract
+
+    A company name and a sector column, then numeric_cols features: a
+    binary_share fraction of them are 0/1 flags, the rest are lognormal
+    amounts whose log scale depends on a latent segment, so the data has
+    clusters to find. Numeric cells are missing at an average rate of
+    missing, varying per row so all completeness groups are populated.
+    """
+    rng = np.random.default_rng(seed)
+    data = {
+        'company': np.array([f'Company {i}' for i in range(rows)], dtype=object),
+        'sector': rng.choice(SECTORS, rows).astype(object),
+    }
+    row_missing_rate = np.minimum(rng.choice(ROW_MISSING_LEVELS * missing, rows), 0.95)
+    n_binary = int(round(numeric_cols * binary_share))
+    segment_scales = synthetic_features(rows, numeric_cols - n_binary, centers, seed) * 0.3 + 10
+    for i in range(numeric_cols):
+        if i < n_binary:
+            values = rng.integers(0, 2, rows).astype(float)
+        else:
+            values = np.exp(segment_scales[:, i - n_binary])
+        values[rng.random(rows) < row_missing_rate] = np.nan
+        data[f'feature_{i}'] = values
+    return pd.DataFrame(data)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Out-of-core CSV ingestion for Company Risk Analysis System
+
+Large CSV files are streamed with the Arrow CSV reader straight into an
+Arrow IPC file, and completeness is counted on each record batch with Arrow
+compute kernels, so the file is never held in memory as a DataFrame. The
+batches are then rewritten one column at a time into per-column files that
+can be memory-mapped like any stored dataset.
+"""
+
+import io
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from completeness import CompletenessAccumulator
+from ingestion import open_source
+
+# Bytes parsed per record batch; column types are inferred from the first block
+COLUMNAR_BLOCK_BYTES = 16 * 1024 * 1024
+
+
+def batch_completeness(batch):
+    """Number of available features in each row of a record batch
+
+    Nulls and floating-point NaN both count as missing, as they do for
+    DataFrame.notna().
+    """
+    counts = np.zeros(batch.num_rows, dtype=np.int64)
+    for column in batch.columns:
+        if pa.types.is_floating(column.type):
+            valid = pc.fill_null(pc.invert(pc.is_nan(column)), False)
+        else:
+            valid = pc.is_valid(column)
+        counts += valid.to_numpy(zero_copy_only=False)
+    return counts
+
+
+class _PrefixedStream(io.RawIOBase):
+    """Binary stream that returns prefix and then the rest of f"""
+
+    def __init__(self, prefix, f):
+        self._prefix = memoryview(prefix)
+        self._f = f
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if len(self._prefix):
+            n = min(len(buffer), len(self._prefix))
+            buffer[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._f.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _read_block(f, size):
+    parts = []
+    while size > 0:
+        data = f.read(size)
+        if not data:
+            break
+        parts.append(data)
+        size -= len(data)
+    return b''.join(parts)
+
+
+def infer_column_types(block, complete=False):
+    """Column types for a CSV file from its first block of bytes
+
+    Types are inferred as the Arrow CSV reader would, except that integer
+    and all-missing columns become float64, so decimals or missing values
+    further down the file still fit the column, as they do with
+    pandas.read_csv. Unless complete, the block is cut after its last full
+    line first.
+    """
+    if not complete:
+        block = block[:block.rfind(b'\n') + 1] or block
+    table = pa_csv.read_csv(pa.py_buffer(block),
+                            convert_options=pa_csv.ConvertOptions(strings_can_be_null=True))
+    types = {}
+    for field in table.schema:
+        if pa.types.is_integer(field.type) or pa.types.is_null(field.type):
+            types[field.name] = pa.float64()
+        else:
+            types[field.name] = field.type
+    return types
+
+
+def stream_csv_to_arrow(source, arrow_path, block_size=COLUMNAR_BLOCK_BYTES, on_progress=None):
+    """Convert a CSV file or binary stream to an Arrow IPC file one record batch at a time
+
+    Fields are named by column position, as in the dataset store. Returns
+    (columns, string_columns, accumulator): the header labels, the positions
+    of text columns and a CompletenessAccumulator holding every row's
+    completeness. on_progress(rows_read, bytes_read, total_bytes) is called
+    after each batch; total_bytes is None for streams of unknown length.
+    Column types come from the first block (see infer_column_types()).
+    Raises pyarrow.ArrowInvalid if a later block still does not fit them,
+    e.g. text in a numeric column.
+    """
+    accumulator = CompletenessAccumulator()
+    with open_source(source) as (f, total_bytes):
+        first_block = _read_block(f, block_size)
+        column_types = infer_column_types(first_block, complete=len(first_block) < block_size)
+        # Empty text fields are missing values, as they are for pandas.read_csv
+        reader = pa_csv.open_csv(_PrefixedStream(first_block, f),
+                                 read_options=pa_csv.ReadOptions(block_size=block_size),
+                                 convert_options=pa_csv.ConvertOptions(column_types=column_types,
+                                                                       strings_can_be_null=True))
+        columns = reader.schema.names
+        schema = pa.schema([field.with_name(str(i)) for i, field in enumerate(reader.schema)])
+        with pa.OSFile(arrow_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                for batch in reader:
+                    accumulator.add_counts(batch_completeness(batch), len(columns))
+                    writer.write_batch(pa.RecordBatch.from_arrays(batch.columns, schema=schema))
+                    if on_progress is not None:
+                        bytes_read = f.tell() if total_bytes is None else min(f.tell(), total_bytes)
+                        on_progress(accumulator.rows, bytes_read, total_bytes)
+
+    string_columns = [i for i, field in enumerate(schema) if pa.types.is_string(field.type)]
+    return columns, string_columns, accumulator
+
+
+def _contiguous_column(column):
+    """Numeric column as one chunk without a validity bitmap, missing values as NaN
+
+    That is the layout pandas reads as a zero-copy view. Integer columns with
+    missing values become float64, as they do with pandas.read_csv.
+    """
+    if column.null_count:
+        if pa.types.is_integer(column.type):
+            column = column.cast(pa.float64())
+        column = pc.fill_null(column, float('nan'))
+    return column.combine_chunks()
+
+
+def write_column_files(arrow_path, column_dir):
+    """Rewrite an Arrow IPC file of record batches as one Arrow IPC file per column
+
+    Numeric columns are written as a single contiguous chunk with NaN for
+    missing values (see _contiguous_column), so reading them back from a
+    memory map copies nothing; other columns keep their batches. The input is
+    memory-mapped and only one column is held in memory at a time.
+    """
+    os.makedirs(column_dir, exist_ok=True)
+    with pa.memory_map(arrow_path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+        for i, field in enumerate(table.schema):
+            column = table.column(i)
+            if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+                column = _contiguous_column(column)
+            column_table = pa.Table.from_arrays([column], names=[field.name])
+            with pa.OSFile(os.path.join(column_dir, f'{i}.arrow'), 'wb') as sink:
+                with pa.ipc.new_file(sink, column_table.schema) as writer:
+                    writer.write_table(column_table)
+            del column, column_table
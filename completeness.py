@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Data completeness grouping for Company Risk Analysis System
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+# Group name -> (lower bound inclusive, upper bound exclusive) on completeness percentage;
+# None means unbounded. The 'complete' group is exactly 100%.
+COMPLETENESS_GROUPS = [
+    ('complete', 100, None),
+    ('high_completeness', 80, 100),
+    ('medium_completeness', 50, 80),
+    ('low_completeness', None, 50),
+]
+
+
+def completeness_group_positions(percentage, offset=0):
+    """Integer row positions of each completeness group, shifted by offset"""
+    values = np.asarray(percentage)
+    positions = {}
+    for name, lower, upper in COMPLETENESS_GROUPS:
+        if upper is None:
+            mask = values == lower
+        elif lower is None:
+            mask = values < upper
+        else:
+            mask = (values >= lower) & (values < upper)
+        positions[name] = np.flatnonzero(mask) + offset
+    return positions
+
+
+class CompletenessGroup:
+    """Rows of one completeness group, stored as positions into the base frame
+
+    Behaves like a lightweight stand-in for the group sub-frame: len(),
+    .index and .columns work without copying any data. Call to_frame() to
+    materialize the rows, with the completeness columns appended.
+    """
+
+    def __init__(self, groups, name, positions):
+        self._groups = groups
+        self.name = name
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def index(self):
+        return self._groups.df.index[self.positions]
+
+    @property
+    def columns(self):
+        return self._groups.df.columns.append(pd.Index(['completeness_percentage', 'missing_features']))
+
+    def to_frame(self, positions=None):
+        """Materialize the group as a DataFrame, or only its rows at positions"""
+        groups = self._groups
+        positions = self.positions if positions is None else positions
+        total_features = len(groups.df.columns)
+        group_completeness = pd.Series(groups.completeness[positions], index=groups.df.index[positions])
+        return groups.df.iloc[positions].assign(
+            completeness_percentage=(group_completeness / total_features) * 100,
+            missing_features=total_features - group_completeness
+        )
+
+
+class CompletenessGroups(Mapping):
+    """Completeness groups as integer row positions over one base frame
+
+    Maps group name to a CompletenessGroup for each non-empty group, in the
+    order of COMPLETENESS_GROUPS. Only the per-row feature counts and the
+    group positions are stored, so grouping adds a few bytes per row instead
+    of a second copy of the dataset.
+    """
+
+    def __init__(self, df, completeness, positions):
+        self.df = df
+        self.completeness = np.asarray(completeness)
+        self._groups = {}
+        for name, _, _ in COMPLETENESS_GROUPS:
+            if len(positions[name]):
+                self._groups[name] = CompletenessGroup(self, name, positions[name])
+
+    def __getitem__(self, name):
+        return self._groups[name]
+
+    def __iter__(self):
+        return iter(self._groups)
+
+    def __len__(self):
+        return len(self._groups)
+
+    @property
+    def completeness_percentage(self):
+        """Completeness percentage of every row of the base frame"""
+        return pd.Series((self.completeness / len(self.df.columns)) * 100, index=self.df.index)
+
+    def materialize(self, name, positions=None):
+        """Return the rows of group name as a DataFrame, or only those at positions"""
+        return self._groups[name].to_frame(positions)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the grouping itself, excluding the base frame"""
+        return self.completeness.nbytes + sum(group.positions.nbytes for group in self._groups.values())
+
+
+def build_completeness_groups(df, completeness, positions):
+    """Build completeness groups over df
+
+    completeness holds the number of available features for each row.
+    """
+    return CompletenessGroups(df, completeness, positions)
+
+
+def analyze_data_completeness(df):
+    """Analyze data completeness and group companies by available features
+
+    Returns (groups, completeness_percentage). Groups reference rows of df by
+    position; use groups.materialize(name) to get a group's DataFrame.
+    """
+    with stage('completeness_grouping'):
+        # Calculate completeness for each company (row)
+        completeness = df.notna().sum(axis=1).to_numpy()
+        total_features = len(df.columns)
+        completeness_percentage = (completeness / total_features) * 100
+
+        # Group companies by completeness
+        positions = completeness_group_positions(completeness_percentage)
+        groups = build_completeness_groups(df, completeness, positions)
+
+    return groups, groups.completeness_percentage
+
+
+def append_completeness_groups(groups, df):
+    """Extend completeness groups to df, the grouped frame with rows appended
+
+    Rows already grouped keep their feature counts and group positions; only
+    the appended rows are counted and assigned to groups. df must have the
+    same columns as the grouped frame. Returns (groups, completeness_percentage).
+    """
+    first_new_row = len(groups.completeness)
+    completeness = df.iloc[first_new_row:].notna().sum(axis=1).to_numpy()
+    percentage = (completeness / len(df.columns)) * 100
+    new_positions = completeness_group_positions(percentage, offset=first_new_row)
+    positions = {
+        name: np.concatenate([groups[name].positions if name in groups else np.array([], dtype=int),
+                              new_positions[name]])
+        for name, _, _ in COMPLETENESS_GROUPS
+    }
+    groups = build_completeness_groups(df, np.concatenate([groups.completeness, completeness]), positions)
+    return groups, groups.completeness_percentage
+
+
+class CompletenessAccumulator:
+    """Assign rows to completeness groups chunk by chunk while a file is read
+
+    Completeness only depends on the row itself, so each chunk can be grouped
+    as soon as it is parsed. Only the per-row feature counts and group row
+    positions are kept.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self._counts = []
+        self._positions = {name: [] for name, _, _ in COMPLETENESS_GROUPS}
+
+    def add(self, chunk):
+        """Group the rows of the next chunk"""
+        self.add_counts(chunk.notna().sum(axis=1).to_numpy(), len(chunk.columns))
+
+    def add_counts(self, completeness, total_features):
+        """Group the next rows given their number of available features"""
+        percentage = (completeness / total_features) * 100
+        for name, group_positions in completeness_group_positions(percentage, offset=self.rows).items():
+            self._positions[name].append(group_positions)
+        self._counts.append(completeness)
+        self.rows += len(completeness)
+
+    def group_counts(self):
+        """Rows assigned to each group so far"""
+        return {name: int(sum(len(p) for p in parts)) for name, parts in self._positions.items()}
+
+    def arrays(self):
+        """Return (completeness, positions): per-row feature counts and each group's row positions"""
+        completeness = np.concatenate(self._counts) if self._counts else np.array([], dtype=int)
+        positions = {
+            name: np.concatenate(parts) if parts else np.array([], dtype=int)
+            for name, parts in self._positions.items()
+        }
+        return completeness, positions
+
+    def finish(self, df):
+        """Return (groups, completeness_percentage) for the assembled dataset"""
+        completeness, positions = self.arrays()
+        groups = build_completeness_groups(df, completeness, positions)
+        return groups, groups.completeness_percentage
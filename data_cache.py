@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk caches of parsed uploads and analysis results for Company Risk Analysis System
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+CACHE_FORMAT_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sheet_digest(digest, sheet_names=None):
+    """Digest identifying a selection of workbook sheets; the file digest itself for the default sheet"""
+    if not sheet_names:
+        return digest
+    selection = sheet_names if sheet_names == '*' else '\x00'.join(sheet_names)
+    return hashlib.sha256(f'{digest}:{selection}'.encode('utf-8')).hexdigest()
+
+
+class _DiskCache:
+    """Size-bounded LRU cache of files in one directory
+
+    Recency is tracked through the file modification time, which keeps the
+    LRU order consistent across processes sharing the same cache directory.
+    Subclasses define the entry suffix and how values are read and written.
+    """
+
+    suffix = ''
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        """Whether caching is possible in this environment"""
+        return self.max_bytes > 0
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.v{CACHE_FORMAT_VERSION}{self.suffix}')
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _touch(self, path):
+        # Touch the entry so it becomes the most recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._count('evictions')
+
+    def stats(self):
+        """Return cache counters and current disk usage"""
+        entries = self._entries() if self.enabled else []
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'skipped': self.skipped,
+                'entries': len(entries),
+                'size_bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+            }
+
+
+class ParsedFileCache(_DiskCache):
+    """Size-bounded LRU cache of parsed DataFrames stored as Arrow IPC files
+
+    Entries are keyed by the content hash of the uploaded file, so re-uploading
+    the same workbook skips parsing entirely.
+    """
+
+    suffix = '.arrow'
+
+    def get(self, key):
+        """Return the cached DataFrame for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._entry_path(key)
+        try:
+            table = feather.read_table(path, memory_map=True)
+            df = table.to_pandas()
+        except (FileNotFoundError, OSError, pa.ArrowException):
+            self._count('misses')
+            return None
+        self._touch(path)
+        self._count('hits')
+        return df
+
+    def put(self, key, df):
+        """Store a DataFrame under key and evict old entries if needed"""
+        if not self.enabled:
+            return False
+        # Arrow stores column names as strings; skip frames that would not
+        # round-trip unchanged rather than returning altered headers later.
+        if not all(isinstance(col, str) for col in df.columns):
+            self._count('skipped')
+            return False
+        path = self._entry_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            feather.write_feather(table, tmp_path, compression='uncompressed')
+            os.replace(tmp_path, path)
+        except (pa.ArrowException, OSError, ValueError, TypeError) as e:
+            print(f"Skipping parse cache for {key[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._count('skipped')
+            return False
+        self.evict()
+        return True
+
+
+class ResultCache(_DiskCache):
+    """Size-bounded LRU cache of pickled analysis results
+
+    Used to memoize clustering results so repeating a request with the same
+    dataset, group and parameters does not refit the model. Any process
+    sharing the cache directory sees the same entries.
+    """
+
+    suffix = '.pkl'
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (FileNotFoundError, OSError, EOFError, pickle.UnpicklingError):
+            self._count('misses')
+            return None
+        self._touch(path)
+        self._count('hits')
+        return value
+
+    def put(self, key, value):
+        """Store a value under key and evict old entries if needed"""
+        if not self.enabled:
+            return False
+        path = self._entry_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError) as e:
+            print(f"Skipping result cache for {key[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._count('skipped')
+            return False
+        self.evict()
+        return True
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Shared on-disk dataset registry for Company Risk Analysis System
+"""
+
+import os
+import pickle
+import re
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from anomaly_index import AnomalyIndex
+from columnar import COLUMNAR_BLOCK_BYTES, stream_csv_to_arrow, write_column_files
+from completeness import COMPLETENESS_GROUPS, CompletenessGroups
+from model_store import ClusterModels
+
+DATASET_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+STORE_FORMAT_VERSION = 1
+
+
+class Dataset:
+    """A loaded dataset: the frame, its completeness groups and its profile"""
+
+    def __init__(self, dataset_id, df, groups, profile, digest=None, path=None, model_store=None):
+        self.dataset_id = dataset_id
+        self.df = df
+        self.groups = groups
+        self.profile = profile
+        self.digest = digest
+        self.path = path
+        self.model_store = model_store
+        self._anomaly_index = None
+        self._cluster_models = None
+
+    @property
+    def cluster_models(self):
+        """Fitted cluster models of this dataset's groups, kept in the model store by cache_key"""
+        if self._cluster_models is None:
+            self._cluster_models = ClusterModels(self.model_store, self.cache_key)
+        return self._cluster_models
+
+    @property
+    def anomaly_index(self):
+        """Per-feature anomaly bounds, built on first use and kept with the dataset"""
+        if self._anomaly_index is None:
+            index_dir = os.path.join(self.path, 'anomaly_index') if self.path else None
+            self._anomaly_index = AnomalyIndex(self.df, index_dir)
+        return self._anomaly_index
+
+    @property
+    def cache_key(self):
+        """Key for results derived from this data: the source file digest if known"""
+        return self.digest or self.dataset_id
+
+
+def _column_to_arrow(series):
+    """Convert a column to Arrow, keeping NaN as a value for NumPy numerics
+
+    Plain NumPy numeric columns are stored without a validity bitmap so they
+    can be read back as zero-copy views of the memory-mapped file.
+    """
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'iuf':
+        return pa.array(series.to_numpy())
+    return pa.Array.from_pandas(series)
+
+
+def _column_from_arrow(column, arrow_string):
+    if arrow_string:
+        return pd.arrays.ArrowStringArray(column)
+    return column.to_pandas()
+
+
+class DatasetStore:
+    """Registry of uploaded datasets keyed by dataset ID
+
+    Each dataset is written once to its own directory: the frame as an
+    uncompressed Arrow IPC file (one per column for CSV files streamed in
+    with create_from_csv()), the completeness groups as .npy arrays and
+    the profile as a pickle. Any worker process can open a dataset by ID;
+    the Arrow file is memory-mapped, so numeric columns are zero-copy views
+    backed by the shared OS page cache rather than per-worker heap copies.
+    Frames that Arrow cannot represent (e.g. mixed-type object columns) are
+    pickled instead.
+
+    Each process keeps up to max_open recently used datasets open, and the
+    store evicts the least recently used datasets once it exceeds max_bytes
+    (never, when max_bytes is None). Fitted models of the datasets are kept
+    in model_store, if given, so they outlive the datasets themselves.
+    """
+
+    def __init__(self, root_dir, max_bytes, max_open=4, model_store=None):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self.max_open = max_open
+        self.model_store = model_store
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _dataset_dir(self, dataset_id):
+        return os.path.join(self.root_dir, dataset_id)
+
+    def create(self, df, groups, profile, digest=None):
+        """Persist a dataset and return it reopened from the store
+
+        digest identifies the source file contents, so results cached for one
+        upload can be reused when the same file is uploaded again.
+        """
+        dataset_id = uuid.uuid4().hex
+        final_dir = self._dataset_dir(dataset_id)
+        tmp_dir = f'{final_dir}.tmp'
+        os.makedirs(tmp_dir)
+        try:
+            self._write(tmp_dir, df, groups, profile, digest)
+            os.replace(tmp_dir, final_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.evict(keep=dataset_id)
+        return self.get(dataset_id)
+
+    def _write(self, path, df, groups, profile, digest=None):
+        meta = {
+            'version': STORE_FORMAT_VERSION,
+            'columns': list(df.columns),
+            'index': df.index,
+            'arrow_strings': [],
+            'format': 'arrow',
+            'digest': digest
+        }
+        try:
+            arrays = [_column_to_arrow(df[col]) for col in df.columns]
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            print(f"Storing dataset as pickle, Arrow conversion failed: {e}")
+            meta['format'] = 'pickle'
+            df.to_pickle(os.path.join(path, 'data.pkl'))
+        else:
+            meta['arrow_strings'] = [i for i, col in enumerate(df.columns)
+                                     if isinstance(df[col].dtype, pd.StringDtype)
+                                     and df[col].dtype.storage == 'pyarrow']
+            # Positional field names; the original labels are kept in meta
+            table = pa.Table.from_arrays(arrays, names=[str(i) for i in range(len(arrays))])
+            with pa.OSFile(os.path.join(path, 'data.arrow'), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+        self._write_groups(path, groups.completeness, {
+            name: groups[name].positions if name in groups else np.array([], dtype=int)
+            for name, _, _ in COMPLETENESS_GROUPS
+        })
+        with open(os.path.join(path, 'profile.pkl'), 'wb') as f:
+            pickle.dump(profile, f)
+        with open(os.path.join(path, 'meta.pkl'), 'wb') as f:
+            pickle.dump(meta, f)
+
+    def create_from_csv(self, source, build_profile, digest=None, block_size=COLUMNAR_BLOCK_BYTES,
+                        on_progress=None):
+        """Stream a CSV file or binary stream into the store without loading it as a DataFrame
+
+        The file is converted to an Arrow file batch by batch and grouped by
+        completeness as it is read, then split into contiguous per-column
+        files (see columnar.write_column_files); the frame is opened
+        memory-mapped and build_profile(df, completeness_percentage) computes
+        the profile from it. Text columns become Arrow-backed strings.
+        digest may be a callable, called once the source has been read, for
+        streams that are hashed as they are received.
+        Raises ValueError for files with no rows or fewer than two columns,
+        and pyarrow.ArrowInvalid when a later block does not fit the column
+        types of the first, e.g. text in a numeric column; integer columns
+        are read as float64, so later decimals or missing values do fit.
+        """
+        dataset_id = uuid.uuid4().hex
+        final_dir = self._dataset_dir(dataset_id)
+        tmp_dir = f'{final_dir}.tmp'
+        os.makedirs(tmp_dir)
+        try:
+            batches_path = os.path.join(tmp_dir, 'batches.arrow')
+            columns, string_columns, accumulator = stream_csv_to_arrow(source, batches_path, block_size, on_progress)
+            if accumulator.rows == 0 or len(columns) < 2:
+                raise ValueError('File must contain data rows and at least 2 columns')
+            write_column_files(batches_path, os.path.join(tmp_dir, 'columns'))
+            os.remove(batches_path)
+            meta = {
+                'version': STORE_FORMAT_VERSION,
+                'columns': columns,
+                'index': pd.RangeIndex(accumulator.rows),
+                'arrow_strings': string_columns,
+                'format': 'arrow_columns',
+                'digest': digest() if callable(digest) else digest
+            }
+            completeness, positions = accumulator.arrays()
+            self._write_groups(tmp_dir, completeness, positions)
+
+            df = self._read_frame(tmp_dir, meta)
+            groups = CompletenessGroups(df, completeness, positions)
+            profile = build_profile(df, groups.completeness_percentage)
+            del df, groups
+            with open(os.path.join(tmp_dir, 'profile.pkl'), 'wb') as f:
+                pickle.dump(profile, f)
+            with open(os.path.join(tmp_dir, 'meta.pkl'), 'wb') as f:
+                pickle.dump(meta, f)
+            os.replace(tmp_dir, final_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.evict(keep=dataset_id)
+        return self.get(dataset_id)
+
+    def _write_groups(self, path, completeness, positions):
+        np.save(os.path.join(path, 'completeness.npy'), completeness)
+        for name, _, _ in COMPLETENESS_GROUPS:
+            np.save(os.path.join(path, f'positions_{name}.npy'), positions[name])
+
+    def _read_frame(self, path, meta):
+        if meta['format'] in ('arrow', 'arrow_columns'):
+            if meta['format'] == 'arrow':
+                source = pa.memory_map(os.path.join(path, 'data.arrow'), 'r')
+                table = pa.ipc.open_file(source).read_all()
+                arrow_columns = [table.column(i) for i in range(table.num_columns)]
+            else:
+                arrow_columns = [pa.ipc.open_file(pa.memory_map(os.path.join(path, 'columns', f'{i}.arrow'), 'r'))
+                                 .read_all().column(0) for i in range(len(meta['columns']))]
+            arrow_strings = set(meta['arrow_strings'])
+            columns = {i: _column_from_arrow(column, i in arrow_strings) for i, column in enumerate(arrow_columns)}
+            df = pd.DataFrame(columns, copy=False)
+            df.columns = pd.Index(meta['columns'])
+            df.index = meta['index']
+            return df
+        return pd.read_pickle(os.path.join(path, 'data.pkl'))
+
+    def _read(self, dataset_id):
+        path = self._dataset_dir(dataset_id)
+        with open(os.path.join(path, 'meta.pkl'), 'rb') as f:
+            meta = pickle.load(f)
+        df = self._read_frame(path, meta)
+
+        completeness = np.load(os.path.join(path, 'completeness.npy'), mmap_mode='r')
+        positions = {name: np.load(os.path.join(path, f'positions_{name}.npy'), mmap_mode='r')
+                     for name, _, _ in COMPLETENESS_GROUPS}
+        groups = CompletenessGroups(df, completeness, positions)
+        with open(os.path.join(path, 'profile.pkl'), 'rb') as f:
+            profile = pickle.load(f)
+        return Dataset(dataset_id, df, groups, profile, meta.get('digest'), path, self.model_store)
+
+    def get(self, dataset_id):
+        """Return the dataset with this ID, or None if it does not exist"""
+        if not dataset_id or not DATASET_ID_PATTERN.match(dataset_id):
+            return None
+        with self._lock:
+            dataset = self._open.get(dataset_id)
+            if dataset is not None:
+                self._open.move_to_end(dataset_id)
+        if dataset is None:
+            try:
+                dataset = self._read(dataset_id)
+            except (FileNotFoundError, OSError, EOFError, pickle.UnpicklingError):
+                return None
+            with self._lock:
+                self._open[dataset_id] = dataset
+                while len(self._open) > self.max_open:
+                    self._open.popitem(last=False)
+        # Touch the dataset so eviction treats it as recently used
+        try:
+            os.utime(self._dataset_dir(dataset_id))
+        except OSError:
+            pass
+        return dataset
+
+    def delete(self, dataset_id):
+        """Remove a dataset from the store"""
+        with self._lock:
+            self._open.pop(dataset_id, None)
+        shutil.rmtree(self._dataset_dir(dataset_id), ignore_errors=True)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root_dir):
+            if not DATASET_ID_PATTERN.match(name):
+                continue
+            path = self._dataset_dir(name)
+            try:
+                mtime = os.stat(path).st_mtime
+                # Includes files added later, such as the anomaly index
+                size = sum(os.path.getsize(os.path.join(root, name))
+                           for root, _, names in os.walk(path) for name in names)
+            except OSError:
+                continue
+            entries.append((mtime, size, name))
+        return entries
+
+    def evict(self, keep=None):
+        """Delete least recently used datasets until the store fits max_bytes"""
+        if self.max_bytes is None:
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, dataset_id in entries:
+            if total <= self.max_bytes:
+                break
+            if dataset_id == keep:
+                continue
+            self.delete(dataset_id)
+            total -= size
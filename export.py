@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Labelled dataset export for Company Risk Analysis System
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from analysis import group_cluster_model, scan_anomalies
+from completeness import COMPLETENESS_GROUPS
+from responses import ARROW_STREAM_MIMETYPE
+
+EXPORT_FORMATS = {
+    'arrow': (ARROW_STREAM_MIMETYPE, 'arrow'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+# Rows converted to Arrow and written at a time; also the Parquet row group size
+EXPORT_CHUNK_ROWS = 64 * 1024
+
+
+class DatasetLabels:
+    """Per-row labels of a dataset, kept in compact form until export
+
+    cluster holds each row's cluster within its completeness group (-1 when
+    the group could not be clustered), from the group's stored ClusterModel
+    when the dataset has one. Outliers are kept as the sparse
+    (row, feature) coordinates from scan_anomalies(), sorted by row, and are
+    expanded into one boolean column per feature a chunk at a time.
+    """
+
+    def __init__(self, dataset, n_clusters=3, engine='auto', multiplier=1.5, progress=None):
+        df = dataset.df
+        groups = dataset.groups
+
+        self.completeness_percentage = groups.completeness_percentage.to_numpy()
+        self.group = np.full(len(df), -1, dtype=np.int8)
+        self.cluster = np.full(len(df), -1, dtype=np.int16)
+        group_names = [name for name, _, _ in COMPLETENESS_GROUPS]
+        for done, name in enumerate(groups):
+            if progress is not None:
+                progress(done / (len(groups) + 1), f'Clustering {name}')
+            positions = groups[name].positions
+            self.group[positions] = group_names.index(name)
+            model = group_cluster_model(groups.materialize(name), name, n_clusters, engine,
+                                        models=dataset.cluster_models)
+            if model is not None:
+                self.cluster[positions] = model.labels
+
+        if progress is not None:
+            progress(len(groups) / (len(groups) + 1), 'Scanning for outliers')
+        self.features = list(dataset.profile.non_binary_features)
+        _, rows, cols = scan_anomalies(df, self.features, multiplier)
+        order = np.argsort(rows, kind='stable')
+        self._outlier_rows = rows[order]
+        self._outlier_cols = cols[order]
+        self.group_names = group_names
+
+    def column_names(self):
+        """Names of the label columns, in the order chunk_columns() returns them"""
+        return (['completeness_percentage', 'completeness_group', 'cluster', 'outlier_count']
+                + [f'outlier_{feature}' for feature in self.features])
+
+    def chunk_columns(self, start, stop):
+        """Label columns for rows start to stop, as a dict of name -> values"""
+        cluster = self.cluster[start:stop]
+        columns = {
+            'completeness_percentage': self.completeness_percentage[start:stop],
+            'completeness_group': pd.Categorical.from_codes(self.group[start:stop], self.group_names),
+            'cluster': pd.arrays.IntegerArray(cluster, cluster < 0),
+        }
+
+        lo, hi = np.searchsorted(self._outlier_rows, [start, stop])
+        flags = np.zeros((stop - start, len(self.features)), dtype=bool)
+        flags[self._outlier_rows[lo:hi] - start, self._outlier_cols[lo:hi]] = True
+        columns['outlier_count'] = flags.sum(axis=1)
+        for position, feature in enumerate(self.features):
+            columns[f'outlier_{feature}'] = flags[:, position]
+        return columns
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects what Arrow writes until it is drained"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _text_columns(df):
+    # Object columns that are not plain strings are exported as their text form,
+    # so every chunk converts to the same Arrow type
+    return [col for col in df.columns
+            if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ('string', 'empty')]
+
+
+def _label_names(df, labels):
+    # A label column whose name the data already uses gets a numbered suffix,
+    # so no data column is overwritten
+    taken = {str(col) for col in df.columns}
+    names = {}
+    for name in labels.column_names():
+        unique_name, suffix = name, 1
+        while unique_name in taken:
+            unique_name = f'{name}_{suffix}'
+            suffix += 1
+        taken.add(unique_name)
+        names[name] = unique_name
+    return names
+
+
+def _export_chunk(df, labels, start, stop, text_columns, label_names):
+    chunk = df.iloc[start:stop]
+    if text_columns:
+        chunk = chunk.copy()
+    for col in text_columns:
+        chunk[col] = chunk[col].where(chunk[col].isna(), chunk[col].astype(str))
+    label_columns = {label_names[name]: values for name, values in labels.chunk_columns(start, stop).items()}
+    return chunk.rename(columns=str).assign(**label_columns)
+
+
+def _export_schema(chunk):
+    schema = pa.Schema.from_pandas(chunk, preserve_index=True)
+    # A column that is empty in the first chunk must still take later values
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+
+def export_batches(df, labels, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield the labelled dataset as Arrow record batches of up to chunk_rows rows
+
+    Every batch has the same schema: the original columns and index, then
+    completeness_percentage, completeness_group, cluster, outlier_count and
+    an outlier_<feature> flag for each scanned feature. A label column whose
+    name is already a column of df is exported as <name>_1 (or the next
+    free number) instead.
+    """
+    text_columns = _text_columns(df)
+    label_names = _label_names(df, labels)
+    schema = None
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = _export_chunk(df, labels, start, min(start + chunk_rows, len(df)), text_columns, label_names)
+        if schema is None:
+            schema = _export_schema(chunk)
+        yield pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=True)
+
+
+def stream_export(df, labels, export_format='arrow', chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield the labelled dataset as an Arrow IPC stream or Parquet file, chunk by chunk
+
+    Only one chunk is converted and held in memory at a time, so the response
+    can start before the whole dataset has been written.
+    """
+    sink = _ChunkSink()
+    writer = None
+    closed = False
+    try:
+        for batch in export_batches(df, labels, chunk_rows):
+            if writer is None:
+                if export_format == 'parquet':
+                    writer = pq.ParquetWriter(sink, batch.schema)
+                else:
+                    writer = pa.ipc.new_stream(sink, batch.schema)
+            if export_format == 'parquet':
+                writer.write_table(pa.Table.from_batches([batch]), row_group_size=chunk_rows)
+            else:
+                writer.write_batch(batch)
+            yield sink.drain()
+        writer.close()
+        closed = True
+        yield sink.drain()
+    finally:
+        # Close the writer now rather than leaving it to the garbage collector
+        # when the client disconnects mid-stream
+        if writer is not None and not closed:
+            writer.close()
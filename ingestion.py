@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+File ingestion and load-time dtype optimization for Company Risk Analysis System
+"""
+
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from completeness import CompletenessAccumulator
+from instrumentation import collect_stages, record_stages, stage
+
+ARROW_STRING_DTYPE = pd.StringDtype('pyarrow')
+
+# Text columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Leading bytes of each workbook format and the pandas engine that reads it
+EXCEL_SIGNATURES = [
+    (b'PK\x03\x04', 'xlsx'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'xls'),
+]
+EXCEL_ENGINES = {'xlsx': 'openpyxl', 'xls': 'xlrd'}
+# Column added when several sheets are concatenated, naming each row's sheet
+SOURCE_SHEET_COLUMN = 'source_sheet'
+
+
+def sniff_file_format(file_path):
+    """Return 'xlsx', 'xls' or 'csv' from a file's leading bytes, whatever its extension"""
+    with open(file_path, 'rb') as f:
+        head = f.read(8)
+    for signature, file_format in EXCEL_SIGNATURES:
+        if head.startswith(signature):
+            return file_format
+    return 'csv'
+
+
+def _parse_sheet(workbook, sheet_name):
+    with stage('sheet_parse'):
+        return workbook.parse(sheet_name)
+
+
+def _read_sheet(file_path, sheet_name, engine):
+    # Runs in a worker process, so it opens the workbook itself and sends its stage timing back
+    with pd.ExcelFile(file_path, engine=engine) as workbook:
+        return collect_stages(_parse_sheet, workbook, sheet_name)
+
+
+def read_excel_sheets(file_path, sheet_names=None, max_workers=None, file_format=None):
+    """Read sheets of a workbook, in parallel when there are several
+
+    sheet_names defaults to the first sheet; '*' reads every sheet. Each
+    sheet is parsed in its own worker process (up to max_workers, default
+    one per CPU), and the sheets are concatenated in the order given with a
+    SOURCE_SHEET_COLUMN naming each row's sheet. A single sheet is read in
+    this process and returned as is. file_format, if already sniffed, saves
+    reading the file's signature again. Raises ValueError for unknown sheets.
+
+    The workbook is opened once for its sheet names and the sheets read in
+    this process are parsed from that same handle. Returns (df, available),
+    available being every sheet name in workbook order, so callers need not
+    open the workbook again to list them.
+    """
+    engine = EXCEL_ENGINES[file_format or sniff_file_format(file_path)]
+    with pd.ExcelFile(file_path, engine=engine) as workbook:
+        available = list(workbook.sheet_names)
+        if not sheet_names:
+            sheet_names = available[:1]
+        elif sheet_names == '*':
+            sheet_names = available
+        unknown = [name for name in sheet_names if name not in available]
+        if unknown:
+            raise ValueError(f"Sheets not in the workbook: {', '.join(unknown)}")
+
+        workers = min(len(sheet_names), max_workers or os.cpu_count() or 1)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_read_sheet, file_path, name, engine) for name in sheet_names]
+                results = []
+                for future in futures:
+                    df, stages = future.result()
+                    record_stages(stages)
+                    results.append(df)
+        else:
+            results = [_parse_sheet(workbook, name) for name in sheet_names]
+
+    if len(results) == 1:
+        return results[0], available
+    frames = [df.assign(**{SOURCE_SHEET_COLUMN: name}) for name, df in zip(sheet_names, results)]
+    return pd.concat(frames, ignore_index=True), available
+
+
+class UploadStream(io.RawIOBase):
+    """Readable request body that hashes and counts its bytes as they are read
+
+    Lets a CSV upload be parsed straight from the request while still
+    getting the same content digest as file_digest() of the saved file.
+    total_bytes is the body length when the client sent one, else None.
+    While spool is set to a binary file, every byte read is also written to
+    it, so the body can be parsed again if the first attempt fails.
+    """
+
+    def __init__(self, stream, total_bytes=None):
+        super().__init__()
+        self._stream = stream
+        self._digest = hashlib.sha256()
+        self._position = 0
+        self.total_bytes = total_bytes
+        self.spool = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self._digest.update(data)
+        if self.spool is not None:
+            self.spool.write(data)
+        self._position += size
+        return size
+
+    def tell(self):
+        return self._position
+
+    def hexdigest(self):
+        """SHA-256 hex digest of the whole body, reading whatever the parser left unread"""
+        while self.read(1024 * 1024):
+            pass
+        return self._digest.hexdigest()
+
+
+@contextmanager
+def open_source(source):
+    """Yield (binary file, total_bytes) for a file path or an already open binary stream
+
+    total_bytes is the file size, or a stream's total_bytes attribute (None
+    when unknown). Streams are left open.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield f, os.path.getsize(source)
+    else:
+        yield source, getattr(source, 'total_bytes', None)
+
+
+def read_csv_in_chunks(source, chunksize, on_progress=None, **read_csv_kwargs):
+    """Yield a CSV file or binary stream as DataFrames of at most chunksize rows
+
+    on_progress(rows_read, bytes_read, total_bytes) is called after every
+    chunk. bytes_read is the reader's position, so it runs slightly ahead
+    of the rows returned so far because the parser buffers its input.
+    total_bytes is None for streams of unknown length.
+    """
+    rows_read = 0
+    with open_source(source) as (f, total_bytes):
+        for chunk in pd.read_csv(f, chunksize=chunksize, **read_csv_kwargs):
+            rows_read += len(chunk)
+            if on_progress is not None:
+                bytes_read = f.tell() if total_bytes is None else min(f.tell(), total_bytes)
+                on_progress(rows_read, bytes_read, total_bytes)
+            yield chunk
+
+
+def load_csv_chunked(source, chunksize, on_progress=None, prepare=None, sketch=None):
+    """Load a CSV file or binary stream in row blocks, grouping companies by completeness as it goes
+
+    Returns (df, groups, completeness_percentage) like loading the file and
+    calling analyze_data_completeness(). Rows keep a continuous RangeIndex
+    across chunks. prepare(df), if given, is applied to the assembled frame
+    before the groups are attached to it; it must not change which values
+    are missing. sketch, a profiling.FrameSketch, is updated with every
+    chunk, so an approximate profile needs no further pass over the data.
+    """
+    accumulator = CompletenessAccumulator()
+    chunks = []
+    for chunk in read_csv_in_chunks(source, chunksize, on_progress):
+        accumulator.add(chunk)
+        if sketch is not None:
+            sketch.update(chunk)
+        chunks.append(chunk)
+
+    if not chunks:
+        return pd.DataFrame(), {}, pd.Series(dtype=float)
+
+    df = pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+    del chunks
+    if prepare is not None:
+        df = prepare(df)
+    groups, completeness_percentage = accumulator.finish(df)
+    return df, groups, completeness_percentage
+
+
+def _compact_series(series, use_arrow_strings=True):
+    """Return series in the smallest dtype that holds the same values"""
+    dtype = series.dtype
+    if not isinstance(dtype, np.dtype):
+        return series
+    if dtype.kind == 'i':
+        return pd.to_numeric(series, downcast='integer')
+    if dtype.kind == 'f' and dtype.itemsize > 4:
+        compact = series.astype('float32')
+        # Only keep float32 when every value survives the round trip exactly
+        if np.array_equal(compact.to_numpy(dtype='float64'), series.to_numpy(), equal_nan=True):
+            return compact
+        return series
+    if dtype.kind == 'O' and pd.api.types.infer_dtype(series, skipna=True) == 'string':
+        non_null = series.notna().sum()
+        if non_null and series.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * non_null:
+            return series.astype('category')
+        if use_arrow_strings:
+            return series.astype(ARROW_STRING_DTYPE)
+    return series
+
+
+def optimize_dtypes(df, use_arrow_strings=True):
+    """Downcast numerics and encode repeated text to reduce memory
+
+    Integers are downcast to the smallest signed type that fits, floats to
+    float32 only when that is lossless, low-cardinality text columns become
+    categoricals and other text columns become Arrow-backed strings. A
+    column keeps its original dtype when the compact one would not actually
+    use less memory. Missing values stay missing.
+
+    Returns (optimized_df, memory_report) where memory_report lists the
+    dtype and memory use of every column before and after.
+    """
+    columns = {}
+    memory_report = []
+    for col in df.columns:
+        series = df[col]
+        bytes_before = int(series.memory_usage(deep=True, index=False))
+        compact = _compact_series(series, use_arrow_strings)
+        bytes_after = int(compact.memory_usage(deep=True, index=False))
+        if bytes_after >= bytes_before:
+            compact, bytes_after = series, bytes_before
+        columns[col] = compact
+        memory_report.append({
+            'name': col,
+            'dtype_before': str(series.dtype),
+            'dtype_after': str(compact.dtype),
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after
+        })
+    return pd.DataFrame(columns, index=df.index), memory_report
+
+
+def append_rows(df, rows):
+    """Return df with rows appended, aligned to df's columns
+
+    Columns missing from rows are left empty; columns that df does not have
+    raise ValueError, since they would change every row's completeness.
+    A default RangeIndex continues after the existing rows.
+    """
+    # Headers such as years may be parsed as numbers in one file and text in another
+    labels = {str(col): col for col in df.columns}
+    unknown = [col for col in rows.columns if str(col) not in labels]
+    if unknown:
+        raise ValueError(f"Columns not in the current dataset: {', '.join(map(str, unknown))}")
+    rows = rows.rename(columns=lambda col: labels[str(col)]).reindex(columns=df.columns)
+    return pd.concat([df, rows], ignore_index=isinstance(df.index, pd.RangeIndex))
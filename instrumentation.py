@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Stage timing, memory and request metrics for Company Risk Analysis System
+"""
+
+import contextvars
+import os
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds; +Inf is always added
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MEMORY_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(10))  # 64KB to 16GB
+METRIC_PREFIX = 'company_risk'
+
+# Stages recorded during the current request, when one is being tracked
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+# Enclosing stages' memory frames, innermost last
+_memory_frames = contextvars.ContextVar('memory_frames', default=())
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus data model, one series per label set"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Record one observation for the given label values"""
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """Lines of this histogram in the Prometheus text exposition format"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            labels = [f'{name}="{_escape_label(value)}"' for name, value in zip(self.label_names, key)]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = ','.join(labels + [f'le="{_format_value(bound)}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            label_text = '{' + ','.join(labels) + '}' if labels else ''
+            lines.append(f'{self.name}_sum{label_text} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Request and stage histograms of this process"""
+
+    def __init__(self, prefix=METRIC_PREFIX):
+        self.request_seconds = Histogram(
+            f'{prefix}_request_duration_seconds', 'Time to build a response, by endpoint.',
+            ['endpoint', 'method', 'status'], DURATION_BUCKETS)
+        self.stage_seconds = Histogram(
+            f'{prefix}_stage_duration_seconds', 'Time spent in each pipeline stage.',
+            ['stage'], DURATION_BUCKETS)
+        self.stage_peak_bytes = Histogram(
+            f'{prefix}_stage_peak_memory_bytes', 'Peak traced memory above the level at stage start.',
+            ['stage'], MEMORY_BUCKETS)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for histogram in (self.request_seconds, self.stage_seconds, self.stage_peak_bytes):
+            lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage and record it in the metrics and the current request
+
+    While tracemalloc is tracing, the stage's peak memory above the level at
+    its start is recorded as well. Nested stages each get their own peak.
+    tracemalloc is process-wide, so peaks overlap when requests run
+    concurrently in threads.
+    """
+    frames = None
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        frames = _memory_frames.get()
+        # reset_peak() below forgets the enclosing stages' peak so far, so keep it for them
+        for frame in frames:
+            frame[1] = max(frame[1], peak)
+        frame = [current, 0]
+        token = _memory_frames.set(frames + (frame,))
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        peak_bytes = None
+        if frames is not None:
+            _memory_frames.reset(token)
+            if tracemalloc.is_tracing():
+                peak_bytes = max(frame[1], tracemalloc.get_traced_memory()[1]) - frame[0]
+                metrics.stage_peak_bytes.observe(max(peak_bytes, 0), stage=name)
+        metrics.stage_seconds.observe(seconds, stage=name)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, seconds, peak_bytes))
+
+
+def begin_request():
+    """Start collecting the stages of the current request; returns a token for end_request()"""
+    return _request_stages.set([])
+
+
+def end_request(token):
+    """Stop collecting stages and return them as (name, seconds, peak_bytes) tuples"""
+    stages = _request_stages.get() or []
+    _request_stages.reset(token)
+    return stages
+
+
+def collect_stages(func, *args, **kwargs):
+    """Call func(*args, **kwargs) and return (result, stages) with the stages it ran
+
+    For work run in another process, whose metrics registry /metrics never
+    sees: the stages travel back with the result and are passed to
+    record_stages() in the web process.
+    """
+    token = begin_request()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        stages = end_request(token)
+    return result, stages
+
+
+def record_stages(stages):
+    """Record (name, seconds, peak_bytes) stages run elsewhere in this process's metrics"""
+    for name, seconds, peak_bytes in stages:
+        metrics.stage_seconds.observe(seconds, stage=name)
+        if peak_bytes is not None:
+            metrics.stage_peak_bytes.observe(max(peak_bytes, 0), stage=name)
+
+
+def server_timing_header(stages):
+    """Server-Timing header value listing each stage's duration in milliseconds"""
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds, _ in stages)
+
+
+def dump_profile(profiler, profile_dir, endpoint, seconds):
+    """Write a cProfile profile of a slow request and return its path"""
+    os.makedirs(profile_dir, exist_ok=True)
+    name = re.sub(r'[^\w.-]', '_', endpoint or 'unknown')
+    path = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{seconds * 1000:.0f}ms.prof")
+    profiler.dump_stats(path)
+    return path
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Background job runner for Company Risk Analysis System
+"""
+
+import json
+import os
+import pickle
+import re
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from instrumentation import begin_request, collect_stages, end_request, record_stages
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """Raised inside a task when its job has been cancelled"""
+
+
+def _state_path(state_dir, job_id):
+    return os.path.join(state_dir, f'{job_id}.json')
+
+
+def _result_path(state_dir, job_id):
+    return os.path.join(state_dir, f'{job_id}.result.pkl')
+
+
+def _cancel_path(state_dir, job_id):
+    return os.path.join(state_dir, f'{job_id}.cancel')
+
+
+def _read_state(state_dir, job_id):
+    try:
+        with open(_state_path(state_dir, job_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_state(state_dir, job_id, **changes):
+    state = _read_state(state_dir, job_id) or {'job_id': job_id}
+    state.update(changes, updated_at=time.time())
+    path = _state_path(state_dir, job_id)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+    return state
+
+
+def _execute(state_dir, job_id, func, args, kwargs):
+    """Run a task in a worker process, recording its state on disk
+
+    Returns the stages the task ran, as end_request() does, so that the
+    submitting process can record them in its metrics.
+    """
+    def progress(fraction, message=''):
+        if os.path.exists(_cancel_path(state_dir, job_id)):
+            raise JobCancelled()
+        _write_state(state_dir, job_id, progress=round(float(fraction), 3), message=message)
+
+    if os.path.exists(_cancel_path(state_dir, job_id)):
+        _write_state(state_dir, job_id, status='cancelled', message='Cancelled before start')
+        return []
+    _write_state(state_dir, job_id, status='running', started_at=time.time(), progress=0.0)
+    token = begin_request()
+    try:
+        result = func(*args, progress=progress, **kwargs)
+    except JobCancelled:
+        _write_state(state_dir, job_id, status='cancelled', message='Cancelled')
+    except Exception as e:
+        traceback.print_exc()
+        _write_state(state_dir, job_id, status='failed', error=str(e))
+    else:
+        with open(_result_path(state_dir, job_id), 'wb') as f:
+            pickle.dump(result, f)
+        _write_state(state_dir, job_id, status='done', progress=1.0, message='Finished',
+                     finished_at=time.time())
+    finally:
+        stages = end_request(token)
+    return stages
+
+
+class ProgressStore:
+    """Progress of file loads, keyed by an ID the client chose, kept as files in state_dir
+
+    Like job state, every web worker can update or report it, so an upload
+    handled by one worker can be polled through another and concurrent
+    uploads do not overwrite each other. IDs are 32 hex characters; others
+    are ignored.
+    """
+
+    def __init__(self, state_dir, max_age_seconds=3600):
+        self.state_dir = state_dir
+        self.max_age_seconds = max_age_seconds
+        os.makedirs(state_dir, exist_ok=True)
+
+    def start(self, progress_id):
+        """Reset the progress of a load that is about to begin"""
+        if not progress_id or not JOB_ID_PATTERN.match(progress_id):
+            return
+        self.cleanup()
+        try:
+            os.remove(_state_path(self.state_dir, progress_id))
+        except FileNotFoundError:
+            pass
+        _write_state(self.state_dir, progress_id, status='loading')
+
+    def update(self, progress_id, **changes):
+        """Merge changes into the progress of a load"""
+        if progress_id and JOB_ID_PATTERN.match(progress_id):
+            _write_state(self.state_dir, progress_id, **changes)
+
+    def get(self, progress_id):
+        """Return the progress of a load, or None"""
+        if not progress_id or not JOB_ID_PATTERN.match(progress_id):
+            return None
+        return _read_state(self.state_dir, progress_id)
+
+    def cleanup(self):
+        """Delete the progress of loads not updated for max_age_seconds"""
+        cutoff = time.time() - self.max_age_seconds
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+
+class JobRunner:
+    """Run long analyses in a local process pool and track them by job ID
+
+    Job state (status, progress, message) and results are kept as files in
+    state_dir rather than in memory, so any web worker can report on or
+    cancel a job submitted through another one. Tasks are module-level
+    functions that accept a progress(fraction, message) keyword argument;
+    calling it raises JobCancelled once the job has been cancelled. Stages
+    timed in the workers are recorded in this process's metrics when their
+    jobs finish.
+    """
+
+    def __init__(self, state_dir, max_workers=None, max_age_seconds=3600):
+        self.state_dir = state_dir
+        self.max_workers = max_workers
+        self.max_age_seconds = max_age_seconds
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _get_executor(self):
+        # Created on first use so importing the app does not start processes
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def submit(self, kind, func, *args, **kwargs):
+        """Queue func(*args, progress=..., **kwargs) and return its job ID"""
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        _write_state(self.state_dir, job_id, kind=kind, status='queued', progress=0.0,
+                     message='Queued', submitted_at=time.time())
+        future = self._get_executor().submit(_execute, self.state_dir, job_id, func, args, kwargs)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda done: self._finished(job_id, done))
+        return job_id
+
+    def run_all(self, func, calls):
+        """Run func(*args, **kwargs) for every (args, kwargs) in calls in the pool and wait for all of them
+
+        For requests that fan work out and answer with every result, so
+        nothing is recorded in state_dir and func is called without a
+        progress argument. Returns the results in the order of calls; if a
+        call raised, the first such exception is raised once all have
+        finished. A pool broken by a dying worker raises BrokenProcessPool
+        and is replaced on the next call.
+        """
+        executor = self._get_executor()
+        try:
+            futures = [executor.submit(collect_stages, func, *args, **kwargs) for args, kwargs in calls]
+            wait(futures)
+            results = []
+            for future in futures:
+                result, stages = future.result()
+                record_stages(stages)
+                results.append(result)
+            return results
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+
+    def complete(self, kind, result):
+        """Record a job whose result is already known and return its ID
+
+        Used when a result can be served without running anything, e.g. from
+        a cache, so clients still see the usual job flow.
+        """
+        job_id = uuid.uuid4().hex
+        with open(_result_path(self.state_dir, job_id), 'wb') as f:
+            pickle.dump(result, f)
+        now = time.time()
+        _write_state(self.state_dir, job_id, kind=kind, status='done', progress=1.0,
+                     message='Finished', submitted_at=now, finished_at=now)
+        return job_id
+
+    def _finished(self, job_id, future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        if not future.cancelled() and future.exception() is None:
+            record_stages(future.result())
+
+    def status(self, job_id, include_result=True):
+        """Return the job's state, with its result once done, or None
+
+        A job asked to stop reports 'Cancelling' until its worker records
+        that it has finished.
+        """
+        if not job_id or not JOB_ID_PATTERN.match(job_id):
+            return None
+        state = _read_state(self.state_dir, job_id)
+        if state is None:
+            return None
+        if state.get('status') not in FINISHED_STATES and os.path.exists(_cancel_path(self.state_dir, job_id)):
+            state['message'] = 'Cancelling'
+        if include_result and state.get('status') == 'done':
+            try:
+                with open(_result_path(self.state_dir, job_id), 'rb') as f:
+                    state['result'] = pickle.load(f)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                pass
+        return state
+
+    def cancel(self, job_id):
+        """Ask a job to stop; returns its state, or None for unknown jobs"""
+        state = self.status(job_id, include_result=False)
+        if state is None or state.get('status') in FINISHED_STATES:
+            return state
+        with open(_cancel_path(self.state_dir, job_id), 'w'):
+            pass
+        with self._lock:
+            future = self._futures.get(job_id)
+        # Jobs still waiting in this process's queue can be dropped right away;
+        # running ones stop at their next progress report. Only the worker
+        # writes the state of a running job, so the marker file is all that
+        # is left behind and a state the worker just finished is never undone
+        if future is not None and future.cancel():
+            return _write_state(self.state_dir, job_id, status='cancelled', message='Cancelled')
+        return self.status(job_id, include_result=False)
+
+    def cleanup(self):
+        """Delete files of jobs older than max_age_seconds"""
+        cutoff = time.time() - self.max_age_seconds
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
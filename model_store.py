@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Versioned store of fitted models and dataset profiles for Company Risk Analysis System
+"""
+
+import json
+import os
+import pickle
+import re
+import shutil
+import threading
+import time
+
+import sklearn
+
+# Bump when the pickled layout of stored objects changes so old entries are ignored
+MODEL_FORMAT_VERSION = 1
+# Versions kept per entry; older ones are deleted when a new version is saved
+MODEL_VERSIONS_KEPT = 5
+ENTRY_NAME_PATTERN = re.compile(r'^[\w.-]+$')
+# Entry names of ClusterModels start with this, keeping them apart from a dataset's other entries (e.g. its profile)
+CLUSTER_MODEL_PREFIX = 'cluster-'
+VERSION_FILE_PATTERN = re.compile(r'^v(\d+)\.json$')
+
+
+class ModelStore:
+    """Versioned on-disk store of fitted models and dataset profiles
+
+    Entries are grouped by dataset key (the source file digest, so uploading
+    the same file again finds them) and name. Every save adds a version: a
+    pickle plus a JSON file with its metadata, including the dataset key,
+    creation time and library versions. Nothing is read at startup; an
+    entry is loaded on first use and kept in memory until a newer version
+    appears on disk, so every process sharing the directory sees refits made
+    by the others. Versions written by another format or scikit-learn
+    version are skipped rather than unpickled.
+
+    Once the store exceeds max_bytes, the least recently used datasets'
+    entries are deleted (never, when max_bytes is None).
+    """
+
+    def __init__(self, root_dir, max_bytes=None, versions_kept=MODEL_VERSIONS_KEPT):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self.versions_kept = versions_kept
+        self._loaded = {}
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _dataset_dir(self, dataset_key):
+        return os.path.join(self.root_dir, dataset_key)
+
+    def _entry_dir(self, dataset_key, name):
+        if not ENTRY_NAME_PATTERN.match(str(dataset_key)) or not ENTRY_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid model store key {dataset_key}/{name}")
+        return os.path.join(self._dataset_dir(dataset_key), name)
+
+    def _version_numbers(self, entry_dir):
+        try:
+            names = os.listdir(entry_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(int(match.group(1)) for match in map(VERSION_FILE_PATTERN.match, names) if match)
+
+    def _read_metadata(self, entry_dir, version):
+        try:
+            with open(os.path.join(entry_dir, f'v{version}.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _compatible(metadata):
+        return (metadata is not None and metadata.get('format_version') == MODEL_FORMAT_VERSION
+                and metadata.get('sklearn_version') == sklearn.__version__)
+
+    def versions(self, dataset_key, name):
+        """Metadata of every stored version of an entry, oldest first"""
+        entry_dir = self._entry_dir(dataset_key, name)
+        versions = [self._read_metadata(entry_dir, version) for version in self._version_numbers(entry_dir)]
+        return [metadata for metadata in versions if metadata is not None]
+
+    def names(self, dataset_key):
+        """Names of the entries stored for a dataset"""
+        try:
+            return sorted(os.listdir(self._dataset_dir(dataset_key)))
+        except FileNotFoundError:
+            return []
+
+    def save(self, dataset_key, name, obj, metadata=None):
+        """Store obj as the newest version of an entry and return its version number"""
+        entry_dir = self._entry_dir(dataset_key, name)
+        os.makedirs(entry_dir, exist_ok=True)
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        # Claim the next free version number; another process may be saving too
+        version = (self._version_numbers(entry_dir) or [0])[-1] + 1
+        while True:
+            try:
+                fd = os.open(os.path.join(entry_dir, f'v{version}.pkl'), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+                break
+            except FileExistsError:
+                version += 1
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+        record = dict(metadata or {})
+        record.update({
+            'dataset_key': dataset_key,
+            'name': name,
+            'version': version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'format_version': MODEL_FORMAT_VERSION,
+            'sklearn_version': sklearn.__version__,
+            'bytes': len(data)
+        })
+        # The metadata file is what makes a version visible, so write it last
+        tmp_path = os.path.join(entry_dir, f'v{version}.json.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, default=str)
+        os.replace(tmp_path, os.path.join(entry_dir, f'v{version}.json'))
+        with self._lock:
+            self._loaded[(dataset_key, name)] = (version, obj)
+
+        self._prune(entry_dir)
+        self.evict(keep=dataset_key)
+        return version
+
+    def load(self, dataset_key, name, version=None):
+        """Return the newest compatible version of an entry (or the given version), or None"""
+        entry_dir = self._entry_dir(dataset_key, name)
+        candidates = [version] if version is not None else reversed(self._version_numbers(entry_dir))
+        for candidate in candidates:
+            with self._lock:
+                loaded = self._loaded.get((dataset_key, name))
+            if loaded is not None and loaded[0] == candidate:
+                return loaded[1]
+            if not self._compatible(self._read_metadata(entry_dir, candidate)):
+                continue
+            try:
+                with open(os.path.join(entry_dir, f'v{candidate}.pkl'), 'rb') as f:
+                    obj = pickle.load(f)
+            except (FileNotFoundError, OSError, EOFError, pickle.UnpicklingError):
+                continue
+            if version is None:
+                with self._lock:
+                    self._loaded[(dataset_key, name)] = (candidate, obj)
+            self._touch(dataset_key)
+            return obj
+        return None
+
+    def _touch(self, dataset_key):
+        # Eviction treats recently loaded datasets as recently used
+        try:
+            os.utime(self._dataset_dir(dataset_key))
+        except OSError:
+            pass
+
+    def _prune(self, entry_dir):
+        for version in self._version_numbers(entry_dir)[:-self.versions_kept]:
+            for suffix in ('json', 'pkl'):
+                try:
+                    os.remove(os.path.join(entry_dir, f'v{version}.{suffix}'))
+                except OSError:
+                    pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root_dir):
+            path = self._dataset_dir(name)
+            try:
+                mtime = os.stat(path).st_mtime
+                size = sum(os.path.getsize(os.path.join(root, file_name))
+                           for root, _, file_names in os.walk(path) for file_name in file_names)
+            except OSError:
+                continue
+            entries.append((mtime, size, name))
+        return entries
+
+    def evict(self, keep=None):
+        """Delete the entries of least recently used datasets until the store fits max_bytes"""
+        if self.max_bytes is None:
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, dataset_key in entries:
+            if total <= self.max_bytes:
+                break
+            if dataset_key == keep:
+                continue
+            shutil.rmtree(self._dataset_dir(dataset_key), ignore_errors=True)
+            with self._lock:
+                for key in [key for key in self._loaded if key[0] == dataset_key]:
+                    del self._loaded[key]
+            total -= size
+
+
+class ClusterModels:
+    """The ClusterModels of one dataset, stored by key in a ModelStore
+
+    Each put() saves a new version with the model's describe() output as
+    metadata, under the key prefixed with CLUSTER_MODEL_PREFIX. Without a
+    store, models are only kept in memory.
+    """
+
+    def __init__(self, store=None, dataset_key=None):
+        self.store = store
+        self.dataset_key = dataset_key
+        self._models = {}
+
+    def get(self, key):
+        """Return the newest model stored under key, or None"""
+        if self.store is None:
+            return self._models.get(key)
+        return self.store.load(self.dataset_key, CLUSTER_MODEL_PREFIX + key)
+
+    def put(self, key, model):
+        """Store a model under key as its newest version"""
+        if self.store is None:
+            self._models[key] = model
+            return
+        self.store.save(self.dataset_key, CLUSTER_MODEL_PREFIX + key, model, model.describe())
+
+    def keys(self):
+        """Keys of all stored models, without loading them"""
+        if self.store is None:
+            return list(self._models)
+        return [name[len(CLUSTER_MODEL_PREFIX):] for name in self.store.names(self.dataset_key)
+                if name.startswith(CLUSTER_MODEL_PREFIX)]
+
+    def items(self):
+        """All stored (key, model) pairs"""
+        if self.store is None:
+            return list(self._models.items())
+        items = []
+        for name in self.store.names(self.dataset_key):
+            if not name.startswith(CLUSTER_MODEL_PREFIX):
+                continue
+            key = name[len(CLUSTER_MODEL_PREFIX):]
+            model = self.get(key)
+            if model is not None:
+                items.append((key, model))
+        return items
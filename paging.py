@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Row pagination, column projection and sorting for Company Risk Analysis System
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from responses import frame_columns
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+@dataclass
+class PageRequest:
+    """Which rows and columns of a result to return"""
+    offset: int = 0
+    limit: int = DEFAULT_PAGE_SIZE
+    columns: Optional[List] = None
+    sort_by: Optional[object] = None
+    descending: bool = False
+    # 'records' (a dict per row), 'columns' (see frame_columns) or 'frame' (the DataFrame)
+    layout: str = 'records'
+
+
+def resolve_column(df, name):
+    """Return the column label matching name, also accepting labels given as text"""
+    if name in df.columns:
+        return name
+    # Query strings are text, but headers such as years may be numbers
+    for col in df.columns:
+        if str(col) == str(name):
+            return col
+    raise ValueError(f"Column {name} not found")
+
+
+def sorted_positions(series, descending=False):
+    """Row positions of series ordered by value, missing values last"""
+    order = series.reset_index(drop=True).sort_values(ascending=not descending, kind='stable',
+                                                      na_position='last')
+    return order.index.to_numpy()
+
+
+def _dataset_order(df, sort_by, descending, index):
+    # Numeric columns are already sorted in the anomaly index
+    feature = index.feature(sort_by) if index is not None else None
+    if feature is None:
+        return sorted_positions(df[sort_by], descending)
+    non_null = feature.descending_positions() if descending else feature.positions
+    missing = np.flatnonzero(df[sort_by].isna().to_numpy())
+    return np.concatenate([np.asarray(non_null), missing])
+
+
+def page_of_rows(df, page=None, positions=None, index=None):
+    """Return one page of df's rows as a JSON-ready dict
+
+    positions limits the rows to those row positions (all rows when None),
+    in the given order unless page.sort_by is set. With an AnomalyIndex,
+    sorting all rows by a numeric column reuses its sorted order instead of
+    sorting again. Without a page, every row and column is returned. The
+    rows are laid out as page.layout asks. Raises ValueError for unknown
+    columns.
+    """
+    page = page or PageRequest(limit=None)
+    columns = list(df.columns) if page.columns is None else [resolve_column(df, col) for col in page.columns]
+
+    if page.sort_by is not None:
+        sort_by = resolve_column(df, page.sort_by)
+        if positions is None:
+            positions = _dataset_order(df, sort_by, page.descending, index)
+        else:
+            positions = np.asarray(positions)
+            positions = positions[sorted_positions(df[sort_by].iloc[positions], page.descending)]
+    total = len(df) if positions is None else len(positions)
+
+    start = min(max(page.offset, 0), total)
+    stop = total if page.limit is None else min(start + page.limit, total)
+    page_positions = np.arange(start, stop) if positions is None else np.asarray(positions[start:stop])
+    rows = df.iloc[page_positions, df.columns.get_indexer(columns)]
+
+    if page.layout == 'columns':
+        layout = frame_columns(rows)
+    elif page.layout == 'frame':
+        layout = rows
+    else:
+        layout = rows.to_dict('records')
+
+    return {
+        'rows': layout,
+        'index': rows.index.tolist(),
+        'columns': columns,
+        'offset': start,
+        'limit': page.limit,
+        'total': total,
+        'next_offset': stop if stop < total else None
+    }
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+Dataset profiling for Company Risk Analysis System
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+from sketches import HLL_PRECISION, KLL_K, RESERVOIR_SIZE, HyperLogLog, QuantileSketch, Reservoir, hash_values
+
+COMPLETENESS_BINS = 10
+PROFILE_MODES = ('exact', 'approximate')
+# Quantiles reported for numeric columns
+PROFILE_QUANTILES = (0.25, 0.5, 0.75)
+# Rows folded into the sketches at a time when sketching an in-memory frame
+SKETCH_CHUNK_ROWS = 256 * 1024
+# Sampled values listed per column in the profile
+PROFILE_SAMPLE_VALUES = 5
+
+
+def _first_distinct_values(values, valid):
+    """Column-wise distinct count capped at 3 for a 2D numeric block
+
+    Rather than materializing every unique value, this finds the first
+    non-null value of each column, then the first value differing from it,
+    then checks whether any third value exists. Each step is one vectorized
+    comparison over the whole block.
+    """
+    n_cols = values.shape[1]
+    cols = np.arange(n_cols)
+    has_first = valid.any(axis=0)
+    first = values[valid.argmax(axis=0), cols]
+    differs = valid & (values != first)
+    has_second = differs.any(axis=0)
+    second = values[differs.argmax(axis=0), cols]
+    has_third = (differs & (values != second)).any(axis=0)
+    return has_first.astype(int) + has_second + has_third
+
+
+def _exact_distinct_values(values, valid):
+    """Column-wise exact distinct count for a 2D numeric block"""
+    # Hash-based unique is linear in the column length, unlike a sort
+    distinct = np.empty(values.shape[1], dtype=int)
+    for i in range(values.shape[1]):
+        column = values[:, i]
+        distinct[i] = len(pd.unique(column[valid[:, i]]))
+    return distinct
+
+
+def _object_distinct_values(values, cap):
+    """Distinct count of non-null object values, stopping early once cap is reached"""
+    seen = set()
+    start, size = 0, 64
+    while start < len(values):
+        seen.update(pd.unique(values[start:start + size]))
+        if len(seen) >= cap:
+            return cap
+        start += size
+        size *= 4
+    return len(seen)
+
+
+def column_kind(dtype):
+    """Classify a column dtype as 'numeric', 'text' or 'other'
+
+    Downcast numerics (int8, float32, ...) count as numeric and categorical or
+    Arrow-backed string columns count as text, so feature typing is the same
+    whether or not load-time dtype optimization ran.
+    """
+    if isinstance(dtype, np.dtype):
+        if dtype.kind in 'iuf':
+            return 'numeric'
+        if dtype.kind == 'O':
+            return 'text'
+        return 'other'
+    if isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype)):
+        return 'text'
+    return 'other'
+
+
+def compute_column_stats(df, unique_cap=None, quantiles=False):
+    """Null counts, distinct counts and numeric moments for every column
+
+    Numeric columns are processed as consolidated 2D NumPy blocks, one per
+    dtype, so each statistic is a single batched reduction instead of a
+    Python loop over columns. With unique_cap set (at most 3), distinct
+    counts stop at that value, which is all binary feature detection needs.
+    With quantiles set, numeric columns also get their exact quartiles,
+    which makes profiling about a quarter slower.
+    """
+    n_rows = len(df)
+    stats = {col: {'dtype': str(df[col].dtype), 'kind': column_kind(df[col].dtype)} for col in df.columns}
+
+    numeric_dtypes = {df[col].dtype for col in df.columns if stats[col]['kind'] == 'numeric'}
+    for dtype in sorted(numeric_dtypes, key=str):
+        block_cols = [col for col in df.columns if stats[col]['kind'] == 'numeric' and df[col].dtype == dtype]
+        values = df[block_cols].to_numpy(dtype=dtype)
+        is_float = dtype.kind == 'f'
+        valid = ~np.isnan(values) if is_float else np.ones(values.shape, dtype=bool)
+        non_null = valid.sum(axis=0)
+        if unique_cap is None:
+            distinct = _exact_distinct_values(values, valid)
+        else:
+            distinct = np.minimum(_first_distinct_values(values, valid), unique_cap)
+
+        if n_rows:
+            filled = np.where(valid, values, 0) if is_float else values
+            sums = filled.sum(axis=0, dtype='float64')
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = sums / non_null
+            # fmin/fmax skip NaNs and yield NaN for all-null columns
+            mins = np.fmin.reduce(values, axis=0).astype('float64')
+            maxs = np.fmax.reduce(values, axis=0).astype('float64')
+            if quantiles:
+                block_quantiles = pd.DataFrame(values).quantile(list(PROFILE_QUANTILES)).to_numpy()
+
+        for i, col in enumerate(block_cols):
+            col_stats = stats[col]
+            col_stats['non_null_count'] = int(non_null[i])
+            col_stats['distinct'] = int(distinct[i])
+            col_stats['min'] = float(mins[i]) if n_rows else None
+            col_stats['max'] = float(maxs[i]) if n_rows else None
+            col_stats['mean'] = float(means[i]) if n_rows else None
+            if quantiles:
+                col_stats['quantiles'] = block_quantiles[:, i].tolist() if n_rows else None
+
+    # Everything else (text, categorical, dates, ...) is handled column by column
+    for col in df.columns:
+        col_stats = stats[col]
+        if 'distinct' in col_stats:
+            continue
+        series = df[col]
+        valid = series.notna().to_numpy()
+        col_stats['non_null_count'] = int(valid.sum())
+        if unique_cap is None:
+            col_stats['distinct'] = int(series.nunique())
+        else:
+            values = series.to_numpy(dtype=object)[valid]
+            col_stats['distinct'] = _object_distinct_values(values, unique_cap)
+
+    for col_stats in stats.values():
+        col_stats['null_count'] = n_rows - col_stats['non_null_count']
+    return stats
+
+
+class ColumnSketch:
+    """Streaming summary of one column: exact counts and moments, sketched distinct values and quantiles
+
+    Distinct values are counted exactly until a third one is seen, so binary
+    feature detection stays exact; beyond that the HyperLogLog estimate is
+    used.
+    """
+
+    def __init__(self, precision=HLL_PRECISION, k=KLL_K, sample_size=RESERVOIR_SIZE, seed=0):
+        self.non_null_count = 0
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.numeric = True
+        self.distinct_values = set()
+        self.hll = HyperLogLog(precision)
+        self.quantiles = QuantileSketch(k, seed)
+        self.reservoir = Reservoir(sample_size, seed)
+
+    def update(self, series):
+        """Fold a chunk of the column into the summary"""
+        values = series.to_numpy()[series.notna().to_numpy()]
+        self.non_null_count += len(values)
+        if not len(values):
+            return
+        if column_kind(series.dtype) == 'numeric':
+            values = values.astype(np.float64)
+            self.sum += float(values.sum())
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self.quantiles.update(values)
+        else:
+            self.numeric = False
+            values = values.astype(object)
+        hashes = hash_values(values)
+        self.hll.update(hashes)
+        if len(self.distinct_values) <= 2:
+            # Each new distinct value is found with one vectorized comparison
+            remaining = hashes
+            while len(remaining) and len(self.distinct_values) <= 2:
+                self.distinct_values.add(int(remaining[0]))
+                remaining = remaining[remaining != remaining[0]]
+        self.reservoir.update(values)
+
+    def merge(self, other):
+        """Fold the summary of another chunk of the same column into this one"""
+        self.non_null_count += other.non_null_count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.numeric = self.numeric and other.numeric
+        self.distinct_values |= other.distinct_values
+        self.hll.merge(other.hll)
+        self.quantiles.merge(other.quantiles)
+        self.reservoir.merge(other.reservoir)
+
+    @property
+    def distinct(self):
+        """Exact distinct count up to 2, the rounded HyperLogLog estimate (at least 3) beyond"""
+        if len(self.distinct_values) <= 2:
+            return len(self.distinct_values)
+        return max(3, int(round(self.hll.estimate())))
+
+
+class FrameSketch:
+    """ColumnSketches of every column of a frame, built a chunk at a time
+
+    Chunks must have the same columns. Sketches of different parts of a
+    dataset can be merged if they were built with different seeds.
+    """
+
+    def __init__(self, precision=HLL_PRECISION, k=KLL_K, sample_size=RESERVOIR_SIZE, seed=0):
+        self.precision = precision
+        self.k = k
+        self.sample_size = sample_size
+        self.seed = seed
+        self.rows = 0
+        self.columns = {}
+
+    @classmethod
+    def from_frame(cls, df, chunk_rows=SKETCH_CHUNK_ROWS, **kwargs):
+        """Sketch a frame in one pass, chunk_rows rows at a time"""
+        sketch = cls(**kwargs)
+        for start in range(0, len(df), chunk_rows):
+            sketch.update(df.iloc[start:start + chunk_rows])
+        return sketch
+
+    def update(self, df):
+        """Fold a chunk of rows into the sketch"""
+        self.rows += len(df)
+        for position, col in enumerate(df.columns):
+            column = self.columns.get(col)
+            if column is None:
+                # Each column gets its own random stream
+                column = self.columns[col] = ColumnSketch(self.precision, self.k, self.sample_size,
+                                                          (self.seed, position))
+            column.update(df[col])
+
+    def merge(self, other):
+        """Fold a sketch of other rows of the same columns into this one"""
+        self.rows += other.rows
+        for col, column in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(column)
+            else:
+                self.columns[col] = column
+
+    def error_bounds(self):
+        """Error bounds of the sketched statistics, as reported in the profile"""
+        return {
+            'distinct_relative_error': float(HyperLogLog(self.precision).relative_error),
+            'quantile_rank_error': float(QuantileSketch(self.k).rank_error),
+            'sample_size': self.sample_size
+        }
+
+    def column_stats(self, df):
+        """Statistics in the shape of compute_column_stats(), with dtypes taken from df"""
+        stats = {}
+        for col in df.columns:
+            column = self.columns.get(col) or ColumnSketch()
+            kind = column_kind(df[col].dtype)
+            col_stats = {
+                'dtype': str(df[col].dtype),
+                'kind': kind,
+                'non_null_count': column.non_null_count,
+                'null_count': self.rows - column.non_null_count,
+                'distinct': column.distinct,
+                'sample': column.reservoir.sample()[:PROFILE_SAMPLE_VALUES]
+            }
+            if kind == 'numeric':
+                has_values = column.non_null_count and column.numeric
+                col_stats['min'] = column.min if has_values else float('nan')
+                col_stats['max'] = column.max if has_values else float('nan')
+                col_stats['mean'] = column.sum / column.non_null_count if has_values else float('nan')
+                col_stats['quantiles'] = column.quantiles.quantiles(PROFILE_QUANTILES) if has_values else None
+            stats[col] = col_stats
+        return stats
+
+
+def binary_features_from_stats(stats):
+    """Columns with at most two distinct non-null values, in column order"""
+    return [col for col, col_stats in stats.items()
+            if col_stats['kind'] in ('numeric', 'text')
+            and col_stats['distinct'] <= 2]
+
+
+def identify_binary_features(df):
+    """Identify binary features in the dataset"""
+    return binary_features_from_stats(compute_column_stats(df, unique_cap=3))
+
+
+@dataclass
+class DatasetProfile:
+    """Derived metadata for a loaded dataset, computed once at upload time"""
+    total_companies: int
+    total_features: int
+    overall_completeness: float
+    numeric_features: list
+    categorical_features: list
+    binary_features: list
+    non_binary_features: list
+    columns_info: list
+    completeness_histogram: dict = field(default_factory=dict)
+    memory_report: list = None
+    mode: str = 'exact'
+    error_bounds: dict = None
+
+    def column(self, name):
+        """Return the profile entry for a single column, or None"""
+        for col_info in self.columns_info:
+            if col_info['name'] == name:
+                return col_info
+        return None
+
+
+def columns_info_from_stats(stats):
+    """Per-column info in the shape served by /data_preview"""
+    columns_info = []
+    for col, col_stats in stats.items():
+        col_info = {
+            'name': col,
+            'dtype': col_stats['dtype'],
+            'non_null_count': col_stats['non_null_count'],
+            'null_count': col_stats['null_count'],
+            'unique_values': col_stats['distinct']
+        }
+
+        if col_stats['kind'] == 'numeric':
+            col_info['min'] = col_stats['min']
+            col_info['max'] = col_stats['max']
+            col_info['mean'] = col_stats['mean']
+            if col_stats.get('quantiles') is not None:
+                col_info['q1'], col_info['median'], col_info['q3'] = col_stats['quantiles']
+        if 'sample' in col_stats:
+            col_info['sample'] = col_stats['sample']
+
+        columns_info.append(col_info)
+    return columns_info
+
+
+def profile_columns(df):
+    """Per-column null counts, unique counts and numeric summary statistics"""
+    return columns_info_from_stats(compute_column_stats(df))
+
+
+def completeness_histogram(completeness_percentage, bins=COMPLETENESS_BINS):
+    """Count companies per completeness bucket (0-10%, 10-20%, ..., 90-100%)"""
+    counts, edges = np.histogram(completeness_percentage, bins=bins, range=(0, 100))
+    return {
+        'edges': edges.tolist(),
+        'counts': counts.astype(int).tolist()
+    }
+
+
+def build_dataset_profile(df, completeness_percentage=None, memory_report=None, mode='exact', sketch=None,
+                          quantiles=False):
+    """Compute the dataset profile shared by the analysis pages
+
+    In 'approximate' mode distinct counts and quartiles come from mergeable
+    sketches (sketch, a FrameSketch of df's rows, or one built here in a
+    single pass) and the profile reports their error_bounds; null counts,
+    min, max and mean stay exact. Binary features are detected exactly in
+    both modes. 'exact' profiles only include quartiles with quantiles set.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}', expected one of: {', '.join(PROFILE_MODES)}")
+    total_companies = len(df)
+    total_features = len(df.columns)
+    error_bounds = None
+    with stage('feature_typing'):
+        if mode == 'approximate':
+            if sketch is None:
+                sketch = FrameSketch.from_frame(df)
+            stats = sketch.column_stats(df)
+            error_bounds = sketch.error_bounds()
+        else:
+            stats = compute_column_stats(df, quantiles=quantiles)
+    columns_info = columns_info_from_stats(stats)
+
+    total_cells = total_companies * total_features
+    non_null_cells = sum(col_info['non_null_count'] for col_info in columns_info)
+    overall_completeness = (non_null_cells / total_cells) * 100 if total_cells else 0.0
+
+    numeric_features = df.select_dtypes(include=[np.number]).columns.tolist()
+    categorical_features = df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
+    binary_features = binary_features_from_stats(stats)
+    non_binary_features = [col for col in numeric_features if col not in binary_features]
+
+    if completeness_percentage is None:
+        completeness_percentage = (df.notna().sum(axis=1) / total_features) * 100
+
+    return DatasetProfile(
+        total_companies=total_companies,
+        total_features=total_features,
+        overall_completeness=overall_completeness,
+        numeric_features=numeric_features,
+        categorical_features=categorical_features,
+        binary_features=binary_features,
+        non_binary_features=non_binary_features,
+        columns_info=columns_info,
+        completeness_histogram=completeness_histogram(completeness_percentage),
+        memory_report=memory_report,
+        mode=mode,
+        error_bounds=error_bounds
+    )
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+JSON, Arrow and compressed API responses for Company Risk Analysis System
+"""
+
+import gzip
+import json
+import math
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+from flask.json.provider import DefaultJSONProvider
+
+from instrumentation import stage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip is used instead
+    brotli = None
+
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+COMPRESSIBLE_MIMETYPES = ('application/json', ARROW_STREAM_MIMETYPE)
+
+
+def _default(o):
+    """Convert pandas/NumPy values that the JSON encoders do not know"""
+    if o is pd.NA or o is pd.NaT:
+        return None
+    if isinstance(o, pd.Timestamp):
+        return o.isoformat()
+    if isinstance(o, np.ndarray):
+        return _array_to_list(o)
+    if isinstance(o, np.generic):
+        value = o.item()
+        return None if isinstance(value, float) and not math.isfinite(value) else value
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def _array_to_list(values):
+    if values.dtype.kind == 'f':
+        # NaN and infinity are not valid JSON
+        values = np.where(np.isfinite(values), values, None)
+    return values.tolist()
+
+
+class DataJSONProvider(DefaultJSONProvider):
+    """JSON provider that understands pandas/NumPy values found in DataFrame rows
+
+    Responses are encoded by orjson, which writes NumPy arrays straight
+    from their buffers and emits NaN as null.
+    """
+
+    @staticmethod
+    def default(o):
+        try:
+            return _default(o)
+        except TypeError:
+            return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with stage('serialization'):
+            body = orjson.dumps(obj, default=self.default,
+                                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def frame_columns(df):
+    """Column-oriented JSON layout of a frame: labels plus one value list per column
+
+    Plain NumPy numeric columns are passed through as arrays, so orjson can
+    serialize them directly from their buffers.
+    """
+    values = []
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'iufb':
+            values.append(np.ascontiguousarray(series.to_numpy()))
+        else:
+            values.append(series.astype(object).where(series.notna(), None).tolist())
+    return {'columns': list(df.columns), 'values': values}
+
+
+def arrow_response(response_class, df, metadata=None):
+    """Build an Arrow IPC stream response holding df's rows
+
+    The row index is kept as a column; metadata, if given, is stored as JSON
+    under the 'response' key of the schema metadata.
+    """
+    with stage('serialization'):
+        table = pa.Table.from_pandas(df.rename(columns=str), preserve_index=True)
+        if metadata is not None:
+            schema_metadata = dict(table.schema.metadata or {})
+            schema_metadata[b'response'] = json.dumps(metadata, default=DataJSONProvider.default).encode('utf-8')
+            table = table.replace_schema_metadata(schema_metadata)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return response_class(sink.getvalue().to_pybytes(), mimetype=ARROW_STREAM_MIMETYPE)
+
+
+def _accepted_encodings(accept_encoding):
+    encodings = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def compress_response(response, accept_encoding, min_bytes, gzip_level=6):
+    """Compress a large JSON or Arrow response with brotli or gzip if the client accepts it"""
+    # Streamed bodies are left alone; compressing them would read the whole stream
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < min_bytes:
+        return response
+    encodings = _accepted_encodings(accept_encoding or '')
+    if brotli is not None and 'br' in encodings:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in encodings:
+        response.set_data(gzip.compress(body, compresslevel=gzip_level))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
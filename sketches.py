@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Mergeable streaming sketches for Company Risk Analysis System
+
+Each sketch summarizes a column in one pass with bounded memory, can be
+updated a chunk at a time and merged with a sketch of other chunks, so large
+datasets can be profiled block by block or in parallel.
+"""
+
+import numpy as np
+import pandas as pd
+
+HLL_PRECISION = 14
+KLL_K = 200
+KLL_MIN_CAPACITY = 8
+RESERVOIR_SIZE = 64
+
+
+def hash_values(values):
+    """64-bit hashes of non-null values, equal for equal values across chunks
+
+    Numbers are hashed as float64, so an integer column and a float column
+    holding the same numbers (e.g. one chunk with gaps, one without) agree.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'iuf':
+        # Adding 0.0 turns -0.0 into 0.0
+        return pd.util.hash_array(values.astype(np.float64) + 0.0)
+    return pd.util.hash_array(values.astype(object))
+
+
+class HyperLogLog:
+    """HyperLogLog distinct count estimator over 64-bit hashes
+
+    2 ** precision one-byte registers; the relative standard error of the
+    estimate is 1.04 / sqrt(2 ** precision), about 0.8% at precision 14.
+    Small cardinalities use linear counting and are nearly exact. precision
+    must be 11 to 18.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        if not 11 <= precision <= 18:
+            raise ValueError(f"HyperLogLog precision must be between 11 and 18, got {precision}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        """Relative standard error of estimate()"""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update(self, hashes):
+        """Add hashed values (uint64 array)"""
+        if not len(hashes):
+            return
+        remainder_bits = 64 - self.precision
+        index = (hashes >> np.uint64(remainder_bits)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << remainder_bits) - 1)
+        # The remainder has at most 53 bits, so float64 holds it exactly and
+        # frexp's exponent is its bit length
+        rank = remainder_bits + 1 - np.frexp(remainder.astype(np.float64))[1]
+        # Ranks are geometric, so there are only a few dozen distinct ones; writing
+        # them in increasing order leaves each register at its largest rank
+        chunk = np.zeros_like(self.registers)
+        for value in np.flatnonzero(np.bincount(rank)):
+            chunk[index[rank == value]] = value
+        np.maximum(self.registers, chunk, out=self.registers)
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one"""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        """Estimated number of distinct values added"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return float(estimate)
+
+
+class QuantileSketch:
+    """KLL quantile sketch of a stream of numbers
+
+    Items are kept in levels of compactors; items at level h stand for 2 ** h
+    input values. A full level is sorted and every other item (from a random
+    offset) is promoted, so memory stays around 3 * k items whatever the
+    stream length. rank_error is the normalized rank error of a quantile at
+    99% confidence, about 1.65% for k = 200.
+    """
+
+    def __init__(self, k=KLL_K, seed=0):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rank_error(self):
+        """Normalized rank error at 99% confidence (the published KLL bound for this k)"""
+        return 2.446 / self.k ** 0.9433
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(KLL_MIN_CAPACITY, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                # Levels are mostly two sorted runs, which a stable sort merges in linear time
+                items = np.sort(items, kind='stable')
+                # With an odd count the smallest item stays behind, so no weight is lost
+                odd = len(items) % 2
+                self._add(level + 1, items[odd:][self._rng.integers(2)::2])
+                self.levels[level] = items[:odd]
+            level += 1
+
+    def _add(self, level, items):
+        while len(self.levels) <= level:
+            self.levels.append(np.empty(0))
+        self.levels[level] = np.concatenate([self.levels[level], items])
+
+    def update(self, values):
+        """Add an array of numbers without NaNs"""
+        if not len(values):
+            return
+        self.count += len(values)
+        # A large chunk is sorted once and halved until it fits a compactor, which
+        # is what compacting it level by level would do without sorting each level
+        items = np.sort(np.asarray(values, dtype=np.float64))
+        level = 0
+        while len(items) > self.k:
+            odd = len(items) % 2
+            if odd:
+                self._add(level, items[:1])
+            items = items[odd:][self._rng.integers(2)::2]
+            level += 1
+        self._add(level, items)
+        self._compress()
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        for level, items in enumerate(other.levels):
+            self._add(level, items)
+        self.count += other.count
+        self._compress()
+
+    def quantiles(self, qs):
+        """Approximate values at the given quantiles, or NaNs for an empty sketch"""
+        if not self.count:
+            return [float('nan')] * len(qs)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.int64)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return items[order][np.minimum(positions, len(items) - 1)].tolist()
+
+
+class Reservoir:
+    """Uniform random sample of at most size values from a stream
+
+    Every value gets a random key and the sample keeps the smallest keys
+    (bottom-k sampling), so merging two reservoirs keeps a uniform sample of
+    both streams. Sketches that will be merged need different seeds.
+    """
+
+    def __init__(self, size=RESERVOIR_SIZE, seed=0):
+        self.size = size
+        self.keys = np.empty(0)
+        self.values = np.empty(0, dtype=object)
+        self._rng = np.random.default_rng(seed)
+
+    def _keep(self, keys, values):
+        if len(keys) > self.size:
+            smallest = np.argpartition(keys, self.size - 1)[:self.size]
+            keys, values = keys[smallest], values[smallest]
+        self.keys, self.values = keys, values
+
+    def update(self, values):
+        """Offer an array of values to the sample"""
+        if not len(values):
+            return
+        keys = self._rng.random(len(values))
+        values = np.asarray(values)
+        if len(keys) > self.size:
+            # Only the chunk's own smallest keys can make it into the sample
+            smallest = np.argpartition(keys, self.size - 1)[:self.size]
+            keys, values = keys[smallest], values[smallest]
+        self._keep(np.concatenate([self.keys, keys]), np.concatenate([self.values, values.astype(object)]))
+
+    def merge(self, other):
+        """Fold another reservoir into this one"""
+        self._keep(np.concatenate([self.keys, other.keys]), np.concatenate([self.values, other.values]))
+
+    def sample(self):
+        """The sampled values, in random order"""
+        return self.values[np.argsort(self.keys)].tolist()
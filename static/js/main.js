@@ -403,6 +403,52 @@ const ChartUtils = {
     }
 };
 
+// Background job helpers
+const Jobs = {
+    pollInterval: 500,
+    
+    // Submit a job and poll its status until it finishes.
+    // onProgress(state) is called with every status update; the returned
+    // promise resolves with the job result or rejects with an error message.
+    run: function(submitUrl, onProgress) {
+        const self = this;
+        return new Promise(function(resolve, reject) {
+            $.post(submitUrl).done(function(job) {
+                self.currentJob = job.job_id;
+                const poll = function() {
+                    $.get(job.status_url).done(function(state) {
+                        if (onProgress) {
+                            onProgress(state);
+                        }
+                        if (state.status === 'done') {
+                            self.currentJob = null;
+                            resolve(state.result);
+                        } else if (state.status === 'failed' || state.status === 'cancelled') {
+                            self.currentJob = null;
+                            reject(state.error || 'Job ' + state.status);
+                        } else {
+                            setTimeout(poll, self.pollInterval);
+                        }
+                    }).fail(function() {
+                        self.currentJob = null;
+                        reject('Lost track of the job');
+                    });
+                };
+                poll();
+            }).fail(function(xhr) {
+                reject((xhr.responseJSON && xhr.responseJSON.error) || 'Could not start the job');
+            });
+        });
+    },
+    
+    // Cancel the job started by the last run() call, if it is still going
+    cancel: function() {
+        if (this.currentJob) {
+            $.post(`/jobs/${this.currentJob}/cancel`);
+        }
+    }
+};
+
 // Initialize when DOM is ready
 document.addEventListener('DOMContentLoaded', function() {
     console.log('DOM loaded, initializing...');
@@ -469,3 +515,4 @@ document.addEventListener('DOMContentLoaded', function() {
 window.Utils = Utils;
 window.DataHandler = DataHandler;
 window.ChartUtils = ChartUtils;
+window.Jobs = Jobs;
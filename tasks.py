@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Background analysis tasks for Company Risk Analysis System
+
+Tasks run in job worker processes. They receive the dataset store location
+and a dataset ID rather than the data itself, and open the dataset from the
+memory-mapped store, so submitting a job never pickles a DataFrame.
+"""
+
+from analysis import anomaly_result, anomaly_scan_result, cluster_group_result, cluster_sweep_result
+from data_cache import ResultCache
+from dataset_store import DatasetStore
+from model_store import ModelStore
+
+# One store and result cache per worker process and directories, reused across tasks
+_stores = {}
+_result_caches = {}
+
+
+def _open_dataset(store_dir, dataset_id, model_dir=None):
+    store = _stores.get((store_dir, model_dir))
+    if store is None:
+        # Workers only read datasets and add models; eviction is left to the web process
+        model_store = ModelStore(model_dir) if model_dir is not None else None
+        store = _stores[(store_dir, model_dir)] = DatasetStore(store_dir, max_bytes=None, model_store=model_store)
+    dataset = store.get(dataset_id)
+    if dataset is None:
+        raise LookupError('Dataset is no longer available, please upload it again')
+    return dataset
+
+
+def _result_cache(cache_dir, max_bytes):
+    if cache_dir is None:
+        return None
+    cache = _result_caches.get(cache_dir)
+    if cache is None:
+        cache = _result_caches[cache_dir] = ResultCache(cache_dir, max_bytes)
+    return cache
+
+
+def cluster_group_task(store_dir, dataset_id, group_name, n_clusters=3, engine='auto',
+                       cache_dir=None, cache_max_bytes=0, refit=False, model_dir=None, progress=None):
+    """Cluster one completeness group of a stored dataset
+
+    With cache_dir, the result is stored in the shared clustering result cache.
+    With model_dir, the group's stored cluster model is reused unless refit
+    is set, and a newly fitted one is stored there.
+    """
+    dataset = _open_dataset(store_dir, dataset_id, model_dir)
+    if group_name not in dataset.groups:
+        return {'error': 'Group not found'}
+    group_data = dataset.groups.materialize(group_name)
+    return cluster_group_result(group_data, group_name, n_clusters, progress=progress,
+                                cache=_result_cache(cache_dir, cache_max_bytes),
+                                dataset_key=dataset.cache_key, engine=engine,
+                                models=dataset.cluster_models, refit=refit)
+
+
+def cluster_sweep_task(store_dir, dataset_id, group_name, k_values, engine='auto', n_jobs=None, progress=None):
+    """Cluster one completeness group of a stored dataset for several k values"""
+    dataset = _open_dataset(store_dir, dataset_id)
+    if group_name not in dataset.groups:
+        return {'error': 'Group not found'}
+    group_data = dataset.groups.materialize(group_name)
+    return cluster_sweep_result(group_data, group_name, k_values, engine, n_jobs=n_jobs, progress=progress)
+
+
+def detect_anomalies_task(store_dir, dataset_id, feature_name, multiplier=1.5, page=None, progress=None):
+    """Detect anomalies for one feature of a stored dataset"""
+    dataset = _open_dataset(store_dir, dataset_id)
+    return anomaly_result(dataset.df, feature_name, progress=progress, multiplier=multiplier,
+                          index=dataset.anomaly_index, page=page)
+
+
+def anomaly_scan_task(store_dir, dataset_id, multiplier=1.5, progress=None):
+    """Flag outliers in every non-binary feature of a stored dataset"""
+    dataset = _open_dataset(store_dir, dataset_id)
+    return anomaly_scan_result(dataset.df, dataset.profile.non_binary_features, multiplier, progress=progress)
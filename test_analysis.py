@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for clustering and its result cache
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+from data_cache import ResultCache
+from model_store import ClusterModels
+
+
+def make_group(rows=60):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'revenue': rng.normal(1e6, 1e5, rows),
+        'employees': rng.integers(1, 500, rows).astype(float),
+        'profit': rng.normal(1e4, 1e3, rows),
+        'listed': rng.integers(0, 2, rows),
+    })
+
+
+def test_repeated_clustering_is_served_from_cache(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    group = make_group()
+
+    first = analysis.cluster_group_result(group, 'complete', 3, cache=cache, dataset_key='abc')
+    assert first['success']
+    assert first['features_used'] == ['revenue', 'employees', 'profit']
+    assert 'cached' not in first
+
+    def fail(*args, **kwargs):
+        raise AssertionError('clustering should not run again')
+
+    monkeypatch.setattr(analysis, 'fit_cluster_model', fail)
+    second = analysis.cluster_group_result(group, 'complete', 3, cache=cache, dataset_key='abc')
+    assert second['cached']
+    assert second['cluster_summary'] == first['cluster_summary']
+    assert second['cluster_centers'] == first['cluster_centers']
+
+
+def test_stored_model_assigns_appended_companies(monkeypatch):
+    models = ClusterModels()
+    group = make_group(80)
+    fitted = analysis.cluster_group_result(group.iloc[:60], 'complete', 3, models=models)
+    assert fitted['assigned_companies'] == 0
+    assert fitted['drift'] is None
+
+    key = analysis.cluster_model_key('complete', 3, 'kmeans')
+    model = models.get(key).assign(group.iloc[60:])
+    assert model.fitted_rows == 60
+    assert model.assigned_rows == 20
+    scaled = model.scaler.transform(group.iloc[60:][model.features])
+    assert model.labels[60:].tolist() == model.model.predict(scaled).tolist()
+    models.put(key, model)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('the stored model should be reused')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(analysis, 'fit_cluster_model', fail)
+        assigned = analysis.cluster_group_result(group, 'complete', 3, models=models)
+    assert assigned['assigned_companies'] == 20
+    assert assigned['drift'] > 0
+    assert assigned['cluster_centers'] == fitted['cluster_centers']
+    assert sum(c['company_count'] for c in assigned['cluster_summary']) == 80
+
+    refitted = analysis.cluster_group_result(group, 'complete', 3, models=models, refit=True)
+    assert refitted['assigned_companies'] == 0
+    assert models.get(key).fitted_rows == 80
+
+
+def test_auto_engine_keeps_the_stored_model_after_growth(monkeypatch):
+    monkeypatch.setattr(analysis, 'FULL_KMEANS_MAX_ROWS', 70)
+    models = ClusterModels()
+    group = make_group(80)
+    fitted = analysis.cluster_group_result(group.iloc[:60], 'complete', 3, models=models)
+    assert fitted['engine'] == 'kmeans'
+    key = analysis.cluster_model_key('complete', 3, 'kmeans')
+    models.put(key, models.get(key).assign(group.iloc[60:]))
+
+    # 80 rows would pick the sample engine, but the stored kmeans model is kept
+    assert analysis.resolve_engine('complete', 80, 3, 'auto', models) == 'kmeans'
+    assert analysis.resolve_engine('complete', 80, 3, 'auto') == 'sample'
+    assigned = analysis.cluster_group_result(group, 'complete', 3, models=models)
+    assert assigned['engine'] == 'kmeans'
+    assert assigned['assigned_companies'] == 20
+
+    refitted = analysis.cluster_group_result(group, 'complete', 3, models=models, refit=True)
+    assert refitted['engine'] == 'sample'
+    assert analysis.resolve_engine('complete', 80, 3, 'auto', models) == 'sample'
+
+
+def test_cache_key_covers_parameters():
+    key = analysis.cluster_cache_key('abc', 'complete', 3)
+
+    assert key == analysis.cluster_cache_key('abc', 'complete', 3, 'kmeans')
+    assert key != analysis.cluster_cache_key('abc', 'complete', 4)
+    assert key != analysis.cluster_cache_key('abc', 'high_completeness', 3)
+    assert key != analysis.cluster_cache_key('abd', 'complete', 3)
+    assert key != analysis.cluster_cache_key('abc', 'complete', 3, 'sample')
+
+
+def test_not_enough_features_returns_error():
+    group = pd.DataFrame({'revenue': [1.0, 2.0, 3.0], 'listed': [0, 1, 0]})
+
+    assert 'error' in analysis.cluster_group_result(group, 'complete', 2)
+
+
+def test_engine_selection():
+    assert analysis.choose_engine(1000) == 'kmeans'
+    assert analysis.choose_engine(analysis.FULL_KMEANS_MAX_ROWS + 1) == 'sample'
+    assert analysis.choose_engine(1000, 'minibatch') == 'minibatch'
+    with pytest.raises(ValueError):
+        analysis.choose_engine(1000, 'dbscan')
+
+
+@pytest.mark.parametrize('engine', analysis.CLUSTER_ENGINES)
+def test_every_engine_labels_all_companies(engine, monkeypatch):
+    monkeypatch.setattr(analysis, 'CLUSTER_SAMPLE_ROWS', 20)
+    group = make_group(200)
+
+    result = analysis.cluster_group_result(group, 'complete', 3, engine=engine)
+    assert result['engine'] == engine
+    assert sum(cluster['company_count'] for cluster in result['cluster_summary']) == len(group)
+
+
+def test_cluster_sweep_matches_single_fits():
+    group = make_group(200)
+
+    sweep = analysis.cluster_sweep_result(group, 'complete', [4, 2, 3, 2], n_jobs=1)
+    assert [entry['n_clusters'] for entry in sweep['results']] == [2, 3, 4]
+    assert sweep['companies'] == group.index.tolist()
+
+    inertias = [entry['inertia'] for entry in sweep['results']]
+    assert inertias == sorted(inertias, reverse=True)
+    for entry in sweep['results']:
+        assert len(entry['labels']) == len(group)
+        assert -1 <= entry['silhouette'] <= 1
+        single = analysis.cluster_group_result(group, 'complete', entry['n_clusters'])
+        counts = sorted(cluster['company_count'] for cluster in single['cluster_summary'])
+        assert counts == sorted(np.bincount(entry['labels']).tolist())
+
+
+def test_anomaly_scan_matches_per_feature_detection():
+    group = make_group(300)
+    group.loc[5, 'revenue'] = 1e9
+    group.loc[5, 'profit'] = -1e9
+    group.loc[7, 'employees'] = np.nan
+    features = ['revenue', 'employees', 'profit']
+
+    result = analysis.anomaly_scan_result(group, features)
+
+    for position, feature in enumerate(features):
+        single = analysis.anomaly_result(group, feature)
+        stats = result['statistics'][feature]
+        assert stats['anomaly_count'] == single['anomaly_count']
+        assert stats['non_null_count'] == single['total_records']
+        assert stats['Q1'] == pytest.approx(single['statistics']['Q1'])
+        flagged = [company for company, col in zip(result['outliers']['companies'], result['outliers']['features'])
+                   if col == position]
+        assert sorted(flagged) == analysis.detect_anomalies(group, feature)['anomalies'].index.tolist()
+
+    assert result['company_counts'][0] == {'company': 5, 'outlier_count': 2}
+    assert result['total_outliers'] == sum(entry['outlier_count'] for entry in result['company_counts'])
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-feature anomaly bound index
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import detect_anomalies
+from anomaly_index import AnomalyIndex
+
+
+def make_frame(rows=501):
+    rng = np.random.default_rng(3)
+    revenue = rng.lognormal(10, 1, rows)
+    revenue[rng.random(rows) < 0.2] = np.nan
+    return pd.DataFrame({
+        'revenue': revenue,
+        'employees': rng.integers(1, 50, rows),
+        'sector': rng.choice(['Retail', 'Energy'], rows),
+    }, index=[f'C{i}' for i in range(rows)])
+
+
+@pytest.mark.parametrize('feature_name', ['revenue', 'employees'])
+@pytest.mark.parametrize('multiplier', [0.5, 1.5, 3.0])
+def test_matches_direct_detection(feature_name, multiplier):
+    df = make_frame()
+    feature = AnomalyIndex(df).feature(feature_name)
+
+    series = df[feature_name]
+    assert feature.quantile(0.25) == series.quantile(0.25)
+    assert feature.quantile(0.75) == series.quantile(0.75)
+    assert feature.non_null_count == series.notna().sum()
+
+    bounds = feature.bounds(multiplier)
+    lower, upper = bounds['lower_bound'], bounds['upper_bound']
+    expected = np.flatnonzero(((series < lower) | (series > upper)).to_numpy())
+    np.testing.assert_array_equal(feature.outlier_positions(lower, upper), expected)
+    if multiplier == 1.5:
+        assert len(expected) == len(detect_anomalies(df, feature_name)['anomalies'])
+
+
+def test_saved_index_is_reused(tmp_path):
+    df = make_frame()
+    first = AnomalyIndex(df, str(tmp_path)).feature('revenue')
+
+    reopened = AnomalyIndex(df, str(tmp_path)).feature('revenue')
+    assert isinstance(reopened.values, np.memmap)
+    np.testing.assert_array_equal(reopened.values, first.values)
+    np.testing.assert_array_equal(reopened.positions, first.positions)
+
+
+def test_non_numeric_or_missing_features():
+    index = AnomalyIndex(make_frame())
+
+    assert index.feature('sector') is None
+    assert index.feature('missing') is None
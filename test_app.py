@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the Flask routes of Company Risk Analysis System
+"""
+
+import io
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as app_module
+from data_cache import ParsedFileCache, ResultCache
+from dataset_store import DatasetStore
+from completeness import CompletenessGroups
+from jobs import JobRunner, ProgressStore
+from model_store import ModelStore
+
+
+def companies_csv(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'company': [f'Company {seed}-{i}' for i in range(rows)],
+        'revenue': rng.normal(100, 10, rows).round(2),
+        'profit': rng.normal(10, 5, rows).round(2),
+        'employees': rng.integers(1, 500, rows).astype(float),
+        'exporter': rng.integers(0, 2, rows).astype(float),
+    })
+    return df.to_csv(index=False).encode('utf-8')
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Test client whose uploads, stores and caches live in tmp_path"""
+    model_store = ModelStore(str(tmp_path / 'models'))
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'model_store', model_store)
+    monkeypatch.setattr(app_module, 'dataset_store', DatasetStore(str(tmp_path / 'datasets'), None,
+                                                                    model_store=model_store))
+    monkeypatch.setattr(app_module, 'parse_cache', ParsedFileCache(str(tmp_path / 'parse_cache'), 2 ** 30))
+    monkeypatch.setattr(app_module, 'cluster_cache', ResultCache(str(tmp_path / 'cluster_cache'), 2 ** 30))
+    monkeypatch.setattr(app_module, 'load_progress', ProgressStore(str(tmp_path / 'load_progress')))
+    monkeypatch.setattr(app_module, 'job_runner', JobRunner(str(tmp_path / 'jobs'), 1))
+    monkeypatch.setitem(app_module.app.config, 'TESTING', True)
+    with app_module.app.test_client() as client:
+        yield client
+
+
+def upload(client, content, filename, mode='replace'):
+    return client.post('/upload', data={'file': (io.BytesIO(content), filename), 'mode': mode},
+                       content_type='multipart/form-data')
+
+
+def test_append_after_profile_was_stored(client):
+    upload(client, companies_csv(200), 'companies.csv')
+    with client.session_transaction() as session:
+        dataset_id = session['dataset_id']
+    # The upload's profile is in the model store next to its cluster models
+    digest = app_module.dataset_store.get(dataset_id).cache_key
+    assert app_module.model_store.versions(digest, 'profile')
+    assert client.get('/cluster_group/complete').get_json()['success']
+
+    response = upload(client, companies_csv(50, seed=1), 'delta.csv', mode='append')
+
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        appended = app_module.dataset_store.get(session['dataset_id'])
+        flashes = session.get('_flashes', [])
+    assert not any('Error' in message for _, message in flashes)
+    assert len(appended.df) == 250
+    assert [key for key, _ in appended.cluster_models.items()] == ['complete.k3.kmeans']
+
+
+def test_streamed_upload_with_changing_column_types_falls_back_to_pandas(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'OUT_OF_CORE_MIN_BYTES', 1)
+    monkeypatch.setitem(app_module.app.config, 'COLUMNAR_BLOCK_BYTES', 1024)
+    content = ('id,value\n' + ''.join(f'{i},{i}\n' for i in range(2000)) + '2000,n/a value\n').encode('utf-8')
+    upload_id = 'a' * 32
+
+    response = client.post(f'/upload_stream?filename=mixed.csv&upload_id={upload_id}', data=content,
+                           content_type='text/csv')
+
+    assert response.status_code == 200, response.get_json()
+    dataset = app_module.dataset_store.get(response.get_json()['dataset_id'])
+    assert len(dataset.df) == 2001
+    assert dataset.df['value'].iloc[-1] == 'n/a value'
+    # Progress is kept per upload, and the spool file is gone
+    assert client.get(f'/load_progress?upload_id={upload_id}').get_json()['status'] == 'done'
+    assert client.get(f'/load_progress?upload_id={"b" * 32}').get_json() == {'status': 'idle'}
+    assert not list(Path(app_module.app.config['UPLOAD_FOLDER']).glob('*.csv'))
+
+
+def test_streamed_upload_limit_is_reported_below_one_megabyte(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'STREAM_UPLOAD_MAX_BYTES', 512 * 1024)
+
+    response = client.post('/upload_stream?filename=big.csv', data=companies_csv(20000), content_type='text/csv')
+
+    assert response.status_code == 413
+    assert '512.0 KB' in response.get_json()['error']
+
+
+def test_cached_cluster_job_does_not_materialize_the_group(client, monkeypatch):
+    upload(client, companies_csv(200), 'companies.csv')
+    first = client.get('/cluster_group/complete').get_json()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('a cached result should not materialize the group')
+
+    monkeypatch.setattr(CompletenessGroups, 'materialize', fail)
+    response = client.post('/jobs/cluster_group/complete')
+
+    assert response.status_code == 202
+    job = client.get(response.get_json()['status_url']).get_json()
+    assert job['status'] == 'done'
+    assert job['result']['cluster_summary'] == first['cluster_summary']
+
+
+def test_cluster_all_groups_reports_a_broken_worker_pool(client, monkeypatch):
+    upload(client, companies_csv(200) + b',,,1,\n' * 50, 'companies.csv')
+
+    def broken(func, calls):
+        raise BrokenProcessPool('A process in the process pool was terminated abruptly')
+
+    monkeypatch.setattr(app_module.job_runner, 'run_all', broken)
+    response = client.get('/cluster_all_groups')
+
+    assert response.status_code == 500
+    assert 'terminated abruptly' in response.get_json()['error']
+
+
+def test_workbook_upload_opens_the_workbook_once(client, monkeypatch):
+    content = io.BytesIO()
+    with pd.ExcelWriter(content, engine='openpyxl') as writer:
+        for seed, name in enumerate(['2023', '2022']):
+            pd.read_csv(io.BytesIO(companies_csv(50, seed))).to_excel(writer, sheet_name=name, index=False)
+    opened = []
+    excel_file = pd.ExcelFile
+
+    def counting_excel_file(*args, **kwargs):
+        opened.append(args[0])
+        return excel_file(*args, **kwargs)
+
+    monkeypatch.setattr(pd, 'ExcelFile', counting_excel_file)
+    response = upload(client, content.getvalue(), 'filings.xlsx')
+
+    assert response.status_code == 302
+    assert len(opened) == 1
+    with client.session_transaction() as session:
+        flashes = [message for _, message in session.get('_flashes', [])]
+    assert 'Only the first sheet was loaded. The workbook also has: 2022' in flashes
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the parsed upload cache
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_cache import ParsedFileCache, ResultCache, file_digest
+
+
+def make_frame(rows=50):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'company': [f'Company {i}' for i in range(rows)],
+        'revenue': rng.normal(1e6, 1e5, rows),
+        'employees': rng.integers(1, 500, rows).astype(float),
+    })
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = ParsedFileCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    df = make_frame()
+
+    assert cache.get('abc') is None
+    assert cache.put('abc', df)
+    cached = cache.get('abc')
+
+    pd.testing.assert_frame_equal(cached, df)
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['entries'] == 1
+
+
+def test_threads_storing_the_same_file(tmp_path):
+    cache = ParsedFileCache(str(tmp_path), max_bytes=100 * 1024 * 1024)
+    df = make_frame(20000)
+
+    # Each thread writes its own temporary file before the atomic rename
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        stored = list(executor.map(lambda _: cache.put('abc', df), range(32)))
+
+    assert all(stored)
+    pd.testing.assert_frame_equal(cache.get('abc'), df)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_lru_eviction_keeps_recent_entries(tmp_path):
+    df = make_frame(2000)
+    probe = ParsedFileCache(str(tmp_path / 'probe'), max_bytes=1024 * 1024 * 1024)
+    probe.put('probe', df)
+    entry_size = probe.stats()['size_bytes']
+
+    cache = ParsedFileCache(str(tmp_path / 'lru'), max_bytes=int(entry_size * 2.5))
+    cache.put('first', df)
+    cache.put('second', df)
+    # Make 'first' the most recently used entry
+    os.utime(cache._entry_path('first'), (1, 1))
+    os.utime(cache._entry_path('second'), (0, 0))
+    cache.get('first')
+    cache.put('third', df)
+
+    assert cache.get('second') is None
+    assert cache.get('first') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_non_string_columns_are_not_cached(tmp_path):
+    cache = ParsedFileCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    df = pd.DataFrame({2020: [1.0, 2.0], 2021: [3.0, 4.0]})
+
+    assert not cache.put('years', df)
+    assert cache.get('years') is None
+
+
+def test_file_digest_depends_on_content(tmp_path):
+    a = tmp_path / 'a.csv'
+    b = tmp_path / 'b.csv'
+    a.write_text('x,y\n1,2\n')
+    b.write_text('x,y\n1,3\n')
+
+    assert file_digest(str(a)) == file_digest(str(a))
+    assert file_digest(str(a)) != file_digest(str(b))
+
+
+def test_result_cache_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    result = {'cluster_centers': [[1.0, 2.0]], 'labels': np.arange(5)}
+
+    assert cache.get('key') is None
+    assert cache.put('key', result)
+    cached = cache.get('key')
+
+    assert cached['cluster_centers'] == [[1.0, 2.0]]
+    np.testing.assert_array_equal(cached['labels'], np.arange(5))
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
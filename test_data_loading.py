@@ -7,6 +7,10 @@ import pandas as pd
 import numpy as np
 import os
 
+# Imported here rather than inside a test, so a moved function fails loudly
+from completeness import analyze_data_completeness
+from profiling import identify_binary_features
+
 def test_excel_loading():
     """Test loading the existing Excel file"""
     print("🧪 Testing Excel file loading...")
@@ -74,19 +78,20 @@ def test_excel_loading():
         return False
 
 def test_data_analysis_functions():
-    """Test the data analysis functions from app.py"""
+    """Test the data completeness and binary feature functions"""
     print("\n🧪 Testing data analysis functions...")
     
+    if not os.path.exists('Duomenys_AI_tikrinimui.xlsx'):
+        print("  ❌ Excel file 'Duomenys_AI_tikrinimui.xlsx' not found!")
+        return False
+    
     try:
-        # Import functions from app.py
-        from app import analyze_data_completeness, identify_binary_features
-        
         # Load data
         df = pd.read_excel('Duomenys_AI_tikrinimui.xlsx')
         
         # Test completeness analysis
         print("  📊 Testing completeness analysis...")
-        groups, df_with_completeness = analyze_data_completeness(df)
+        groups, completeness_percentage = analyze_data_completeness(df)
         
         print(f"    Found {len(groups)} data groups:")
         for group_name, group_data in groups.items():
@@ -104,7 +109,7 @@ def test_data_analysis_functions():
         
     except Exception as e:
         print(f"  ❌ Error testing data analysis functions: {e}")
-        return False
+        raise
 
 def main():
     """Main test function"""
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared dataset store
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from completeness import analyze_data_completeness
+from dataset_store import DatasetStore
+from profiling import build_dataset_profile
+
+
+def make_frame():
+    return pd.DataFrame({
+        'company': pd.array(['A', 'B', None, 'D'], dtype='string[pyarrow]'),
+        'revenue': [100.0, np.nan, 300.0, 50.0],
+        'employees': np.array([1, 2, 3, 4], dtype='int8'),
+        'sector': pd.Series(['Tech', 'Tech', 'Retail', None], dtype='category'),
+        2021: [1.5, 2.5, np.nan, np.nan],
+    })
+
+
+def store_frame(store, df):
+    groups, completeness_percentage = analyze_data_completeness(df)
+    profile = build_dataset_profile(df, completeness_percentage)
+    return store.create(df, groups, profile), groups
+
+
+def test_round_trip_from_another_process(tmp_path):
+    df = make_frame()
+    writer = DatasetStore(str(tmp_path), max_bytes=1024 ** 3)
+    created, groups = store_frame(writer, df)
+
+    # A second store instance stands in for another worker process
+    reader = DatasetStore(str(tmp_path), max_bytes=1024 ** 3)
+    dataset = reader.get(created.dataset_id)
+
+    pd.testing.assert_frame_equal(dataset.df, df)
+    assert list(dataset.groups) == list(groups)
+    for name in groups:
+        pd.testing.assert_frame_equal(dataset.groups.materialize(name), groups.materialize(name))
+    assert dataset.profile.binary_features == created.profile.binary_features
+    # Numeric columns are read-only views of the memory-mapped file
+    assert not dataset.df['revenue'].to_numpy().flags.writeable
+
+
+def test_mixed_object_columns_fall_back_to_pickle(tmp_path):
+    store = DatasetStore(str(tmp_path), max_bytes=1024 ** 3)
+    df = pd.DataFrame({'code': [1, 'x', None], 'value': [1.0, 2.0, 3.0]})
+    created, _ = store_frame(store, df)
+
+    pd.testing.assert_frame_equal(DatasetStore(str(tmp_path), 1024 ** 3).get(created.dataset_id).df, df)
+
+
+def test_unknown_or_malformed_ids(tmp_path):
+    store = DatasetStore(str(tmp_path), max_bytes=1024 ** 3)
+
+    assert store.get(None) is None
+    assert store.get('0' * 32) is None
+    assert store.get('../../etc') is None
+
+
+def test_eviction_keeps_newest_dataset(tmp_path):
+    store = DatasetStore(str(tmp_path), max_bytes=1)
+    first, _ = store_frame(store, make_frame())
+    second, _ = store_frame(store, make_frame())
+
+    fresh = DatasetStore(str(tmp_path), max_bytes=1)
+    assert fresh.get(first.dataset_id) is None
+    assert fresh.get(second.dataset_id) is not None
+
+
+def test_csv_streamed_into_store_matches_pandas_load(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'company': [f'C{i}' for i in range(500)],
+        'revenue': rng.normal(100, 10, 500).round(3),
+        'employees': rng.integers(1, 100, 500).astype(float),
+        'sector': rng.choice(['Tech', 'Retail'], 500),
+    })
+    df.loc[rng.random(500) < 0.3, 'revenue'] = np.nan
+    df.loc[rng.random(500) < 0.5, 'employees'] = np.nan
+    df.loc[rng.random(500) < 0.2, 'sector'] = None
+    csv_path = tmp_path / 'companies.csv'
+    df.to_csv(csv_path, index=False)
+    expected = pd.read_csv(csv_path)
+    expected_groups, expected_percentage = analyze_data_completeness(expected)
+
+    store = DatasetStore(str(tmp_path / 'store'), max_bytes=1024 ** 3)
+    progress = []
+    # A small block size makes the reader produce several record batches
+    created = store.create_from_csv(str(csv_path), build_dataset_profile, block_size=4096,
+                                    on_progress=lambda rows, done, total: progress.append(rows))
+    dataset = DatasetStore(str(tmp_path / 'store'), 1024 ** 3).get(created.dataset_id)
+
+    assert len(progress) > 1 and progress[-1] == len(expected)
+    # Text columns come back Arrow-backed, so compare values rather than dtypes
+    for col in expected.columns:
+        assert dataset.df[col].isna().tolist() == expected[col].isna().tolist()
+        assert dataset.df[col].dropna().tolist() == expected[col].dropna().tolist()
+    np.testing.assert_allclose(dataset.groups.completeness_percentage, expected_percentage)
+    assert list(dataset.groups) == list(expected_groups)
+    for name in expected_groups:
+        assert dataset.groups[name].positions.tolist() == expected_groups[name].positions.tolist()
+
+
+def test_streamed_numeric_columns_are_zero_copy_views(tmp_path):
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame({'revenue': rng.normal(size=5000), 'employees': rng.integers(1, 100, 5000)})
+    df.loc[::3, 'revenue'] = np.nan
+    df.loc[::7, 'employees'] = np.nan
+    csv_path = tmp_path / 'companies.csv'
+    df.to_csv(csv_path, index=False)
+    store = DatasetStore(str(tmp_path / 'store'), max_bytes=None)
+    created = store.create_from_csv(str(csv_path), build_dataset_profile, block_size=4096)
+
+    allocated = pa.total_allocated_bytes()
+    dataset = DatasetStore(str(tmp_path / 'store'), max_bytes=None).get(created.dataset_id)
+
+    # Missing values were filled in as NaN on write, so nothing is copied into the Arrow pool
+    assert pa.total_allocated_bytes() == allocated
+    for col in df.columns:
+        values = dataset.df[col].to_numpy()
+        assert not values.flags.writeable
+        assert np.isnan(values).sum() == df[col].isna().sum()
+
+
+def test_csv_integer_column_with_later_decimals_is_streamed(tmp_path):
+    csv_path = tmp_path / 'amounts.csv'
+    csv_path.write_text('id,value,score\n' + ''.join(f'{i},{i},\n' for i in range(2000))
+                        + '2000,2000.5,3.5\n2001,,\n')
+    store = DatasetStore(str(tmp_path / 'store'), max_bytes=1024 ** 3)
+
+    # Integer and all-missing columns of the first block are read as float64
+    dataset = store.create_from_csv(str(csv_path), build_dataset_profile, block_size=1024)
+
+    expected = pd.read_csv(csv_path)
+    assert len(dataset.df) == 2002
+    for col in ['value', 'score']:
+        assert dataset.df[col].dtype == np.float64
+        np.testing.assert_array_equal(dataset.df[col].to_numpy(), expected[col].to_numpy())
+
+
+def test_csv_with_changing_column_types_is_rejected(tmp_path):
+    csv_path = tmp_path / 'mixed.csv'
+    csv_path.write_text('id,value\n' + ''.join(f'{i},{i}\n' for i in range(2000)) + '2000,n/a value\n')
+    store = DatasetStore(str(tmp_path / 'store'), max_bytes=1024 ** 3)
+
+    with pytest.raises(pa.ArrowInvalid):
+        store.create_from_csv(str(csv_path), build_dataset_profile, block_size=1024)
+    assert not list((tmp_path / 'store').iterdir())
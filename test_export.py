@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for the labelled Arrow/Parquet dataset export
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from analysis import group_cluster_model, scan_anomalies
+from completeness import analyze_data_completeness
+from dataset_store import Dataset
+from export import DatasetLabels, stream_export
+from profiling import build_dataset_profile
+
+
+def make_dataset(rows=500):
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame(rng.normal(size=(rows, 4)), columns=['revenue', 'assets', 'debt', 'equity'])
+    df.iloc[::4, 1] = np.nan
+    df.iloc[::9, 2:4] = np.nan
+    df['name'] = [f'company {i}' if i % 10 else None for i in range(rows)]
+    groups, completeness_percentage = analyze_data_completeness(df)
+    profile = build_dataset_profile(df, completeness_percentage)
+    return Dataset('test', df, groups, profile)
+
+
+def test_arrow_export_streams_labelled_rows_in_chunks():
+    dataset = make_dataset()
+    labels = DatasetLabels(dataset, n_clusters=3)
+
+    body = b''.join(stream_export(dataset.df, labels, 'arrow', chunk_rows=128))
+    reader = pa.ipc.open_stream(body)
+    batches = list(reader)
+    assert [batch.num_rows for batch in batches] == [128, 128, 128, 116]
+    exported = pa.Table.from_batches(batches).to_pandas()
+
+    df = dataset.df
+    assert exported.index.equals(df.index)
+    assert exported['name'].tolist() == df['name'].tolist()
+    np.testing.assert_allclose(exported['completeness_percentage'],
+                               dataset.groups.completeness_percentage.to_numpy())
+
+    # Cluster labels match clustering each group on its own
+    for name, group in dataset.groups.items():
+        assert (exported['completeness_group'].iloc[group.positions] == name).all()
+        expected = group_cluster_model(dataset.groups.materialize(name), name, 3)
+        if expected is None:
+            assert exported['cluster'].iloc[group.positions].isna().all()
+        else:
+            assert exported['cluster'].iloc[group.positions].tolist() == expected.labels.tolist()
+
+    # Outlier flags match the bulk anomaly scan
+    features = dataset.profile.non_binary_features
+    _, rows, cols = scan_anomalies(df, features)
+    flags = np.zeros((len(df), len(features)), dtype=bool)
+    flags[rows, cols] = True
+    for position, feature in enumerate(features):
+        assert exported[f'outlier_{feature}'].tolist() == flags[:, position].tolist()
+    assert exported['outlier_count'].tolist() == flags.sum(axis=1).tolist()
+
+
+def test_label_columns_do_not_overwrite_data_columns():
+    dataset = make_dataset(200)
+    dataset.df['cluster'] = 'segment A'
+    dataset.df['cluster_1'] = 'segment B'
+    labels = DatasetLabels(dataset, n_clusters=3)
+
+    exported = pa.ipc.open_stream(b''.join(stream_export(dataset.df, labels, 'arrow'))).read_pandas()
+
+    assert (exported['cluster'] == 'segment A').all()
+    assert (exported['cluster_1'] == 'segment B').all()
+    assert exported['cluster_2'].notna().any()
+    assert 'outlier_count' in exported.columns
+
+
+def test_parquet_export_writes_one_row_group_per_chunk():
+    dataset = make_dataset()
+    labels = DatasetLabels(dataset, n_clusters=2)
+
+    body = b''.join(stream_export(dataset.df, labels, 'parquet', chunk_rows=200))
+    parquet_file = pq.ParquetFile(io.BytesIO(body))
+    assert parquet_file.metadata.num_row_groups == 3
+    assert parquet_file.read().num_rows == len(dataset.df)
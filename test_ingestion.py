@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Tests for chunked CSV ingestion and incremental completeness grouping
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+import pytest
+
+from completeness import analyze_data_completeness, append_completeness_groups
+from data_cache import file_digest
+from instrumentation import metrics
+from ingestion import (SOURCE_SHEET_COLUMN, UploadStream, append_rows, load_csv_chunked, optimize_dtypes,
+                       read_excel_sheets, sniff_file_format)
+from profiling import build_dataset_profile
+
+
+def write_companies_csv(path, rows=1000, seed=3):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'company': [f'Company {i}' for i in range(rows)],
+        'revenue': rng.normal(1e6, 2e5, rows),
+        'employees': rng.integers(1, 500, rows).astype(float),
+        'profit': rng.normal(5e4, 1e4, rows),
+        'sector': rng.choice(['Retail', 'Tech', 'Energy'], rows),
+    })
+    for col in ['revenue', 'employees', 'profit', 'sector']:
+        df.loc[rng.random(rows) < 0.25, col] = None
+    df.to_csv(path, index=False)
+    return df
+
+
+def test_chunked_groups_match_full_analysis(tmp_path):
+    path = tmp_path / 'companies.csv'
+    write_companies_csv(path)
+    full = pd.read_csv(path)
+    expected_groups, expected_percentage = analyze_data_completeness(full)
+
+    progress = []
+    df, groups, completeness_percentage = load_csv_chunked(
+        str(path), chunksize=128, on_progress=lambda *args: progress.append(args))
+
+    pd.testing.assert_frame_equal(df, full)
+    assert list(groups) == list(expected_groups)
+    for name in expected_groups:
+        pd.testing.assert_frame_equal(groups.materialize(name), expected_groups.materialize(name))
+    pd.testing.assert_series_equal(completeness_percentage, expected_percentage)
+
+    assert len(progress) == 8
+    assert progress[-1][0] == 1000
+    assert progress[-1][1] == progress[-1][2]
+
+
+def test_group_views_match_masked_subframes():
+    df = pd.DataFrame({
+        'company': ['A', 'B', 'C', 'D', 'E'],
+        'revenue': [1.0, np.nan, 3.0, np.nan, 5.0],
+        'employees': [10.0, 20.0, np.nan, np.nan, 50.0],
+        'sector': ['Tech', 'Tech', None, None, 'Retail'],
+    }, index=[10, 11, 12, 13, 14])
+    groups, completeness_percentage = analyze_data_completeness(df)
+
+    assert list(groups) == ['complete', 'medium_completeness', 'low_completeness']
+    assert len(groups['complete']) == 2
+    assert groups['low_completeness'].index.tolist() == [13]
+    assert list(groups['complete'].columns[-2:]) == ['completeness_percentage', 'missing_features']
+
+    # Same rows and columns as the masked copies the grouping used to store
+    df_with_completeness = df.copy()
+    df_with_completeness['completeness_percentage'] = completeness_percentage
+    df_with_completeness['missing_features'] = len(df.columns) - df.notna().sum(axis=1)
+    medium = df_with_completeness[
+        (completeness_percentage >= 50) & (completeness_percentage < 80)]
+    pd.testing.assert_frame_equal(groups.materialize('medium_completeness'), medium)
+
+
+def test_appended_groups_match_full_analysis(tmp_path):
+    path = tmp_path / 'companies.csv'
+    full = write_companies_csv(path)
+    base, delta = full.iloc[:700], full.iloc[700:].reset_index(drop=True)
+    base_groups, _ = analyze_data_completeness(base)
+
+    # The delta file may omit columns; they are left empty
+    df = append_rows(base, delta.drop(columns=['sector']))
+    expected = full.assign(sector=full['sector'].where(full.index < 700))
+    pd.testing.assert_frame_equal(df, expected)
+
+    groups, completeness_percentage = append_completeness_groups(base_groups, df)
+    expected_groups, expected_percentage = analyze_data_completeness(expected)
+    assert list(groups) == list(expected_groups)
+    for name in expected_groups:
+        pd.testing.assert_frame_equal(groups.materialize(name), expected_groups.materialize(name))
+    pd.testing.assert_series_equal(completeness_percentage, expected_percentage)
+
+    with pytest.raises(ValueError):
+        append_rows(base, delta.assign(rating=1))
+
+
+def test_optimize_dtypes_keeps_values_and_feature_typing(tmp_path):
+    path = tmp_path / 'companies.csv'
+    write_companies_csv(path, rows=2000)
+    df = pd.read_csv(path)
+    df['legal_form'] = np.where(df.index % 2, 'UAB', 'AB')
+    df['profit'] = df['profit'] * np.pi
+
+    optimized, memory_report = optimize_dtypes(df)
+
+    assert optimized['employees'].dtype == 'float32'
+    assert optimized['profit'].dtype == 'float64'
+    assert optimized['sector'].dtype == 'category'
+    assert str(optimized['company'].dtype) == 'string'
+    for col in df.columns:
+        assert optimized[col].isna().equals(df[col].isna())
+    np.testing.assert_array_equal(optimized['employees'].to_numpy(dtype=float), df['employees'].to_numpy())
+    assert sum(c['bytes_after'] for c in memory_report) < sum(c['bytes_before'] for c in memory_report)
+
+    before = build_dataset_profile(df)
+    after = build_dataset_profile(optimized)
+    assert after.numeric_features == before.numeric_features
+    assert after.categorical_features == before.categorical_features
+    assert after.binary_features == before.binary_features == ['legal_form']
+
+
+def sheet_parse_count():
+    match = re.search(r'^company_risk_stage_duration_seconds_count\{stage="sheet_parse"\} (\d+)$',
+                      metrics.render(), re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+def test_workbook_sheets_are_read_in_parallel_and_labelled(tmp_path):
+    pytest.importorskip('openpyxl')
+    path = tmp_path / 'filings.csv'
+    sheets = {str(year): pd.DataFrame({'company': ['A', 'B'], 'revenue': [year, year + 0.5]})
+              for year in (2021, 2022, 2023)}
+    # Saved under a .csv name: the format is taken from the file contents
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+
+    assert sniff_file_format(path) == 'xlsx'
+    df, available = read_excel_sheets(path, file_format='xlsx')
+    pd.testing.assert_frame_equal(df, sheets['2021'])
+    assert available == ['2021', '2022', '2023']
+    parsed = sheet_parse_count()
+    df, _ = read_excel_sheets(path, ['2023', '2021'], max_workers=2)
+    # Sheets parsed in worker processes are timed in this process's metrics
+    assert sheet_parse_count() == parsed + 2
+    assert df[SOURCE_SHEET_COLUMN].tolist() == ['2023', '2023', '2021', '2021']
+    assert df['revenue'].tolist() == [2023, 2023.5, 2021, 2021.5]
+    # Several sheets in one process are parsed from the same handle
+    df, _ = read_excel_sheets(path, '*', max_workers=1)
+    assert len(df) == 6
+    with pytest.raises(ValueError):
+        read_excel_sheets(path, ['2020'])
+
+
+def test_upload_stream_loads_like_the_saved_file(tmp_path):
+    path = tmp_path / 'companies.csv'
+    write_companies_csv(path)
+    expected_df, expected_groups, _ = load_csv_chunked(str(path), chunksize=128)
+
+    progress = []
+    with open(path, 'rb') as body:
+        # No length given, as for a chunked request body
+        stream = UploadStream(body)
+        df, groups, _ = load_csv_chunked(stream, chunksize=128,
+                                         on_progress=lambda rows, done, total: progress.append((rows, total)))
+        digest = stream.hexdigest()
+
+    pd.testing.assert_frame_equal(df, expected_df)
+    assert list(groups) == list(expected_groups)
+    assert progress[-1] == (len(expected_df), None)
+    assert digest == file_digest(path)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for stage timing and the Prometheus metrics
+"""
+
+import tracemalloc
+
+import numpy as np
+
+from instrumentation import Histogram, begin_request, end_request, metrics, server_timing_header, stage
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('test_seconds', 'Test.', ['stage'], (0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, stage='parse')
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="parse",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="parse",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{stage="parse",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="parse"} 4' in lines
+    assert lines[1] == '# TYPE test_seconds histogram'
+
+
+def test_request_stages_and_nested_memory_peaks():
+    tracemalloc.start()
+    try:
+        token = begin_request()
+        with stage('outer'):
+            block = np.ones(4 * 1024 * 1024, dtype=np.uint8)
+            del block
+            with stage('inner'):
+                small = np.ones(64 * 1024, dtype=np.uint8)
+                del small
+        stages = end_request(token)
+    finally:
+        tracemalloc.stop()
+
+    assert [name for name, _, _ in stages] == ['inner', 'outer']
+    peaks = {name: peak for name, _, peak in stages}
+    # The inner stage resets the traced peak, but the outer one keeps its own
+    assert peaks['outer'] >= 4 * 1024 * 1024 > peaks['inner'] >= 64 * 1024
+    assert server_timing_header(stages).startswith('inner;dur=')
+    assert 'company_risk_stage_duration_seconds_count{stage="outer"}' in metrics.render()
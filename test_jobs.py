@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for the background job runner
+"""
+
+import os
+import time
+
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+from instrumentation import metrics, stage
+from jobs import JobCancelled, JobRunner
+
+
+def add_task(a, b, progress=None):
+    if progress is not None:
+        progress(0.5, 'Adding')
+    return {'sum': a + b}
+
+
+def failing_task(progress=None):
+    raise ValueError('bad input')
+
+
+def short_task(steps, progress=None):
+    for step in range(steps):
+        progress(step / steps, 'Working')
+        time.sleep(0.001)
+    return 'finished'
+
+
+def staged_task(name, progress=None):
+    with stage(name):
+        return name
+
+
+def dying_task(progress=None):
+    os._exit(1)
+
+
+def slow_task(progress=None):
+    for step in range(200):
+        progress(step / 200, 'Working')
+        time.sleep(0.05)
+    return 'finished'
+
+
+def wait_for(runner, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = runner.status(job_id)
+        if state['status'] in ('done', 'failed', 'cancelled'):
+            return state
+        time.sleep(0.05)
+    raise AssertionError(f'Job {job_id} did not finish')
+
+
+@pytest.fixture
+def runner(tmp_path):
+    runner = JobRunner(str(tmp_path), max_workers=1)
+    yield runner
+    runner.shutdown()
+
+
+def test_job_result_and_failure(runner):
+    job_id = runner.submit('add', add_task, 2, b=3)
+    state = wait_for(runner, job_id)
+    assert state['status'] == 'done'
+    assert state['kind'] == 'add'
+    assert state['progress'] == 1.0
+    assert state['result'] == {'sum': 5}
+
+    # Another runner over the same directory (another web worker) sees the job too
+    assert JobRunner(runner.state_dir).status(job_id)['result'] == {'sum': 5}
+
+    state = wait_for(runner, runner.submit('fail', failing_task))
+    assert state['status'] == 'failed'
+    assert state['error'] == 'bad input'
+
+
+def test_cancel_running_job(runner):
+    job_id = runner.submit('slow', slow_task)
+    while runner.status(job_id)['status'] != 'running':
+        time.sleep(0.05)
+
+    runner.cancel(job_id)
+    state = wait_for(runner, job_id)
+    assert state['status'] == 'cancelled'
+    assert 'result' not in state
+
+
+def test_cancel_never_undoes_a_finished_state(runner):
+    # Cancelling right as the worker finishes must not leave the job 'running'
+    for attempt in range(50):
+        job_id = runner.submit('short', short_task, attempt % 3)
+        while runner.status(job_id)['status'] == 'queued':
+            time.sleep(0.001)
+
+        runner.cancel(job_id)
+        state = wait_for(runner, job_id, timeout=10)
+        assert state['status'] in ('cancelled', 'done')
+        assert runner.status(job_id)['status'] == state['status']
+
+
+def test_run_all_returns_results_in_order(runner):
+    assert runner.run_all(add_task, [((1, 2), {}), ((3,), {'b': 4})]) == [{'sum': 3}, {'sum': 7}]
+    # Nothing is recorded on disk for calls that are waited for
+    assert not os.listdir(runner.state_dir)
+    with pytest.raises(ValueError, match='bad input'):
+        runner.run_all(failing_task, [((), {})])
+
+
+def test_run_all_replaces_a_broken_pool(runner):
+    with pytest.raises(BrokenProcessPool):
+        runner.run_all(dying_task, [((), {})])
+    assert runner.run_all(add_task, [((1, 2), {})]) == [{'sum': 3}]
+
+
+def test_worker_stages_reach_this_process_metrics(runner):
+    assert runner.run_all(staged_task, [(('fan_out_stage',), {})]) == ['fan_out_stage']
+    assert 'company_risk_stage_duration_seconds_count{stage="fan_out_stage"} 1' in metrics.render()
+
+    wait_for(runner, runner.submit('staged', staged_task, 'job_stage'))
+    deadline = time.time() + 30
+    # The stages are recorded by the job's done callback, just after its state is written
+    while 'stage="job_stage"' not in metrics.render() and time.time() < deadline:
+        time.sleep(0.05)
+    assert 'company_risk_stage_duration_seconds_count{stage="job_stage"} 1' in metrics.render()
+
+
+def test_unknown_job_ids(runner):
+    assert runner.status('0' * 32) is None
+    assert runner.status('../secret') is None
+    assert runner.cancel('0' * 32) is None
+    assert issubclass(JobCancelled, Exception)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the versioned model and profile store
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model_store
+from analysis import cluster_group_result, cluster_model_key
+from model_store import ClusterModels, ModelStore
+
+
+def test_versions_survive_a_restart(tmp_path):
+    store = ModelStore(str(tmp_path))
+    assert store.load('abc', 'profile') is None
+
+    assert store.save('abc', 'profile', {'rows': 1}, {'settings': 'a'}) == 1
+    assert store.save('abc', 'profile', {'rows': 2}) == 2
+
+    # A new instance, as after a restart, loads the newest version on first use
+    reloaded = ModelStore(str(tmp_path))
+    assert reloaded.load('abc', 'profile') == {'rows': 2}
+    assert reloaded.load('abc', 'profile', version=1) == {'rows': 1}
+    versions = reloaded.versions('abc', 'profile')
+    assert [v['version'] for v in versions] == [1, 2]
+    assert versions[0]['settings'] == 'a'
+    assert versions[0]['dataset_key'] == 'abc'
+    assert reloaded.names('abc') == ['profile']
+
+    # A version saved by another process is picked up
+    store.save('abc', 'profile', {'rows': 3})
+    assert reloaded.load('abc', 'profile') == {'rows': 3}
+
+    with pytest.raises(ValueError):
+        store.save('abc', '../profile', {})
+
+
+def test_incompatible_versions_are_skipped(tmp_path, monkeypatch):
+    store = ModelStore(str(tmp_path))
+    store.save('abc', 'model', 'old')
+    store.save('abc', 'model', 'new')
+
+    path = os.path.join(str(tmp_path), 'abc', 'model', 'v2.json')
+    with open(path) as f:
+        metadata = json.load(f)
+    metadata['sklearn_version'] = '0.0'
+    with open(path, 'w') as f:
+        json.dump(metadata, f)
+
+    assert ModelStore(str(tmp_path)).load('abc', 'model') == 'old'
+
+
+def test_old_versions_and_datasets_are_removed(tmp_path):
+    store = ModelStore(str(tmp_path), versions_kept=2)
+    for value in range(4):
+        store.save('abc', 'model', value)
+    assert [v['version'] for v in store.versions('abc', 'model')] == [3, 4]
+
+    store.max_bytes = 1
+    store.save('def', 'model', np.zeros(1000))
+    assert store.names('abc') == []
+    assert store.load('def', 'model') is not None
+
+
+def test_cluster_models_are_stored_with_metadata(tmp_path):
+    rng = np.random.default_rng(0)
+    group = pd.DataFrame({'revenue': rng.normal(size=50), 'profit': rng.normal(size=50)})
+    models = ClusterModels(ModelStore(str(tmp_path)), 'abc')
+
+    result = cluster_group_result(group, 'complete', 2, models=models)
+
+    key = cluster_model_key('complete', 2, 'kmeans')
+    reloaded = ClusterModels(ModelStore(str(tmp_path)), 'abc')
+    assert [k for k, _ in reloaded.items()] == [key]
+    labels = reloaded.get(key).labels
+    for cluster in result['cluster_summary']:
+        assert np.flatnonzero(labels == cluster['cluster_id']).tolist() == cluster['companies']
+    metadata = ModelStore(str(tmp_path)).versions('abc', model_store.CLUSTER_MODEL_PREFIX + key)[-1]
+    assert metadata['features'] == ['revenue', 'profit']
+    assert metadata['fitted_rows'] == 50
+    assert metadata['format_version'] == model_store.MODEL_FORMAT_VERSION
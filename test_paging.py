@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for paginated, projected and sorted row responses
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomaly_index import AnomalyIndex
+from paging import PageRequest, page_of_rows
+
+
+def make_frame():
+    return pd.DataFrame({
+        'name': ['A', 'B', 'C', 'D', 'E'],
+        'revenue': [30.0, np.nan, 10.0, 50.0, 10.0],
+        2021: [1, 2, 3, 4, 5],
+    }, index=[10, 11, 12, 13, 14])
+
+
+def test_pages_cover_all_rows():
+    df = make_frame()
+
+    first = page_of_rows(df, PageRequest(offset=0, limit=2, columns=['name']))
+    assert first['rows'] == [{'name': 'A'}, {'name': 'B'}]
+    assert first['index'] == [10, 11]
+    assert first['next_offset'] == 2
+    last = page_of_rows(df, PageRequest(offset=4, limit=2, columns=['name', '2021']))
+    assert last['rows'] == [{'name': 'E', 2021: 5}]
+    assert last['next_offset'] is None
+    assert last['total'] == 5
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+def test_sort_puts_missing_values_last(use_index):
+    df = make_frame()
+    index = AnomalyIndex(df) if use_index else None
+
+    page = page_of_rows(df, PageRequest(limit=10, sort_by='revenue'), index=index)
+    assert page['index'] == [12, 14, 10, 13, 11]
+    page = page_of_rows(df, PageRequest(limit=10, sort_by='revenue', descending=True), index=index)
+    # Tied rows 12 and 14 stay in row order
+    assert page['index'] == [13, 10, 12, 14, 11]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_index_order_matches_a_stable_sort(descending):
+    rng = np.random.default_rng(5)
+    values = rng.integers(0, 20, 1000).astype(float)
+    values[rng.random(1000) < 0.1] = np.nan
+    df = pd.DataFrame({'revenue': values})
+    page = PageRequest(offset=100, limit=300, sort_by='revenue', descending=descending)
+
+    assert (page_of_rows(df, page, index=AnomalyIndex(df))['index']
+            == page_of_rows(df, page)['index'])
+
+
+def test_sort_within_positions_and_unknown_columns():
+    df = make_frame()
+
+    page = page_of_rows(df, PageRequest(limit=10, sort_by='name', descending=True), positions=np.array([0, 2, 3]))
+    assert page['index'] == [13, 12, 10]
+    with pytest.raises(ValueError):
+        page_of_rows(df, PageRequest(columns=['missing']))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for dataset profiling
+"""
+
+import numpy as np
+import pandas as pd
+
+from profiling import build_dataset_profile, identify_binary_features
+
+
+def make_frame():
+    return pd.DataFrame({
+        'company': ['A', 'B', 'C', 'D'],
+        'revenue': [100.0, 250.0, np.nan, 75.0],
+        'employees': [10.0, 20.0, 30.0, 40.0],
+        'has_debt': [1.0, 0.0, 1.0, np.nan],
+        'region': ['North', 'South', 'North', None],
+    })
+
+
+def test_profile_feature_typing():
+    df = make_frame()
+    profile = build_dataset_profile(df)
+
+    assert profile.total_companies == 4
+    assert profile.total_features == 5
+    assert profile.numeric_features == ['revenue', 'employees', 'has_debt']
+    assert profile.categorical_features == ['company', 'region']
+    assert profile.binary_features == identify_binary_features(df) == ['has_debt', 'region']
+    assert profile.non_binary_features == ['revenue', 'employees']
+
+
+def test_profile_column_statistics():
+    profile = build_dataset_profile(make_frame())
+
+    revenue = profile.column('revenue')
+    assert revenue['non_null_count'] == 3
+    assert revenue['null_count'] == 1
+    assert revenue['unique_values'] == 3
+    assert revenue['min'] == 75.0
+    assert revenue['max'] == 250.0
+    assert 'min' not in profile.column('company')
+    assert profile.overall_completeness == 85.0
+
+
+def test_profile_completeness_histogram():
+    profile = build_dataset_profile(make_frame())
+    histogram = profile.completeness_histogram
+
+    assert sum(histogram['counts']) == 4
+    # Rows A and B are complete, row C is 80% and row D is 60% complete
+    assert histogram['counts'][9] == 2
+    assert histogram['counts'][8] == 1
+    assert histogram['counts'][6] == 1
+
+
+def test_binary_detection_matches_per_column_unique():
+    df = pd.DataFrame({
+        'all_missing': [np.nan] * 6,
+        'constant': [5.0] * 6,
+        'two_ints': [0, 1, 1, 0, 0, 1],
+        'three_ints': [0, 1, 2, 0, 0, 1],
+        'two_with_gaps': [np.nan, 3.5, 3.5, np.nan, 7.0, 3.5],
+        'late_third': [1.0, 1.0, 2.0, 2.0, 1.0, 9.0],
+        'text': ['a', 'b', 'c', 'a', None, 'b'],
+        'yes_no': pd.array(['yes', 'no', None, 'yes', 'no', 'no'], dtype='string'),
+    })
+    expected = [col for col in df.columns if len(df[col].dropna().unique()) <= 2]
+
+    assert identify_binary_features(df) == expected
+    profile = build_dataset_profile(df)
+    assert profile.column('late_third')['unique_values'] == 3
+    assert np.isnan(profile.column('all_missing')['min'])
+
+
+def test_profile_empty_frame():
+    df = pd.DataFrame({'revenue': pd.Series([], dtype='float64'), 'name': pd.Series([], dtype=object)})
+    profile = build_dataset_profile(df)
+
+    assert profile.column('revenue')['min'] is None
+    assert profile.column('name')['unique_values'] == 0
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for JSON, Arrow and compressed API responses
+"""
+
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from flask import Flask
+
+from paging import PageRequest, page_of_rows
+from responses import DataJSONProvider, arrow_response, compress_response, frame_columns
+
+
+def make_app():
+    app = Flask(__name__)
+    app.json = DataJSONProvider(app)
+    return app
+
+
+def make_frame():
+    return pd.DataFrame({
+        'name': pd.Categorical(['A', None, 'C']),
+        'revenue': [1.5, np.nan, np.inf],
+        'employees': np.array([10, 20, 30], dtype=np.int16),
+    }, index=[5, 6, 7])
+
+
+def test_json_handles_numpy_and_missing_values():
+    app = make_app()
+    payload = {
+        'count': np.int64(3),
+        'mean': np.float32(0.5),
+        'missing': np.float64('nan'),
+        'na': pd.NA,
+        'values': np.array([1.0, np.nan]),
+        1: 'numeric key',
+    }
+    with app.app_context():
+        body = json.loads(app.json.dumps(payload))
+    assert body == {'count': 3, 'mean': 0.5, 'missing': None, 'na': None, 'values': [1.0, None],
+                    '1': 'numeric key'}
+
+
+def test_columns_layout_matches_records():
+    df = make_frame()
+    app = make_app()
+
+    layout = frame_columns(df)
+    assert layout['columns'] == ['name', 'revenue', 'employees']
+    with app.app_context():
+        body = json.loads(app.json.dumps(layout))
+    assert body['values'] == [['A', None, 'C'], [1.5, None, None], [10, 20, 30]]
+
+    page = page_of_rows(df, PageRequest(offset=1, limit=2, layout='columns'))
+    assert page['index'] == [6, 7]
+    assert page['rows']['columns'] == ['name', 'revenue', 'employees']
+
+
+def test_arrow_response_round_trips_rows_and_metadata():
+    app = make_app()
+    df = make_frame()
+    response = arrow_response(app.response_class, df, {'total': 3})
+
+    table = pa.ipc.open_stream(response.get_data()).read_all()
+    assert json.loads(table.schema.metadata[b'response']) == {'total': 3}
+    restored = table.to_pandas()
+    assert restored.index.tolist() == [5, 6, 7]
+    assert restored['employees'].tolist() == [10, 20, 30]
+
+
+def test_large_responses_are_gzipped_when_accepted():
+    app = make_app()
+    with app.app_context():
+        body = {'rows': list(range(5000))}
+        plain = compress_response(app.json.response(body), None, 1024)
+        assert 'Content-Encoding' not in plain.headers
+
+        compressed = compress_response(app.json.response(body), 'gzip, deflate', 1024)
+        assert compressed.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in compressed.headers['Vary']
+        assert json.loads(gzip.decompress(compressed.get_data())) == body
+
+        small = compress_response(app.json.response({'ok': True}), 'gzip', 1024)
+        assert 'Content-Encoding' not in small.headers
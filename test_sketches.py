@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the streaming sketches and the approximate dataset profile
+"""
+
+import numpy as np
+import pandas as pd
+
+from profiling import FrameSketch, build_dataset_profile
+from sketches import HyperLogLog, QuantileSketch, Reservoir, hash_values
+
+
+def test_hyperloglog_estimate_is_within_error_bound_and_merges():
+    values = np.arange(200_000) % 150_000
+    whole = HyperLogLog()
+    whole.update(hash_values(values))
+    first, second = HyperLogLog(), HyperLogLog()
+    first.update(hash_values(values[:120_000]))
+    second.update(hash_values(values[120_000:]))
+    first.merge(second)
+
+    assert np.array_equal(first.registers, whole.registers)
+    assert abs(whole.estimate() / 150_000 - 1) < 4 * whole.relative_error
+
+
+def test_quantile_sketch_rank_error_is_within_bound_after_merging():
+    rng = np.random.default_rng(3)
+    values = rng.lognormal(10, 2, 300_000)
+    sketches = []
+    for seed, chunk in enumerate(np.array_split(values, 7)):
+        sketch = QuantileSketch(seed=seed)
+        for part in np.array_split(chunk, 5):
+            sketch.update(part)
+        sketches.append(sketch)
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+
+    qs = [0.01, 0.25, 0.5, 0.75, 0.99]
+    ranks = np.searchsorted(np.sort(values), merged.quantiles(qs)) / len(values)
+    assert merged.count == len(values)
+    assert np.all(np.abs(ranks - qs) <= merged.rank_error)
+    assert sum(len(level) for level in merged.levels) < 4 * merged.k
+
+
+def test_reservoir_keeps_a_sample_of_both_streams():
+    first, second = Reservoir(50, seed=1), Reservoir(50, seed=2)
+    first.update(np.zeros(1000))
+    second.update(np.ones(1000))
+    first.merge(second)
+
+    sample = first.sample()
+    assert len(sample) == 50
+    assert 0 < sum(sample) < 50
+
+
+def test_approximate_profile_matches_exact_counts_and_binary_features():
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame({
+        'name': [f'Company {i}' for i in range(5000)],
+        'flag': rng.integers(0, 2, 5000).astype(float),
+        'revenue': rng.normal(100, 10, 5000),
+    })
+    df.loc[::7, 'revenue'] = np.nan
+    exact = build_dataset_profile(df, quantiles=True)
+    approximate = build_dataset_profile(df, mode='approximate', sketch=FrameSketch.from_frame(df, chunk_rows=1000))
+
+    assert approximate.mode == 'approximate'
+    assert exact.error_bounds is None and approximate.error_bounds['sample_size'] > 0
+    assert approximate.binary_features == exact.binary_features
+    exact_info = {info['name']: info for info in exact.columns_info}
+    approximate_info = {info['name']: info for info in approximate.columns_info}
+    assert approximate_info['revenue']['null_count'] == exact_info['revenue']['null_count']
+    assert abs(approximate_info['revenue']['median'] - exact_info['revenue']['median']) < 1
+    assert abs(approximate_info['name']['unique_values'] / 5000 - 1) < 0.05
@@ -59,11 +59,21 @@ TRANSLATIONS = {
         'cluster_this_group': 'Cluster This Group',
         'data_preview': 'Data Preview',
         'load_data_preview': 'Load Data Preview',
+        'approximate_profile_description': 'Distinct counts and quartiles are approximate: distinct counts within ±%.1f%%, quartiles within ±%.1f%% of rank, examples from a %d-value sample per column.',
+        'memory_optimization': 'Memory Optimization',
+        'memory_optimization_description': 'Column types were compacted at load time. Memory use per column before and after:',
+        'column': 'Column',
+        'type_before': 'Type Before',
+        'type_after': 'Type After',
+        'memory_before': 'Memory Before',
+        'memory_after': 'Memory After',
+        'total': 'Total',
         'clustering_analysis': 'Company Clustering Analysis',
         'clustering_description': 'This page allows you to cluster companies within each data completeness group based on their feature values. Only non-binary numeric features are used for clustering to ensure meaningful results.',
         'available_groups': 'Available Groups:',
         'number_of_clusters': 'Number of Clusters:',
         'perform_clustering': 'Perform Clustering',
+        'cluster_all_groups': 'Cluster All Groups',
         'clustering_results': 'Clustering Results',
         'cluster_visualizations': 'Cluster Visualizations',
         'anomaly_detection_title': 'Anomaly Detection',
@@ -88,6 +98,19 @@ TRANSLATIONS = {
         'choose_feature_description': 'Choose a feature from the dropdown and click "Detect Anomalies" to see the results.',
         'detailed_anomaly_results': 'Detailed anomaly results will appear here after analysis.',
         'statistical_summary_description': 'Statistical summary will be displayed here after anomaly detection.',
+        'scan_all_features': 'Scan All Features',
+        'scan_all_description': 'Check every feature at once and rank companies by their number of outlying features.',
+        'risk_screen': 'Risk Screen',
+        'company': 'Company',
+        'outlier_features': 'Outlying Features',
+        'flagged_companies': 'Flagged companies',
+        'append_to_current': 'Append to the current dataset instead of replacing it',
+        'append_description': 'New companies are assigned to the existing clusters; use Refit on the Clustering page to fit again.',
+        'excel_sheets': 'Excel sheets',
+        'excel_sheets_description': 'Comma-separated sheet names to load together, or * for every sheet. Leave empty for the first sheet.',
+        'refit_clusters': 'Refit',
+        'assigned_companies': 'Assigned since fit',
+        'refit_recommended': 'New companies fit these clusters poorly; refitting is recommended.',
         'system_features': 'System Features',
         'multi_format_support': 'Multi-format data support (Excel, CSV)',
         'automatic_analysis': 'Automatic data completeness analysis',
@@ -169,11 +192,21 @@ TRANSLATIONS = {
         'cluster_this_group': 'Grupinti šią grupę',
         'data_preview': 'Duomenų peržiūra',
         'load_data_preview': 'Įkelti duomenų peržiūrą',
+        'approximate_profile_description': 'Skirtingų reikšmių skaičiai ir kvartiliai yra apytiksliai: skirtingų reikšmių skaičiai ±%.1f%% tikslumu, kvartiliai ±%.1f%% rango tikslumu, pavyzdžiai iš %d reikšmių imties kiekvienam stulpeliui.',
+        'memory_optimization': 'Atminties optimizavimas',
+        'memory_optimization_description': 'Įkeliant duomenis stulpelių tipai buvo suglaudinti. Kiekvieno stulpelio atminties naudojimas prieš ir po:',
+        'column': 'Stulpelis',
+        'type_before': 'Tipas prieš',
+        'type_after': 'Tipas po',
+        'memory_before': 'Atmintis prieš',
+        'memory_after': 'Atmintis po',
+        'total': 'Iš viso',
         'clustering_analysis': 'Įmonių grupavimo analizė',
         'clustering_description': 'Šis puslapis leidžia jums grupuoti įmones kiekvienoje duomenų išsamumo grupėje pagal jų ypatybių reikšmes. Tik ne dvejetainės skaitinės ypatybės naudojamos grupavimui, kad būtų užtikrinti prasmingi rezultatai.',
         'available_groups': 'Prieinamos grupės:',
         'number_of_clusters': 'Grupų skaičius:',
         'perform_clustering': 'Atlikti grupavimą',
+        'cluster_all_groups': 'Grupuoti visas grupes',
         'clustering_results': 'Grupavimo rezultatai',
         'cluster_visualizations': 'Grupavimo vizualizacijos',
         'anomaly_detection_title': 'Anomalių aptikimas',
@@ -198,6 +231,19 @@ TRANSLATIONS = {
         'choose_feature_description': 'Pasirinkite ypatybę iš sąrašo ir spustelėkite "Aptikti anomalijas", kad pamatytumėte rezultatus.',
         'detailed_anomaly_results': 'Išsamūs anomalių rezultatai čia pasirodys po analizės.',
         'statistical_summary_description': 'Statistinė santrauka čia bus rodoma po anomalių aptikimo.',
+        'scan_all_features': 'Tikrinti visas ypatybes',
+        'scan_all_description': 'Patikrinkite visas ypatybes iš karto ir surikiuokite įmones pagal išskirčių skaičių.',
+        'risk_screen': 'Rizikos patikra',
+        'company': 'Įmonė',
+        'outlier_features': 'Išskirčių ypatybės',
+        'flagged_companies': 'Pažymėtos įmonės',
+        'append_to_current': 'Pridėti prie dabartinio duomenų rinkinio, o ne jį pakeisti',
+        'append_description': 'Naujos įmonės priskiriamos esamiems klasteriams; norėdami apskaičiuoti iš naujo, klasterizavimo puslapyje spustelėkite „Perskaičiuoti“.',
+        'excel_sheets': 'Excel lapai',
+        'excel_sheets_description': 'Kableliais atskirti lapų pavadinimai, kuriuos įkelti kartu, arba * visiems lapams. Palikite tuščią pirmam lapui.',
+        'refit_clusters': 'Perskaičiuoti',
+        'assigned_companies': 'Priskirta po apskaičiavimo',
+        'refit_recommended': 'Naujos įmonės prastai atitinka šiuos klasterius; rekomenduojama perskaičiuoti.',
         'system_features': 'Sistemos funkcijos',
         'multi_format_support': 'Kelių formatų duomenų palaikymas (Excel, CSV)',
         'automatic_analysis': 'Automatinė duomenų išsamumo analizė',